@@ -0,0 +1,255 @@
+# angel_client.py
+"""
+Shared Angel One SmartAPI REST client.
+
+Keeps a small pool of persistent (keep-alive) HTTPS connections to the API
+host so repeated calls skip the TCP + TLS handshake, and builds the common
+header block once per session instead of once per request.
+
+Usage:
+    from angel_client import get_client
+    client = get_client(jwt_token, api_key)
+    print(client.get_orderbook())
+"""
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import http.client
+from contextlib import nullcontext
+from dotenv import load_dotenv
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from metrics import REGISTRY
+from ratelimit import get_scheduler
+
+load_dotenv()  # load from .env
+API_HOST = "apiconnect.angelone.in"
+
+# Headers that are identical for every secure endpoint
+BASE_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+    "X-UserType": "USER",
+    "X-SourceID": "WEB",
+    "X-ClientLocalIP": "CLIENT_LOCAL_IP",
+    "X-ClientPublicIP": "CLIENT_PUBLIC_IP",
+    "X-MACAddress": "MAC_ADDRESS",
+}
+
+# name -> (method, path, idempotent)
+ENDPOINTS = {
+    "placeOrder":    ("POST", "/rest/secure/angelbroking/order/v1/placeOrder", False),
+    "modifyOrder":   ("POST", "/rest/secure/angelbroking/order/v1/modifyOrder", False),
+    "cancelOrder":   ("POST", "/rest/secure/angelbroking/order/v1/cancelOrder", False),
+    "getOrderBook":  ("GET",  "/rest/secure/angelbroking/order/v1/getOrderBook", True),
+    "getTradeBook":  ("GET",  "/rest/secure/angelbroking/order/v1/getTradeBook", True),
+    "getPosition":   ("GET",  "/rest/secure/angelbroking/order/v1/getPosition", True),
+    "getAllHolding": ("GET",  "/rest/secure/angelbroking/portfolio/v1/getAllHolding", True),
+    "getLtpData":    ("POST", "/rest/secure/angelbroking/order/v1/getLtpData", True),
+    "quote":         ("POST", "/rest/secure/angelbroking/market/v1/quote/", True),
+    "searchScrip":   ("POST", "/rest/secure/angelbroking/order/v1/searchScrip", True),
+    "getCandleData": ("POST", "/rest/secure/angelbroking/historical/v1/getCandleData", True),
+    "gainersLosers": ("POST", "/rest/secure/angelbroking/marketData/v1/gainersLosers", True),
+    "estimateCharges": ("POST", "/rest/secure/angelbroking/brokerage/v1/estimateCharges", True),
+}
+
+# Errors that mean a pooled connection was closed by the server while idle
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+class AngelClient:
+    """
+    Thread-safe client over a bounded pool of keep-alive HTTPS connections.
+
+    At most `pool_size` requests are in flight at once; further callers block
+    until a connection is returned. Connections idle longer than `max_idle`
+    seconds are dropped rather than reused, since the server will have closed
+    them by then.
+    """
+
+    def __init__(self, jwt_token: str, api_key: str, host: str = API_HOST,
+                 port: int = None, pool_size: int = 8, timeout: float = 10.0,
+                 max_idle: float = 30.0, context=None, scheduler=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.context = context
+        self.jwt_token = jwt_token
+        self.scheduler = scheduler
+        self.headers = {
+            **BASE_HEADERS,
+            "Authorization": f"{jwt_token}",
+            "X-PrivateKey": api_key,
+        }
+        self._idle = queue.LifoQueue()  # LIFO keeps the warmest connections in use
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._metrics = {name: REGISTRY.endpoint("angel", name) for name in ENDPOINTS}
+
+    # ---- connection pool ----
+    def _new_connection(self) -> http.client.HTTPSConnection:
+        return http.client.HTTPSConnection(
+            self.host, self.port, timeout=self.timeout, context=self.context
+        )
+
+    def _checkout(self):
+        """Returns (conn, reused). Caller must already hold a slot."""
+        now = time.monotonic()
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._new_connection(), False
+            if now - last_used < self.max_idle:
+                return conn, True
+            conn.close()
+
+    def _checkin(self, conn, reusable: bool):
+        if reusable:
+            self._idle.put_nowait((conn, time.monotonic()))
+        else:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+
+    # ---- raw request ----
+    def request(self, endpoint: str, body: dict = None) -> str:
+        """Sends one request to a named endpoint and returns the response text."""
+        method, path, idempotent = ENDPOINTS[endpoint]
+        payload = json.dumps(body) if body is not None else ""
+        limit = self.scheduler.slot(endpoint) if self.scheduler else nullcontext()
+
+        m = self._metrics[endpoint]
+
+        with limit, self._slots:
+            t0 = time.perf_counter_ns()
+            while True:
+                conn, reused = self._checkout()
+                sent = False
+                try:
+                    conn.request(method, path, payload, self.headers)
+                    sent = True
+                    res = conn.getresponse()
+                    data = res.read()
+                except _STALE_ERRORS as e:
+                    conn.close()
+                    # A reused connection the server already dropped: safe to
+                    # retry on a fresh one unless a non-idempotent call may
+                    # have reached the server.
+                    if reused and (idempotent or not sent):
+                        m.retries.value += 1
+                        continue
+                    m.error(e)
+                    raise
+                except Exception as e:
+                    conn.close()
+                    m.error(e)
+                    raise
+                m.latency.record(time.perf_counter_ns() - t0)
+                if res.status >= 400:
+                    m.error(f"http_{res.status}")
+                self._checkin(conn, not res.will_close)
+                return data.decode("utf-8")
+
+    def request_json(self, endpoint: str, body: dict = None) -> dict:
+        return json.loads(self.request(endpoint, body))
+
+    # ---- orders ----
+    def place_order(self, order: dict) -> str:
+        return self.request("placeOrder", order)
+
+    def modify_order(self, order: dict) -> str:
+        return self.request("modifyOrder", order)
+
+    def cancel_order(self, orderid: str, variety: str = "NORMAL") -> str:
+        return self.request("cancelOrder", {"variety": variety, "orderid": orderid})
+
+    # ---- books & portfolio ----
+    def get_orderbook(self) -> str:
+        return self.request("getOrderBook")
+
+    def get_tradebook(self) -> str:
+        return self.request("getTradeBook")
+
+    def get_position(self) -> str:
+        return self.request("getPosition")
+
+    def get_holdings(self) -> str:
+        return self.request("getAllHolding")
+
+    # ---- market data ----
+    def get_ltp_data(self, exchange: str, tradingsymbol: str, symboltoken: str) -> str:
+        return self.request("getLtpData", {
+            "exchange": exchange,
+            "tradingsymbol": tradingsymbol,
+            "symboltoken": symboltoken,
+        })
+
+    def get_market_quote(self, mode: str, exchange_tokens: dict) -> str:
+        """mode LTP / OHLC / FULL; exchange_tokens {"NSE": ["3045", ...]}, up to 50 tokens."""
+        return self.request("quote", {"mode": mode, "exchangeTokens": exchange_tokens})
+
+    def search_scrip(self, exchange: str, searchscrip: str) -> str:
+        return self.request("searchScrip", {"exchange": exchange, "searchscrip": searchscrip})
+
+    def get_candledata(self, exchange: str, symboltoken: str, interval: str,
+                       fromdate: str, todate: str) -> str:
+        return self.request("getCandleData", {
+            "exchange": exchange,
+            "symboltoken": symboltoken,
+            "interval": interval,
+            "fromdate": fromdate,
+            "todate": todate,
+        })
+
+    def get_gainers_losers(self, datatype: str, expirytype: str = "NEAR") -> str:
+        return self.request("gainersLosers", {"datatype": datatype, "expirytype": expirytype})
+
+    # ---- charges ----
+    def estimate_charges(self, orders: list) -> str:
+        """orders: [{product_type, transaction_type, quantity, price, exchange, symbol_name, token}]"""
+        return self.request("estimateCharges", {"orders": orders})
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(jwt_token: str = None, api_key: str = None) -> AngelClient:
+    """
+    Returns the process-wide client for api_key, creating it on first use
+    (or again when the JWT changes). It is rate limited by the key's shared
+    scheduler. With no arguments, logs in via auth_token and reads
+    ANGEL_API_KEY from the environment.
+    """
+    if api_key is None:
+        api_key = os.getenv("ANGEL_API_KEY")
+        if not api_key:
+            raise ValueError("ANGEL_API_KEY not set in .env")
+    if jwt_token is None:
+        from auth_token import get_jwt_token_from_smartapi
+        jwt_token = get_jwt_token_from_smartapi()
+
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None or client.jwt_token != jwt_token:
+            if client is not None:
+                client.close()  # token rotated; drop the old session's sockets
+            client = _clients[api_key] = AngelClient(
+                jwt_token, api_key, scheduler=get_scheduler(api_key)
+            )
+        return client
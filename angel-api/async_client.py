@@ -0,0 +1,261 @@
+# async_client.py
+"""
+asyncio-native Angel One SmartAPI REST client.
+
+Same endpoints as angel_client.AngelClient, but every call is a coroutine
+over a pool of keep-alive TLS streams, with at most `max_concurrency`
+requests in flight (and, given a ratelimit.RequestScheduler, within the
+endpoint rate limits). gather_snapshot() fetches order book, trade book,
+positions and holdings concurrently, so a full account refresh costs about
+one round-trip instead of four, and it can share an event loop with a
+streaming tick feed.
+
+Usage:
+    async with AsyncAngelClient(jwt_token, api_key) as client:
+        snapshot = await client.gather_snapshot()
+"""
+import os
+import ssl
+import json
+import time
+import asyncio
+from contextlib import nullcontext
+from dotenv import load_dotenv
+from angel_client import API_HOST, BASE_HEADERS, ENDPOINTS
+from metrics import REGISTRY  # importable once angel_client added common/ to sys.path
+
+load_dotenv()  # load from .env
+
+# Errors that mean a pooled stream was closed by the server while idle
+_STALE_ERRORS = (
+    asyncio.IncompleteReadError,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+class AsyncAngelClient:
+    def __init__(self, jwt_token: str, api_key: str, host: str = API_HOST,
+                 port: int = 443, max_concurrency: int = 8, timeout: float = 10.0,
+                 max_idle: float = 30.0, context: ssl.SSLContext = None, scheduler=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.context = context or ssl.create_default_context()
+        self.jwt_token = jwt_token
+        self.scheduler = scheduler
+        headers = {
+            **BASE_HEADERS,
+            "Authorization": f"{jwt_token}",
+            "X-PrivateKey": api_key,
+            "Host": host,
+            "Connection": "keep-alive",
+        }
+        # Pre-encoded header block shared by every request
+        self._header_block = "".join(f"{k}: {v}\r\n" for k, v in headers.items()).encode("latin-1")
+        self._idle = []  # [(reader, writer, last_used)], used LIFO
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ---- connection pool ----
+    async def _checkout(self):
+        """Returns (reader, writer, reused). Caller must already hold a slot."""
+        now = time.monotonic()
+        while self._idle:
+            reader, writer, last_used = self._idle.pop()
+            if now - last_used < self.max_idle and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.context, server_hostname=self.host
+        )
+        return reader, writer, False
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for _, writer, _ in idle:
+            writer.close()
+        for _, writer, _ in idle:
+            try:
+                await writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+    # ---- HTTP/1.1 ----
+    @staticmethod
+    async def _read_response(reader):
+        """Returns (status, body, keep_alive)."""
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split(None, 2)[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    # skip trailers
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            return status, await reader.read(), False
+
+        keep_alive = headers.get("connection", "").lower() != "close"
+        return status, body, keep_alive
+
+    async def request(self, endpoint: str, body: dict = None) -> str:
+        """Sends one request to a named endpoint and returns the response text."""
+        method, path, idempotent = ENDPOINTS[endpoint]
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        head = (
+            f"{method} {path} HTTP/1.1\r\n".encode("latin-1")
+            + self._header_block
+            + f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1")
+        )
+
+        limit = self.scheduler.aslot(endpoint) if self.scheduler else nullcontext()
+
+        m = REGISTRY.endpoint("angel", endpoint)
+
+        async with limit, self._slots:
+            t0 = time.perf_counter_ns()
+            while True:
+                reader, writer, reused = await self._checkout()
+                sent = False
+                try:
+                    writer.write(head + payload)
+                    await writer.drain()
+                    sent = True
+                    status, data, keep_alive = await asyncio.wait_for(
+                        self._read_response(reader), self.timeout
+                    )
+                except _STALE_ERRORS as e:
+                    writer.close()
+                    # Same rule as the sync client: only retry when the
+                    # server cannot have acted on a non-idempotent call.
+                    if reused and (idempotent or not sent):
+                        m.retries.value += 1
+                        continue
+                    m.error(e)
+                    raise
+                except BaseException as e:
+                    writer.close()
+                    if not isinstance(e, asyncio.CancelledError):
+                        m.error(e)
+                    raise
+                m.latency.record(time.perf_counter_ns() - t0)
+                if status >= 400:
+                    m.error(f"http_{status}")
+                if keep_alive:
+                    self._idle.append((reader, writer, time.monotonic()))
+                else:
+                    writer.close()
+                return data.decode("utf-8")
+
+    async def request_json(self, endpoint: str, body: dict = None) -> dict:
+        return json.loads(await self.request(endpoint, body))
+
+    # ---- orders ----
+    async def place_order(self, order: dict) -> str:
+        return await self.request("placeOrder", order)
+
+    async def modify_order(self, order: dict) -> str:
+        return await self.request("modifyOrder", order)
+
+    async def cancel_order(self, orderid: str, variety: str = "NORMAL") -> str:
+        return await self.request("cancelOrder", {"variety": variety, "orderid": orderid})
+
+    # ---- books & portfolio ----
+    async def get_orderbook(self) -> str:
+        return await self.request("getOrderBook")
+
+    async def get_tradebook(self) -> str:
+        return await self.request("getTradeBook")
+
+    async def get_position(self) -> str:
+        return await self.request("getPosition")
+
+    async def get_holdings(self) -> str:
+        return await self.request("getAllHolding")
+
+    async def gather_snapshot(self) -> dict:
+        """
+        Fetches order book, trade book, positions and holdings concurrently
+        and returns them parsed: {"orderbook", "tradebook", "positions", "holdings"}.
+        """
+        names = ("orderbook", "tradebook", "positions", "holdings")
+        endpoints = ("getOrderBook", "getTradeBook", "getPosition", "getAllHolding")
+        results = await asyncio.gather(*(self.request_json(e) for e in endpoints))
+        return dict(zip(names, results))
+
+    # ---- market data ----
+    async def get_ltp_data(self, exchange: str, tradingsymbol: str, symboltoken: str) -> str:
+        return await self.request("getLtpData", {
+            "exchange": exchange,
+            "tradingsymbol": tradingsymbol,
+            "symboltoken": symboltoken,
+        })
+
+    async def get_market_quote(self, mode: str, exchange_tokens: dict) -> str:
+        return await self.request("quote", {"mode": mode, "exchangeTokens": exchange_tokens})
+
+    async def search_scrip(self, exchange: str, searchscrip: str) -> str:
+        return await self.request("searchScrip", {"exchange": exchange, "searchscrip": searchscrip})
+
+    async def get_candledata(self, exchange: str, symboltoken: str, interval: str,
+                             fromdate: str, todate: str) -> str:
+        return await self.request("getCandleData", {
+            "exchange": exchange,
+            "symboltoken": symboltoken,
+            "interval": interval,
+            "fromdate": fromdate,
+            "todate": todate,
+        })
+
+    async def get_gainers_losers(self, datatype: str, expirytype: str = "NEAR") -> str:
+        return await self.request("gainersLosers", {"datatype": datatype, "expirytype": expirytype})
+
+    # ---- charges ----
+    async def estimate_charges(self, orders: list) -> str:
+        return await self.request("estimateCharges", {"orders": orders})
+
+
+if __name__ == "__main__":
+    from auth_token import get_jwt_token_from_smartapi, AuthError
+    from ratelimit import get_scheduler
+
+    async def main():
+        api_key = os.getenv("ANGEL_API_KEY")
+        if not api_key:
+            raise ValueError("ANGEL_API_KEY not set in .env")
+
+        jwt_token = get_jwt_token_from_smartapi()
+        async with AsyncAngelClient(jwt_token, api_key, scheduler=get_scheduler(api_key)) as client:
+            t0 = time.perf_counter()
+            snapshot = await client.gather_snapshot()
+            print(f"Snapshot in {(time.perf_counter() - t0) * 1e3:.1f} ms")
+            for name, resp in snapshot.items():
+                print(name, resp.get("message"))
+
+    try:
+        asyncio.run(main())
+    except (AuthError, Exception) as e:
+        print(f"Failed: {e}")
@@ -1,46 +1,58 @@
 # auth_token.py
 import os
+import json
+import time
+import sys
+import base64
+import threading
 import pyotp
 from dotenv import load_dotenv
 from SmartApi import SmartConnect
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 load_dotenv()  # load variables from .env
 
+# Cached session (jwtToken, refreshToken, feedToken) shared by every script/process
+SESSION_PATH = os.getenv(
+    "ANGEL_SESSION_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".angel_session.json"),
+)
+REFRESH_MARGIN = 300       # renew this many seconds before the JWT expires
+FALLBACK_TTL = 6 * 3600    # used when the JWT carries no readable "exp" claim
+
 class AuthError(Exception):
     pass
 
-def get_jwt_token_from_smartapi() -> str:
-    """
-    Logs in via Angel One SmartAPI using env vars and returns a JWT string.
-    Expected env vars:
-      ANGEL_API_KEY, ANGEL_CLIENT_CODE, ANGEL_PASSWORD, ANGEL_TOTP_SECRET
-    """
-    API_KEY     = os.getenv("ANGEL_API_KEY")
-    CLIENT_CODE = os.getenv("ANGEL_CLIENT_CODE")
-    PASSWORD    = os.getenv("ANGEL_PASSWORD")
-    TOTP_SECRET = os.getenv("ANGEL_TOTP_SECRET")
-
+def _credentials() -> dict:
+    creds = {
+        "ANGEL_API_KEY": os.getenv("ANGEL_API_KEY"),
+        "ANGEL_CLIENT_CODE": os.getenv("ANGEL_CLIENT_CODE"),
+        "ANGEL_PASSWORD": os.getenv("ANGEL_PASSWORD"),
+        "ANGEL_TOTP_SECRET": os.getenv("ANGEL_TOTP_SECRET"),
+    }
     # Validate
-    missing = [k for k, v in {
-        "ANGEL_API_KEY": API_KEY,
-        "ANGEL_CLIENT_CODE": CLIENT_CODE,
-        "ANGEL_PASSWORD": PASSWORD,
-        "ANGEL_TOTP_SECRET": TOTP_SECRET,
-    }.items() if not v]
+    missing = [k for k, v in creds.items() if not v]
     if missing:
         raise AuthError(f"Missing env vars: {', '.join(missing)}")
+    return creds
 
-    # Generate runtime TOTP
-    totp = pyotp.TOTP(TOTP_SECRET).now()
-
-    # Login
-    smart_api = SmartConnect(api_key=API_KEY)
-    resp = smart_api.generateSession(
-        clientCode=CLIENT_CODE,
-        password=PASSWORD,
-        totp=totp
-    )
+def _jwt_expiry(jwt_token: str) -> float:
+    """Reads the unverified "exp" claim from a JWT, falling back to FALLBACK_TTL."""
+    try:
+        payload = jwt_token.split()[-1].split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return time.time() + FALLBACK_TTL
 
+def _session_from_response(resp, creds: dict) -> dict:
     data = (resp or {}).get("data") or {}
     #print(data)
     jwt_token = data.get("jwtToken") or data.get("accessToken")
@@ -48,4 +60,224 @@ def get_jwt_token_from_smartapi() -> str:
     if not jwt_token:
         raise AuthError(f"Could not obtain JWT from SmartAPI response: {resp}")
 
-    return jwt_token
+    return {
+        "client_code": creds["ANGEL_CLIENT_CODE"],
+        "api_key": creds["ANGEL_API_KEY"],
+        "jwtToken": jwt_token,
+        "refreshToken": data.get("refreshToken"),
+        "feedToken": data.get("feedToken"),
+        "expires_at": _jwt_expiry(jwt_token),
+    }
+
+def login_with_smartapi() -> dict:
+    """
+    Full login via Angel One SmartAPI using env vars. Returns the session dict
+    (jwtToken, refreshToken, feedToken, expires_at).
+    Expected env vars:
+      ANGEL_API_KEY, ANGEL_CLIENT_CODE, ANGEL_PASSWORD, ANGEL_TOTP_SECRET
+    """
+    creds = _credentials()
+
+    # Generate runtime TOTP
+    totp = pyotp.TOTP(creds["ANGEL_TOTP_SECRET"]).now()
+
+    # Login
+    smart_api = SmartConnect(api_key=creds["ANGEL_API_KEY"])
+    with REGISTRY.endpoint("angel", "generateSession").time():
+        resp = smart_api.generateSession(
+            clientCode=creds["ANGEL_CLIENT_CODE"],
+            password=creds["ANGEL_PASSWORD"],
+            totp=totp
+        )
+    return _session_from_response(resp, creds)
+
+def renew_with_refresh_token(session: dict) -> dict:
+    """Exchanges the refreshToken for a new jwtToken/feedToken without a TOTP login."""
+    creds = _credentials()
+    smart_api = SmartConnect(api_key=creds["ANGEL_API_KEY"])
+    smart_api.setAccessToken(session["jwtToken"])
+    with REGISTRY.endpoint("angel", "generateToken").time():
+        resp = smart_api.generateToken(session["refreshToken"])
+    renewed = _session_from_response(resp, creds)
+    renewed["refreshToken"] = renewed["refreshToken"] or session["refreshToken"]
+    renewed["feedToken"] = renewed["feedToken"] or session.get("feedToken")
+    return renewed
+
+
+class _FileLock:
+    """Exclusive inter-process lock on a sidecar file (flock / msvcrt)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = None
+
+    def __enter__(self):
+        self._fh = open(self.path, "a+")
+        if fcntl:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+        else:
+            self._fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ~10s; keep waiting
+                    pass
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        else:
+            self._fh.seek(0)
+            msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+        self._fh.close()
+        self._fh = None
+
+
+class SessionManager:
+    """
+    Caches the SmartAPI session on disk so every process reuses one login.
+
+    Reads are lock-free (the file is replaced atomically); logins and renewals
+    happen under an exclusive file lock, and whoever takes the lock second
+    simply adopts the session the first one wrote. With auto_renew, a daemon
+    thread renews the session through the refresh-token flow shortly before
+    the JWT expires.
+    """
+
+    def __init__(self, path: str = SESSION_PATH, refresh_margin: float = REFRESH_MARGIN,
+                 auto_renew: bool = True):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.refresh_margin = refresh_margin
+        self.auto_renew = auto_renew
+        self._session = None
+        self._lock = threading.Lock()
+        self._timer = None
+
+    # ---- storage ----
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if session.get("client_code") != os.getenv("ANGEL_CLIENT_CODE") \
+                or session.get("api_key") != os.getenv("ANGEL_API_KEY"):
+            return None  # written for another account
+        return session
+
+    def _write(self, session: dict):
+        # Owner-only from creation: the file holds live jwt / refresh tokens
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        if hasattr(os, "fchmod"):
+            os.fchmod(fd, 0o600)  # a leftover tmp keeps its old mode through O_CREAT
+        with os.fdopen(fd, "w") as f:
+            json.dump(session, f)
+        os.replace(tmp, self.path)
+
+    def _fresh(self, session, margin: float) -> bool:
+        return bool(session) and session.get("expires_at", 0) - margin > time.time()
+
+    # ---- public ----
+    def get_session(self) -> dict:
+        session = self._session
+        if self._fresh(session, 0):
+            return session  # in-memory fast path
+
+        with self._lock:
+            session = self._session
+            if not self._fresh(session, 0):
+                session = self._read()
+                if not self._fresh(session, 0):
+                    session = self._renew()
+                self._session = session
+                self._schedule()
+            return session
+
+    def get_jwt_token(self) -> str:
+        return self.get_session()["jwtToken"]
+
+    def get_feed_token(self) -> str:
+        return self.get_session()["feedToken"]
+
+    def invalidate(self):
+        """Drops the cached session, e.g. after the API rejects the token."""
+        with self._lock:
+            self._session = None
+            with _FileLock(self.lock_path):
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+
+    def stop(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    # ---- renewal ----
+    def _renew(self) -> dict:
+        with _FileLock(self.lock_path):
+            # Another process may have renewed while we waited for the lock
+            current = self._read()
+            if self._fresh(current, self.refresh_margin):
+                return current
+
+            session = None
+            if current and current.get("refreshToken"):
+                try:
+                    session = renew_with_refresh_token(current)
+                except Exception:
+                    session = None  # refresh rejected; fall back to a full login
+            if session is None:
+                session = login_with_smartapi()
+            self._write(session)
+            return session
+
+    def _schedule(self):
+        if not self.auto_renew:
+            return
+        self.stop()
+        delay = max(self._session["expires_at"] - self.refresh_margin - time.time(), 1.0)
+        self._timer = threading.Timer(delay, self._background_renew)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_renew(self):
+        try:
+            session = self._renew()
+        except Exception:
+            # Retry shortly; foreground callers still fall back to a login on expiry
+            self._timer = threading.Timer(30.0, self._background_renew)
+            self._timer.daemon = True
+            self._timer.start()
+            return
+        with self._lock:
+            self._session = session
+            self._schedule()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_session_manager() -> SessionManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = SessionManager()
+        return _manager
+
+def get_jwt_token_from_smartapi() -> str:
+    """
+    Returns a valid JWT string, logging in via Angel One SmartAPI only when
+    no cached session exists (see SessionManager).
+    Expected env vars:
+      ANGEL_API_KEY, ANGEL_CLIENT_CODE, ANGEL_PASSWORD, ANGEL_TOTP_SECRET
+    """
+    return get_session_manager().get_jwt_token()
+
+def get_feed_token() -> str:
+    return get_session_manager().get_feed_token()
@@ -0,0 +1,78 @@
+# bench_pool.py
+"""
+Benchmarks the pooled AngelClient against the old one-connection-per-call
+pattern, using the local HTTPS stand-in.
+
+Usage:
+    python bench/bench_pool.py --calls 500 --threads 8 --latency 0.002
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from angel_client import AngelClient, BASE_HEADERS, ENDPOINTS
+from standin import StandIn
+
+
+def fresh_connection_call(port, ctx, headers):
+    # What every angel-api script did before the shared client
+    method, path, _ = ENDPOINTS["getLtpData"]
+    conn = http.client.HTTPSConnection("localhost", port, context=ctx)
+    conn.request(method, path, '{"exchange": "NSE", "tradingsymbol": "SBIN-EQ", "symboltoken": "3045"}', headers)
+    res = conn.getresponse()
+    data = res.read().decode("utf-8")
+    conn.close()
+    return data
+
+
+def run(label, fn, calls, threads):
+    latencies = []
+
+    def timed(_):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(timed, range(calls)))
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1e3
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1e3
+    print(f"{label:<18} {calls / elapsed:>9.0f} req/s   p50 {p50:7.2f} ms   p99 {p99:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AngelClient pooling benchmark")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated server time per request (s)")
+    args = parser.parse_args()
+
+    with StandIn(latency=args.latency) as srv:
+        ctx = srv.client_context()
+        headers = {**BASE_HEADERS, "Authorization": "jwt", "X-PrivateKey": "key"}
+
+        before = srv.connections
+        run("new conn per call", lambda: fresh_connection_call(srv.port, ctx, headers), args.calls, args.threads)
+        fresh_conns = srv.connections - before
+
+        client = AngelClient("jwt", "key", host="localhost", port=srv.port,
+                             pool_size=args.threads, context=ctx)
+        before = srv.connections
+        run("pooled client", lambda: client.get_ltp_data("NSE", "SBIN-EQ", "3045"), args.calls, args.threads)
+        pooled_conns = srv.connections - before
+        client.close()
+
+        print(f"\nTCP/TLS connections opened: {fresh_conns} (per call) vs {pooled_conns} (pooled)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# standin.py
+"""
+Local HTTPS stand-in for the Angel One REST API.
+
+Serves the canned responses in ../response over TLS with HTTP/1.1
+keep-alive, so clients can be exercised and benchmarked offline. A
+throwaway self-signed certificate for "localhost" is generated with the
+openssl CLI on start.
+
+Usage:
+    with StandIn(latency=0.002) as srv:
+        ctx = srv.client_context()
+        client = AngelClient("jwt", "key", host="localhost", port=srv.port, context=ctx)
+"""
+import os
+import ssl
+import socket
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPONSE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "response")
+
+# last path segment -> canned response file
+CANNED = {
+    "placeOrder": "placeorder.json",
+    "modifyOrder": "modifyorder.json",
+    "cancelOrder": "cancelorder.json",
+    "getOrderBook": "gettodayorderbook.json",
+    "getTradeBook": "getexecutedtradebook.json",
+    "getPosition": "getPosition.json",
+    "getAllHolding": "allholdings.json",
+    "getLtpData": "getLTPData.json",
+    "quote": "marketQuote.json",
+    "searchScrip": "searchScrip.json",
+    "getCandleData": "getCandledata.json",
+    "gainersLosers": "PercOILosers.json",
+    "estimateCharges": "estimateCharges.json",
+}
+
+
+def _load_canned() -> dict:
+    bodies = {}
+    for name, fname in CANNED.items():
+        with open(os.path.join(RESPONSE_DIR, fname), "rb") as f:
+            bodies[name] = f.read()
+    return bodies
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive unless the client says otherwise
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        srv = self.server
+        with srv.stats_lock:
+            srv.requests += 1
+        if srv.latency:
+            time.sleep(srv.latency)
+        body = srv.bodies.get(self.path.rstrip("/").rsplit("/", 1)[-1])
+        if body is None:
+            self.send_response(404)
+            body = b'{"status": false, "message": "Not Found", "errorcode": "AB404", "data": null}'
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, format, *args):
+        return
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def get_request(self):
+        sock, addr = super().get_request()
+        # headers and body go out in separate writes; avoid Nagle/delayed-ACK stalls
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.stats_lock:
+            self.connections += 1
+        return sock, addr
+
+
+class StandIn:
+    """Runs the stand-in on 127.0.0.1 in a background thread."""
+
+    def __init__(self, latency: float = 0.0, port: int = 0):
+        self.latency = latency
+        self._port = port
+        self._tmp = None
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    @property
+    def connections(self) -> int:
+        return self._httpd.connections
+
+    @property
+    def requests(self) -> int:
+        return self._httpd.requests
+
+    def _make_cert(self):
+        self._tmp = tempfile.mkdtemp(prefix="angel-standin-")
+        self.certfile = os.path.join(self._tmp, "cert.pem")
+        self.keyfile = os.path.join(self._tmp, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+             "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+             "-keyout", self.keyfile, "-out", self.certfile],
+            check=True, capture_output=True,
+        )
+
+    def client_context(self) -> ssl.SSLContext:
+        """SSL context that trusts the stand-in's self-signed certificate."""
+        return ssl.create_default_context(cafile=self.certfile)
+
+    def start(self):
+        self._make_cert()
+        httpd = _Server(("127.0.0.1", self._port), _Handler)
+        httpd.bodies = _load_canned()
+        httpd.latency = self.latency
+        httpd.stats_lock = threading.Lock()
+        httpd.connections = 0
+        httpd.requests = 0
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(self.certfile, self.keyfile)
+        # handshake lazily in the handler thread so accept() never serialises it
+        httpd.socket = ctx.wrap_socket(httpd.socket, server_side=True, do_handshake_on_connect=False)
+        self._httpd = httpd
+        self._thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        if self._tmp:
+            shutil.rmtree(self._tmp, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    with StandIn() as srv:
+        print(f"Angel stand-in listening on https://localhost:{srv.port} (cert: {srv.certfile})")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
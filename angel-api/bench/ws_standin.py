@@ -0,0 +1,232 @@
+# ws_standin.py
+"""
+Local websocket stand-in for Angel One's smart-stream market-data feed.
+
+Speaks the SmartWebSocketV2 protocol on ws://127.0.0.1: checks the four
+auth headers, answers "ping" with "pong", takes subscribe / unsubscribe
+JSON (action 1/0, mode 1/2/3, tokenList) and sends one binary packet per
+subscribed token every `interval` seconds, with a random-walk price,
+growing volume and a five-level book. Unknown modes or a missing header
+get Angel-style error replies. drop() cuts every connection, to exercise
+reconnects.
+
+Usage:
+    with FeedStandIn(interval=0.01) as feed:
+        stream = SmartStream("jwt", "key", "client", "feed", url=feed.url)
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import threading
+from socketserver import ThreadingTCPServer, StreamRequestHandler
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from smart_stream import (accept_key, encode_frame, decode_frames,
+                          OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+from angel_packets import build_packet, PACKET_LENGTHS
+
+AUTH_HEADERS = ("authorization", "x-api-key", "x-client-code", "x-feed-token")
+
+
+class _Handler(StreamRequestHandler):
+    def handle(self):
+        srv = self.server
+        headers = {}
+        request = self.rfile.readline()
+        while True:
+            line = self.rfile.readline().decode(errors="replace").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if not request.startswith(b"GET ") or "sec-websocket-key" not in headers:
+            self.wfile.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return
+        missing = [h for h in AUTH_HEADERS if not headers.get(h)]
+        if missing:
+            self.wfile.write(f"HTTP/1.1 401 Unauthorized\r\nx-error-message: missing {', '.join(missing)}"
+                             f"\r\nContent-Length: 0\r\n\r\n".encode())
+            return
+        self.wfile.write((
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept_key(headers['sec-websocket-key'])}\r\n\r\n").encode())
+        self.wfile.flush()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.subscribed = {}  # (exchange_type, token) -> mode
+        self.send_lock = threading.Lock()
+        self.done = threading.Event()
+        with srv.lock:
+            srv.connections += 1
+            srv.live.add(self)
+        feeder = threading.Thread(target=self._feed, daemon=True)
+        feeder.start()
+        try:
+            self._read()
+        finally:
+            self.done.set()
+            feeder.join()
+            with srv.lock:
+                srv.live.discard(self)
+
+    def send(self, opcode: int, payload: bytes):
+        with self.send_lock:
+            self.request.sendall(encode_frame(opcode, payload, mask=False))
+
+    def _read(self):
+        buf = bytearray()
+        while not self.done.is_set():
+            try:
+                chunk = self.request.recv(1 << 16)
+            except OSError:
+                return
+            if not chunk:
+                return
+            buf += chunk
+            frames, used = decode_frames(buf)
+            del buf[:used]
+            for _, opcode, payload in frames:
+                if opcode == OP_CLOSE:
+                    try:
+                        self.send(OP_CLOSE, payload[:2])
+                    except OSError:
+                        pass
+                    return
+                if opcode == OP_PING:
+                    self.send(OP_PONG, payload)
+                elif opcode == OP_TEXT:
+                    self._command(payload.decode(errors="replace"))
+
+    def _command(self, text: str):
+        if text == "ping":
+            self.send(OP_TEXT, b"pong")
+            return
+        try:
+            msg = json.loads(text)
+            action, params = msg["action"], msg["params"]
+            mode = params["mode"]
+            if mode not in PACKET_LENGTHS:
+                raise ValueError("Invalid Subscription Mode")
+            keys = [(group["exchangeType"], str(t)) for group in params["tokenList"] for t in group["tokens"]]
+        except (ValueError, KeyError, TypeError) as e:
+            error = {"correlationID": None, "errorCode": "E1002", "errorMessage": f"Invalid Request: {e}"}
+            self.send(OP_TEXT, json.dumps(error).encode())
+            return
+        with self.server.lock:
+            for key in keys:
+                if action == 1:
+                    self.subscribed[key] = mode
+                elif self.subscribed.get(key) == mode:
+                    del self.subscribed[key]
+            self.server.commands += 1
+
+    def _feed(self):
+        srv = self.server
+        rng = random.Random(7)
+        seq = 0
+        while not self.done.wait(srv.interval):
+            with srv.lock:
+                subscribed = list(self.subscribed.items())
+            now_ms = int(time.time() * 1000)
+            try:
+                for (exchange_type, token), mode in subscribed:
+                    state = srv.prices.setdefault(token, [rng.randint(10_000, 500_000), 0, None])
+                    state[0] = max(state[0] + rng.choice((-5, 0, 5)), 5)
+                    state[1] += rng.randint(1, 100)
+                    ltp, volume = state[0], state[1]
+                    if state[2] is None:
+                        state[2] = (ltp, ltp, ltp, ltp)
+                    o, h, l, c = state[2]
+                    state[2] = (o, max(h, ltp), min(l, ltp), c)
+                    seq += 1
+                    depth = [(1, 10 * (k + 1), ltp - 5 * (k + 1), k + 1) for k in range(5)] + \
+                            [(0, 10 * (k + 1), ltp + 5 * (k + 1), k + 1) for k in range(5)]
+                    packet = build_packet(mode, exchange_type, token, ltp, seq, now_ms, ltq=volume % 100 + 1,
+                                          avg_price=ltp, volume=volume, buy_qty=float(volume),
+                                          sell_qty=float(volume), ohlc=state[2], last_trade_ts=now_ms // 1000,
+                                          oi=volume, depth=depth, circuits=(c * 12 // 10, c * 8 // 10),
+                                          week52=(c * 3 // 2, c // 2))
+                    self.send(OP_BINARY, packet)
+                    srv.packets += 1
+            except OSError:
+                return
+
+
+class _Server(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FeedStandIn:
+    """Runs the stand-in on 127.0.0.1 in a background thread."""
+
+    def __init__(self, interval: float = 0.01, port: int = 0):
+        self.interval = interval
+        self._port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}/smart-stream"
+
+    @property
+    def connections(self) -> int:
+        return self._server.connections
+
+    @property
+    def packets(self) -> int:
+        return self._server.packets
+
+    def start(self):
+        server = _Server(("127.0.0.1", self._port), _Handler)
+        server.interval = self.interval
+        server.lock = threading.Lock()
+        server.live = set()
+        server.prices = {}
+        server.connections = server.packets = server.commands = 0
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def drop(self):
+        """Closes every open connection without a close frame."""
+        with self._server.lock:
+            live = list(self._server.live)
+        for handler in live:
+            handler.done.set()
+            try:
+                handler.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stop(self):
+        if self._server:
+            self.drop()
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    with FeedStandIn() as feed:
+        print(f"Angel feed stand-in listening on {feed.url}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
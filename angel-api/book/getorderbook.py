@@ -1,31 +1,23 @@
 # get_orderbook.py
 import os
-import http.client
 from dotenv import load_dotenv
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_token import get_jwt_token_from_smartapi, AuthError
+from angel_client import get_client
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+from order_book import angel_sync
 
 load_dotenv()  # load from .env
-API_HOST = "apiconnect.angelone.in"
 
 def get_orderbook(jwt_token: str, api_key: str) -> str:
-    conn = http.client.HTTPSConnection(API_HOST)
-    payload = ""
-    headers = {
-        "Authorization": f"{jwt_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-UserType": "USER",
-        "X-SourceID": "WEB",
-        "X-ClientLocalIP": "CLIENT_LOCAL_IP",
-        "X-ClientPublicIP": "CLIENT_PUBLIC_IP",
-        "X-MACAddress": "MAC_ADDRESS",
-        "X-PrivateKey": api_key,
-    }
-    conn.request("GET", "/rest/secure/angelbroking/order/v1/getOrderBook", payload, headers)
-    res = conn.getresponse()
-    return res.read().decode("utf-8")
+    return get_client(jwt_token, api_key).get_orderbook()
+
+def watch_orderbook(jwt_token: str, api_key: str, on_events, interval: float = 1.0):
+    # Polls order + trade book in the background; on_events only gets what changed
+    sync = angel_sync(get_client(jwt_token, api_key), interval, on_events)
+    sync.start()
+    return sync
 
 if __name__ == "__main__":
     try:
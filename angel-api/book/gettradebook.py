@@ -1,31 +1,15 @@
 # get_orderbook.py
 import os
-import http.client
 from dotenv import load_dotenv
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_token import get_jwt_token_from_smartapi, AuthError
+from angel_client import get_client
 
 load_dotenv()  # load from .env
-API_HOST = "apiconnect.angelone.in"
 
 def get_tradebook(jwt_token: str, api_key: str) -> str:
-    conn = http.client.HTTPSConnection(API_HOST)
-    payload = ""
-    headers = {
-        "Authorization": f"{jwt_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-UserType": "USER",
-        "X-SourceID": "WEB",
-        "X-ClientLocalIP": "CLIENT_LOCAL_IP",
-        "X-ClientPublicIP": "CLIENT_PUBLIC_IP",
-        "X-MACAddress": "MAC_ADDRESS",
-        "X-PrivateKey": api_key,
-    }
-    conn.request("GET", "/rest/secure/angelbroking/order/v1/getTradeBook", payload, headers)
-    res = conn.getresponse()
-    return res.read().decode("utf-8")
+    return get_client(jwt_token, api_key).get_tradebook()
 
 if __name__ == "__main__":
     try:
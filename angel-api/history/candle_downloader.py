@@ -0,0 +1,283 @@
+# candle_downloader.py
+"""
+Chunked, parallel, resumable historical candle downloader for getCandleData.
+
+Angel caps the date span of a single getCandleData request per interval, so
+a long fromdate/todate range is split into API-legal chunks. Chunks for all
+symbols run concurrently through the shared rate-limited client. Every
+finished chunk is recorded in a checkpoint file, so a crashed run resumes
+where it stopped. A rerun (e.g. the nightly update) only fetches the parts
+of the range that are not covered yet. Candles go to the shared CandleStore
+(common/candle_store.py) by default.
+
+Usage:
+    python history/candle_downloader.py --tokens 3045,1594 --interval ONE_MINUTE \
+        --from "2024-01-01 09:15" --to "2024-12-31 15:30"
+"""
+import os
+import csv
+import json
+import time
+import argparse
+import threading
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from auth_token import get_jwt_token_from_smartapi, AuthError
+from angel_client import get_client
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+from candle_store import CandleStore, DEFAULT_ROOT, from_angel
+
+load_dotenv()  # load from .env
+
+CHECKPOINT_PATH = os.path.join(DEFAULT_ROOT, "angel_checkpoint.json")
+DATE_FMT = "%Y-%m-%d %H:%M"
+
+# Max days per getCandleData request, per interval
+MAX_DAYS = {
+    "ONE_MINUTE": 30,
+    "THREE_MINUTE": 60,
+    "FIVE_MINUTE": 100,
+    "TEN_MINUTE": 100,
+    "FIFTEEN_MINUTE": 200,
+    "THIRTY_MINUTE": 200,
+    "ONE_HOUR": 400,
+    "ONE_DAY": 2000,
+}
+INTERVAL_MINUTES = {
+    "ONE_MINUTE": 1,
+    "THREE_MINUTE": 3,
+    "FIVE_MINUTE": 5,
+    "TEN_MINUTE": 10,
+    "FIFTEEN_MINUTE": 15,
+    "THIRTY_MINUTE": 30,
+    "ONE_HOUR": 60,
+    "ONE_DAY": 1440,
+}
+RETRYABLE_ERRORCODES = {"AB1004", "AB2000", "AB1019"}
+MINUTE = dt.timedelta(minutes=1)
+
+
+def split_range(fromdate: dt.datetime, todate: dt.datetime, interval: str) -> list:
+    """Splits [fromdate, todate] (inclusive, minute precision) into API-legal chunks."""
+    span = dt.timedelta(days=MAX_DAYS[interval])
+    chunks = []
+    start = fromdate
+    while start <= todate:
+        end = min(start + span - MINUTE, todate)
+        chunks.append((start, end))
+        start = end + MINUTE
+    return chunks
+
+
+def missing_ranges(fromdate: dt.datetime, todate: dt.datetime, covered: list) -> list:
+    """Parts of [fromdate, todate] not inside any covered (start, end) range."""
+    gaps = []
+    cursor = fromdate
+    for start, end in sorted(covered):
+        if end < cursor:
+            continue
+        if start > todate:
+            break
+        if start > cursor:
+            gaps.append((cursor, start - MINUTE))
+        cursor = max(cursor, end + MINUTE)
+    if cursor <= todate:
+        gaps.append((cursor, todate))
+    return gaps
+
+
+def _merge(ranges: list) -> list:
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + MINUTE:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class Checkpoint:
+    """Covered ranges per series key, persisted as JSON after every chunk."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.covered = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                raw = json.load(f)
+            for key, ranges in raw.get("covered", {}).items():
+                self.covered[key] = [
+                    (dt.datetime.strptime(a, DATE_FMT), dt.datetime.strptime(b, DATE_FMT))
+                    for a, b in ranges
+                ]
+
+    def ranges(self, key: str) -> list:
+        with self._lock:
+            return list(self.covered.get(key, []))
+
+    def mark(self, key: str, start: dt.datetime, end: dt.datetime):
+        with self._lock:
+            self.covered[key] = _merge(self.covered.get(key, []) + [(start, end)])
+            raw = {"covered": {
+                k: [[a.strftime(DATE_FMT), b.strftime(DATE_FMT)] for a, b in v]
+                for k, v in self.covered.items()
+            }}
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(raw, f)
+            os.replace(tmp, self.path)
+
+
+class StoreCandleSink:
+    """Appends candles to the shared memory-mapped CandleStore (symbol = "EXCHANGE:token")."""
+
+    def __init__(self, store: CandleStore = None):
+        self.store = store or CandleStore()
+
+    def write(self, key: str, candles: list):
+        exchange, symboltoken, interval = key.split(":")
+        self.store.append(f"{exchange}:{symboltoken}", interval, from_angel(candles))
+
+
+class CsvCandleSink:
+    """
+    One CSV per downloaded chunk (timestamp, open, high, low, close, volume)
+    in a directory per series, named after the chunk's first and last candle.
+    A chunk fetched again after a crash replaces its own file, so a resumed
+    run never duplicates rows; read() merges a series back in time order.
+    """
+
+    def __init__(self, data_dir: str = os.path.join(DEFAULT_ROOT, "csv")):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+
+    def _dir(self, key: str) -> str:
+        return os.path.join(self.data_dir, key.replace(":", "_"))
+
+    def write(self, key: str, candles: list):
+        if not candles:
+            return
+        d = self._dir(key)
+        os.makedirs(d, exist_ok=True)
+        stamps = [str(c[0]).replace(":", "") for c in candles]
+        path = os.path.join(d, f"{min(stamps)}_{max(stamps)}.csv")
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", newline="") as f:
+            csv.writer(f).writerows(candles)
+        os.replace(tmp, path)
+
+    def read(self, key: str) -> list:
+        """Every candle of a series as CSV rows, oldest first, one per timestamp."""
+        d = self._dir(key)
+        rows = {}
+        for name in sorted(os.listdir(d)) if os.path.isdir(d) else ():
+            if name.endswith(".csv"):
+                with open(os.path.join(d, name), newline="") as f:
+                    for row in csv.reader(f):
+                        rows[row[0]] = row
+        return [rows[ts] for ts in sorted(rows)]
+
+
+def series_key(exchange: str, symboltoken: str, interval: str) -> str:
+    return f"{exchange}:{symboltoken}:{interval}"
+
+
+def _fetch_chunk(client, exchange, symboltoken, interval, start, end, retries=3, backoff=1.0) -> list:
+    for attempt in range(retries + 1):
+        resp = json.loads(client.get_candledata(
+            exchange=exchange,
+            symboltoken=symboltoken,
+            interval=interval,
+            fromdate=start.strftime(DATE_FMT),
+            todate=end.strftime(DATE_FMT),
+        ))
+        if resp.get("status"):
+            return resp.get("data") or []
+        if resp.get("errorcode") not in RETRYABLE_ERRORCODES or attempt == retries:
+            raise RuntimeError(f"{resp.get('errorcode')}: {resp.get('message')}")
+        time.sleep(backoff * (attempt + 1))
+
+
+def download(symbols: list, interval: str, fromdate: dt.datetime, todate: dt.datetime,
+             client=None, sink=None, checkpoint_path: str = None, max_workers: int = 8) -> dict:
+    """
+    Downloads candles for every (exchange, symboltoken) in symbols over
+    [fromdate, todate], skipping ranges already covered. Returns
+    {"chunks", "skipped", "fetched", "failed", "candles", "errors", "latency_ms"}.
+    """
+    client = client or get_client()
+    sink = sink or StoreCandleSink()
+    os.makedirs(DEFAULT_ROOT, exist_ok=True)
+    checkpoint = Checkpoint(checkpoint_path or CHECKPOINT_PATH)
+    # Never mark the still-forming bar as covered
+    now = dt.datetime.now().replace(second=0, microsecond=0)
+    last_closed = now - dt.timedelta(minutes=INTERVAL_MINUTES[interval])
+    todate = min(todate, last_closed)
+    t0 = time.perf_counter()
+
+    jobs = []
+    total_chunks = 0
+    for exchange, symboltoken in symbols:
+        key = series_key(exchange, symboltoken, interval)
+        total_chunks += len(split_range(fromdate, todate, interval))
+        for gap_start, gap_end in missing_ranges(fromdate, todate, checkpoint.ranges(key)):
+            for start, end in split_range(gap_start, gap_end, interval):
+                jobs.append((key, exchange, symboltoken, start, end))
+
+    def run(job):
+        key, exchange, symboltoken, start, end = job
+        candles = _fetch_chunk(client, exchange, symboltoken, interval, start, end)
+        sink.write(key, candles)
+        checkpoint.mark(key, start, end)  # only after the data is safely written
+        return len(candles)
+
+    summary = {"chunks": total_chunks, "skipped": max(total_chunks - len(jobs), 0),
+               "fetched": 0, "failed": 0, "candles": 0, "errors": []}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(run, job): job for job in jobs}
+        for f in as_completed(futures):
+            try:
+                summary["candles"] += f.result()
+                summary["fetched"] += 1
+            except Exception as e:
+                key, _, _, start, end = futures[f]
+                summary["failed"] += 1
+                summary["errors"].append(f"{key} {start:%Y-%m-%d}..{end:%Y-%m-%d}: {e}")
+    summary["latency_ms"] = (time.perf_counter() - t0) * 1e3
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Angel historical candle downloader")
+    parser.add_argument("--exchange", default="NSE")
+    parser.add_argument("--tokens", required=True, help="Comma-separated symboltokens")
+    parser.add_argument("--interval", default="ONE_MINUTE", choices=sorted(MAX_DAYS))
+    parser.add_argument("--from", dest="fromdate", required=True, help='"YYYY-MM-DD HH:MM"')
+    parser.add_argument("--to", dest="todate", default=dt.datetime.now().strftime(DATE_FMT))
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    try:
+        api_key = os.getenv("ANGEL_API_KEY")
+        if not api_key:
+            raise ValueError("ANGEL_API_KEY not set in .env")
+
+        jwt_token = get_jwt_token_from_smartapi()
+        summary = download(
+            [(args.exchange, t.strip()) for t in args.tokens.split(",") if t.strip()],
+            args.interval,
+            dt.datetime.strptime(args.fromdate, DATE_FMT),
+            dt.datetime.strptime(args.todate, DATE_FMT),
+            client=get_client(jwt_token, api_key),
+            max_workers=args.workers,
+        )
+        for err in summary.pop("errors"):
+            print("Error:", err)
+        print(summary)
+
+    except (AuthError, Exception) as e:
+        print(f"Failed: {e}")
@@ -1,36 +1,17 @@
 # get_gainersLosers.py
 import os
-import http.client
-import json
 from dotenv import load_dotenv
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_token import get_jwt_token_from_smartapi, AuthError
+from angel_client import get_client
 
 load_dotenv()  # load from .env
-API_HOST = "apiconnect.angelone.in"
 
 def get_gainersLosers(jwt_token: str, api_key: str) -> str:
-    conn = http.client.HTTPSConnection(API_HOST)
-    payload = json.dumps({
-    "datatype":"PercOILosers", # Type of Data you want(PercOILosers/PercOIGainers/PercPriceGainers/PercPriceLosers)
-    "expirytype":"NEAR" # Expiry Type (NEAR/NEXT/FAR)
-})
-    headers = {
-        "Authorization": f"{jwt_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-UserType": "USER",
-        "X-SourceID": "WEB",
-        "X-ClientLocalIP": "CLIENT_LOCAL_IP",
-        "X-ClientPublicIP": "CLIENT_PUBLIC_IP",
-        "X-MACAddress": "MAC_ADDRESS",
-        "X-PrivateKey": api_key,
-    }
-     
-    conn.request("POST", "/rest/secure/angelbroking/marketData/v1/gainersLosers", payload, headers)
-    res = conn.getresponse()
-    return res.read().decode("utf-8")
+    # Type of Data you want(PercOILosers/PercOIGainers/PercPriceGainers/PercPriceLosers)
+    # Expiry Type (NEAR/NEXT/FAR)
+    return get_client(jwt_token, api_key).get_gainers_losers("PercOILosers", "NEAR")
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,247 @@
+# basket.py
+"""
+Basket order placement on top of the shared AngelClient.
+
+Validates a list (or pandas DataFrame) of orders up front, then places them
+concurrently through the rate-limited client. Returns a per-order result
+for each row plus totals and basket latency. Orders rejected with a
+transient error are retried automatically; anything else that failed can be
+resubmitted later with retry_failed().
+
+Usage:
+    python order/basket.py orders.csv
+"""
+import os
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from auth_token import get_jwt_token_from_smartapi, AuthError
+from angel_client import get_client
+
+load_dotenv()  # load from .env
+
+REQUIRED = ("tradingsymbol", "symboltoken", "transactiontype", "exchange", "quantity")
+DEFAULTS = {
+    "variety": "NORMAL",
+    "ordertype": "LIMIT",
+    "producttype": "INTRADAY",
+    "duration": "DAY",
+    "price": "0",
+    "squareoff": "0",
+    "stoploss": "0",
+}
+ALLOWED = {
+    "variety": {"NORMAL", "STOPLOSS", "AMO", "ROBO"},
+    "transactiontype": {"BUY", "SELL"},
+    "exchange": {"NSE", "BSE", "NFO", "BFO", "MCX", "CDS"},
+    "ordertype": {"MARKET", "LIMIT", "STOPLOSS_LIMIT", "STOPLOSS_MARKET"},
+    "producttype": {"DELIVERY", "CARRYFORWARD", "MARGIN", "INTRADAY", "BO"},
+    "duration": {"DAY", "IOC"},
+}
+# Angel error codes that mean "not accepted, try again"
+RETRYABLE_ERRORCODES = {"AB1004", "AB2000", "AB1019"}
+
+
+def _blank(v) -> bool:
+    """None, NaN (an empty DataFrame cell) or an empty string."""
+    return v is None or v != v or str(v).strip() == ""
+
+
+def validate_order(order: dict) -> tuple:
+    """Returns (normalized_order, error). Angel expects every value as a string."""
+    missing = [k for k in REQUIRED if _blank(order.get(k))]
+    if missing:
+        return None, f"missing fields: {', '.join(missing)}"
+
+    clean = dict(DEFAULTS)
+    for k, v in order.items():
+        if v is None or v != v:  # skip None / NaN cells from DataFrames
+            continue
+        clean[k] = str(v).strip()
+    for k in ALLOWED:
+        clean[k] = clean[k].upper()
+        if clean[k] not in ALLOWED[k]:
+            return None, f"invalid {k}: {clean[k]}"
+
+    try:
+        qty = float(clean["quantity"])
+        price = float(clean["price"])
+        trigger = float(clean.get("triggerprice") or 0)
+    except ValueError as e:
+        return None, f"non-numeric value: {e}"
+    if qty <= 0 or qty != int(qty):
+        return None, f"invalid quantity: {clean['quantity']}"
+    clean["quantity"] = str(int(qty))
+    if clean["ordertype"] in ("LIMIT", "STOPLOSS_LIMIT") and price <= 0:
+        return None, f"{clean['ordertype']} order needs a positive price"
+    if clean["ordertype"].startswith("STOPLOSS") and trigger <= 0:
+        return None, f"{clean['ordertype']} order needs a positive triggerprice"
+    return clean, None
+
+
+def _as_records(orders) -> list:
+    if hasattr(orders, "to_dict"):  # pandas DataFrame
+        return orders.to_dict("records")
+    return list(orders)
+
+
+def _place_one(client, index: int, order: dict, retries: int, backoff: float) -> dict:
+    result = {"index": index, "order": order, "status": None, "orderid": None,
+              "message": None, "attempts": 0, "latency_ms": 0.0}
+    t0 = time.perf_counter()
+    while True:
+        result["attempts"] += 1
+        try:
+            resp = json.loads(client.place_order(order))
+        except Exception as e:
+            # The request may or may not have reached the exchange; never
+            # resubmit blindly (check the order book first).
+            result.update(status="unknown", message=str(e))
+            break
+        data = resp.get("data") or {}
+        if resp.get("status") and data.get("orderid"):
+            result.update(status="placed", orderid=data["orderid"], message=resp.get("message"))
+            break
+        result.update(status="rejected", message=f"{resp.get('errorcode')}: {resp.get('message')}")
+        if resp.get("errorcode") not in RETRYABLE_ERRORCODES or result["attempts"] > retries:
+            break
+        time.sleep(backoff * result["attempts"])
+    result["latency_ms"] = (time.perf_counter() - t0) * 1e3
+    return result
+
+
+def _summarize(results: list, latency_ms: float) -> dict:
+    counts = {"placed": 0, "rejected": 0, "unknown": 0, "invalid": 0}
+    for r in results:
+        counts[r["status"]] += 1
+    return {"results": results, **counts, "latency_ms": latency_ms}
+
+
+def submit_basket(orders, client=None, max_workers: int = 16, retries: int = 2,
+                  backoff: float = 0.2) -> dict:
+    """
+    Validates and places every order concurrently. Returns
+    {"results", "placed", "rejected", "unknown", "invalid", "latency_ms"},
+    with results in input order. Throughput is bounded by the placeOrder
+    rate limit, not by max_workers.
+    """
+    client = client or get_client()
+    records = _as_records(orders)
+    results = [None] * len(records)
+    t0 = time.perf_counter()
+
+    jobs = []
+    for i, raw in enumerate(records):
+        clean, error = validate_order(raw)
+        if error:
+            results[i] = {"index": i, "order": raw, "status": "invalid", "orderid": None,
+                          "message": error, "attempts": 0, "latency_ms": 0.0}
+        else:
+            jobs.append((i, clean))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_place_one, client, i, o, retries, backoff) for i, o in jobs]
+        for f in futures:
+            r = f.result()
+            results[r["index"]] = r
+
+    return _summarize(results, (time.perf_counter() - t0) * 1e3)
+
+
+def _match_key(order: dict) -> tuple:
+    """What identifies an order in the book: its ordertag, else symbol / side / qty / price."""
+    if order.get("ordertag"):
+        return ("tag", order["ordertag"])
+    return (order.get("tradingsymbol"), str(order.get("transactiontype")).upper(),
+            int(float(order.get("quantity") or 0)), round(float(order.get("price") or 0), 2))
+
+
+def _find_in_book(client, results: list, unknown: list) -> dict:
+    """index -> orderid for the "unknown" results the broker did accept (one getOrderBook call)."""
+    resp = json.loads(client.get_orderbook())
+    if not resp.get("status"):
+        raise RuntimeError(f"getOrderBook failed: {resp.get('errorcode')}: {resp.get('message')}")
+    known = {r["orderid"] for r in results if r["orderid"]}
+    by_key = {}
+    for o in resp.get("data") or []:  # data is null when there are no orders yet
+        if o.get("orderid") in known:
+            continue
+        if o.get("ordertag"):
+            by_key.setdefault(("tag", o["ordertag"]), []).append(o["orderid"])
+        by_key.setdefault(_match_key(dict(o, ordertag=None)), []).append(o["orderid"])
+    found, taken = {}, set()
+    for r in unknown:
+        # A tagged row is listed under its tag and its plain key, but accounts
+        # for at most one unknown order
+        candidates = by_key.get(_match_key(r["order"])) or []
+        while candidates:
+            orderid = candidates.pop(0)
+            if orderid not in taken:
+                taken.add(orderid)
+                found[r["index"]] = orderid
+                break
+    return found
+
+
+def retry_failed(report: dict, client=None, max_workers: int = 16, retries: int = 2,
+                 backoff: float = 0.2, include_unknown: bool = False) -> dict:
+    """
+    Resubmits the rejected orders of a previous report and returns a merged
+    report. Orders with status "unknown" are only resent with
+    include_unknown=True, after checking the order book that they are absent
+    (matched by ordertag, or by symbol / side / quantity / price when untagged);
+    the ones found there are marked placed instead.
+    """
+    client = client or get_client()
+    results = list(report["results"])
+    todo = [r for r in results if r["status"] == "rejected"]
+    if include_unknown:
+        unknown = [r for r in results if r["status"] == "unknown"]
+        found = _find_in_book(client, results, unknown) if unknown else {}
+        for r in unknown:
+            if r["index"] in found:
+                results[r["index"]] = dict(r, status="placed", orderid=found[r["index"]],
+                                           message="found in order book")
+            else:
+                todo.append(r)
+    t0 = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_place_one, client, r["index"], r["order"], retries, backoff)
+                   for r in todo]
+        for f in futures:
+            r = f.result()
+            r["attempts"] += results[r["index"]]["attempts"]
+            results[r["index"]] = r
+
+    return _summarize(results, (time.perf_counter() - t0) * 1e3)
+
+
+def load_orders_csv(path: str) -> list:
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+if __name__ == "__main__":
+    try:
+        api_key = os.getenv("ANGEL_API_KEY")
+        if not api_key:
+            raise ValueError("ANGEL_API_KEY not set in .env")
+        if len(sys.argv) < 2:
+            raise ValueError("usage: python order/basket.py orders.csv")
+
+        jwt_token = get_jwt_token_from_smartapi()
+        client = get_client(jwt_token, api_key)
+        report = submit_basket(load_orders_csv(sys.argv[1]), client)
+        for r in report["results"]:
+            print(r["index"], r["status"], r["orderid"] or r["message"])
+        print(f"placed {report['placed']}  rejected {report['rejected']}  "
+              f"unknown {report['unknown']}  invalid {report['invalid']}  "
+              f"in {report['latency_ms']:.0f} ms")
+
+    except (AuthError, Exception) as e:
+        print(f"Failed: {e}")
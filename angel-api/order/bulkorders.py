@@ -0,0 +1,183 @@
+# bulkorders.py
+"""
+Bulk cancel / reprice of open orders.
+
+Reads the live order book once, selects the affected open orders (by symbol,
+ordertag/strategy, exchange, side or any predicate), then sends every cancel
+or modify concurrently through the shared rate-limited client. Order
+endpoints are scheduled ahead of data traffic, so a cancel-all is bounded by
+the cancelOrder rate limit rather than by one round-trip per order.
+
+Usage:
+    python order/bulkorders.py cancel SBIN-EQ
+    python order/bulkorders.py reprice SBIN-EQ -2
+"""
+import os
+import json
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from auth_token import get_jwt_token_from_smartapi, AuthError
+from angel_client import get_client
+
+load_dotenv()  # load from .env
+
+# Order-book statuses that can still be cancelled or modified
+OPEN_STATUSES = {
+    "open", "open pending", "trigger pending", "modified", "modify pending",
+    "validation pending", "put order req received", "after market order req received",
+}
+DEFAULT_TICK = Decimal("0.05")
+
+
+def fetch_open_orders(client) -> list:
+    """One order-book read, filtered to working orders."""
+    resp = json.loads(client.get_orderbook())
+    if not resp.get("status"):
+        raise RuntimeError(f"getOrderBook failed: {resp.get('errorcode')}: {resp.get('message')}")
+    return [o for o in (resp.get("data") or []) if (o.get("status") or "").lower() in OPEN_STATUSES]
+
+
+def select_orders(orders: list, tradingsymbol: str = None, ordertag: str = None,
+                  exchange: str = None, transactiontype: str = None, predicate=None) -> list:
+    """Filters orders; every given criterion must match."""
+    out = []
+    for o in orders:
+        if tradingsymbol and o.get("tradingsymbol") != tradingsymbol:
+            continue
+        if ordertag and o.get("ordertag") != ordertag:
+            continue
+        if exchange and o.get("exchange") != exchange:
+            continue
+        if transactiontype and o.get("transactiontype") != transactiontype:
+            continue
+        if predicate and not predicate(o):
+            continue
+        out.append(o)
+    return out
+
+
+def _send(fn, order: dict) -> dict:
+    result = {"orderid": order.get("orderid"), "tradingsymbol": order.get("tradingsymbol"),
+              "status": None, "message": None, "latency_ms": 0.0}
+    t0 = time.perf_counter()
+    try:
+        resp = json.loads(fn())
+        if resp.get("status"):
+            result.update(status="ok", message=resp.get("message"))
+        else:
+            result.update(status="failed", message=f"{resp.get('errorcode')}: {resp.get('message')}")
+    except Exception as e:
+        result.update(status="unknown", message=str(e))  # may have reached the exchange
+    result["latency_ms"] = (time.perf_counter() - t0) * 1e3
+    return result
+
+
+def _run_all(calls: list, max_workers: int, t0: float, rejected: list = ()) -> dict:
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(rejected) + list(pool.map(lambda c: _send(*c), calls))
+    counts = {"ok": 0, "failed": 0, "unknown": 0}
+    for r in results:
+        counts[r["status"]] += 1
+    return {"results": results, **counts, "latency_ms": (time.perf_counter() - t0) * 1e3}
+
+
+def cancel_all(client=None, max_workers: int = 32, **filters) -> dict:
+    """
+    Cancels every open order matching filters (see select_orders) and returns
+    {"results", "ok", "failed", "unknown", "latency_ms"}. No filters cancels
+    all open orders.
+    """
+    client = client or get_client()
+    t0 = time.perf_counter()
+    targets = select_orders(fetch_open_orders(client), **filters)
+    calls = [
+        (lambda o=o: client.cancel_order(o["orderid"], variety=o.get("variety") or "NORMAL"), o)
+        for o in targets
+    ]
+    return _run_all(calls, max_workers, t0)
+
+
+def _shift(price, ticks: int, tick: Decimal) -> str:
+    p = (Decimal(str(price)) + ticks * tick) / tick
+    p = p.quantize(Decimal(1), rounding=ROUND_HALF_UP) * tick
+    if p < tick:
+        raise ValueError(f"moving {price} by {ticks} ticks gives {p}, below one tick")
+    return str(p)
+
+
+def reprice_order(order: dict, ticks: int, tick: Decimal = DEFAULT_TICK) -> dict:
+    """
+    Builds the modifyOrder payload moving a working limit order by `ticks`
+    ticks. Raises ValueError if the new price would be under one tick.
+    """
+    payload = {
+        "variety": order.get("variety") or "NORMAL",
+        "orderid": order["orderid"],
+        "ordertype": order["ordertype"],
+        "producttype": order["producttype"],
+        "duration": order["duration"],
+        "price": _shift(order["price"], ticks, tick),
+        "quantity": str(order["quantity"]),
+        "tradingsymbol": order["tradingsymbol"],
+        "symboltoken": order["symboltoken"],
+        "exchange": order["exchange"],
+    }
+    if order["ordertype"] == "STOPLOSS_LIMIT":
+        payload["triggerprice"] = _shift(order["triggerprice"], ticks, tick)
+    return payload
+
+
+def reprice_all(ticks: int, client=None, tick_sizes: dict = None, max_workers: int = 32,
+                **filters) -> dict:
+    """
+    Moves every matching open LIMIT / STOPLOSS_LIMIT order by `ticks` ticks
+    (negative = lower). tick_sizes maps symboltoken -> tick size; missing
+    tokens use DEFAULT_TICK. Orders the move would take under one tick are
+    not sent and come back as failed.
+    """
+    client = client or get_client()
+    tick_sizes = tick_sizes or {}
+    t0 = time.perf_counter()
+    targets = [
+        o for o in select_orders(fetch_open_orders(client), **filters)
+        if o.get("ordertype") in ("LIMIT", "STOPLOSS_LIMIT")
+    ]
+    calls, rejected = [], []
+    for o in targets:
+        tick = Decimal(str(tick_sizes.get(o.get("symboltoken"), DEFAULT_TICK)))
+        try:
+            payload = reprice_order(o, ticks, tick)
+        except ValueError as e:
+            # Never sent, so a known failure rather than an unknown
+            rejected.append({"orderid": o.get("orderid"), "tradingsymbol": o.get("tradingsymbol"),
+                             "status": "failed", "message": str(e), "latency_ms": 0.0})
+            continue
+        calls.append((lambda p=payload: client.modify_order(p), o))
+    return _run_all(calls, max_workers, t0, rejected)
+
+
+if __name__ == "__main__":
+    try:
+        api_key = os.getenv("ANGEL_API_KEY")
+        if not api_key:
+            raise ValueError("ANGEL_API_KEY not set in .env")
+        if len(sys.argv) < 3 or sys.argv[1] not in ("cancel", "reprice"):
+            raise ValueError("usage: bulkorders.py cancel SYMBOL | reprice SYMBOL TICKS")
+
+        jwt_token = get_jwt_token_from_smartapi()
+        client = get_client(jwt_token, api_key)
+        if sys.argv[1] == "cancel":
+            report = cancel_all(client, tradingsymbol=sys.argv[2])
+        else:
+            report = reprice_all(int(sys.argv[3]), client, tradingsymbol=sys.argv[2])
+        for r in report["results"]:
+            print(r["orderid"], r["tradingsymbol"], r["status"], r["message"])
+        print(f"ok {report['ok']}  failed {report['failed']}  unknown {report['unknown']}  "
+              f"in {report['latency_ms']:.0f} ms")
+
+    except (AuthError, Exception) as e:
+        print(f"Failed: {e}")
@@ -1,36 +1,15 @@
 # cancel_order.py
 import os
-import http.client
-import json
 from dotenv import load_dotenv
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_token import get_jwt_token_from_smartapi, AuthError
+from angel_client import get_client
 
 load_dotenv()  # load from .env
-API_HOST = "apiconnect.angelone.in"
 
 def cancel_order(jwt_token: str, api_key: str) -> str:
-    conn = http.client.HTTPSConnection(API_HOST)
-    payload = json.dumps({
-"variety":"NORMAL",
-"orderid":"250402000297497"
-})
-    headers = {
-        "Authorization": f"{jwt_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-UserType": "USER",
-        "X-SourceID": "WEB",
-        "X-ClientLocalIP": "CLIENT_LOCAL_IP",
-        "X-ClientPublicIP": "CLIENT_PUBLIC_IP",
-        "X-MACAddress": "MAC_ADDRESS",
-        "X-PrivateKey": api_key,
-    }
-     
-    conn.request("POST", "/rest/secure/angelbroking/order/v1/cancelOrder", payload, headers)
-    res = conn.getresponse()
-    return res.read().decode("utf-8")
+    return get_client(jwt_token, api_key).cancel_order("250402000297497", variety="NORMAL")
 
 if __name__ == "__main__":
     try:
@@ -1,38 +1,28 @@
 
 # get_LtpData.py
 import os
-import http.client
-import json
 from dotenv import load_dotenv
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_token import get_jwt_token_from_smartapi, AuthError
+from angel_client import get_client
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+from quote_cache import angel_quotes
 
 load_dotenv()  # load from .env
-API_HOST = "apiconnect.angelone.in"
 
 def get_LtpData(jwt_token: str, api_key: str) -> str:
-    conn = http.client.HTTPSConnection(API_HOST)
-    payload = json.dumps({
- "exchange":"NSE",
- "tradingsymbol":"SBIN-EQ",
- "symboltoken":"3045"
-})
-    headers = {
-        "Authorization": f"{jwt_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-UserType": "USER",
-        "X-SourceID": "WEB",
-        "X-ClientLocalIP": "CLIENT_LOCAL_IP",
-        "X-ClientPublicIP": "CLIENT_PUBLIC_IP",
-        "X-MACAddress": "MAC_ADDRESS",
-        "X-PrivateKey": api_key,
-    }
-     
-    conn.request("POST", "/rest/secure/angelbroking/order/v1/getLtpData", payload, headers)
-    res = conn.getresponse()
-    return res.read().decode("utf-8")
+    return get_client(jwt_token, api_key).get_ltp_data("NSE", "SBIN-EQ", "3045")
+
+_quote_caches = {}
+
+def get_quotes(jwt_token: str, api_key: str, keys: list, mode: str = "LTP") -> dict:
+    # Many "EXCHANGE:SYMBOLTOKEN" keys at once: 50 per request, cached for 250 ms
+    client = get_client(jwt_token, api_key)
+    cache = _quote_caches.get((client, mode))
+    if cache is None:
+        cache = _quote_caches[(client, mode)] = angel_quotes(client, mode)
+    return cache.get(keys)
 
 if __name__ == "__main__":
     try:
@@ -44,6 +34,8 @@ if __name__ == "__main__":
         print(jwt_token)
         portfolio = get_LtpData(jwt_token, api_key)
         print(portfolio)
+        for key, quote in get_quotes(jwt_token, api_key, ["NSE:3045", "NSE:2885", "NSE:1594"]).items():
+            print(key, quote["ltp"])
 
     except (AuthError, Exception) as e:
         print(f"Failed: {e}")
\ No newline at end of file
@@ -1,46 +1,33 @@
 # place_order.py
 import os
-import http.client
-import json
 from dotenv import load_dotenv
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_token import get_jwt_token_from_smartapi, AuthError
+from angel_client import get_client
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+from risk_gate import RiskGate, GatedClient
 
 load_dotenv()  # load from .env
-API_HOST = "apiconnect.angelone.in"
 
-def place_order(jwt_token: str, api_key: str) -> str:
-    conn = http.client.HTTPSConnection(API_HOST)
-    payload = json.dumps({
-"variety":"NORMAL",
-"tradingsymbol":"SBIN-EQ",
-"symboltoken":"3045",
-"transactiontype":"BUY",
-"exchange":"NSE",
-"ordertype":"LIMIT",
-"producttype":"INTRADAY",
-"duration":"DAY",
-"price":"700",
-"squareoff":"0",
-"stoploss":"0",
-"quantity":"1"
-})
-    headers = {
-        "Authorization": f"{jwt_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-UserType": "USER",
-        "X-SourceID": "WEB",
-        "X-ClientLocalIP": "CLIENT_LOCAL_IP",
-        "X-ClientPublicIP": "CLIENT_PUBLIC_IP",
-        "X-MACAddress": "MAC_ADDRESS",
-        "X-PrivateKey": api_key,
-    }
-     
-    conn.request("POST", "/rest/secure/angelbroking/order/v1/placeOrder", payload, headers)
-    res = conn.getresponse()
-    return res.read().decode("utf-8")
+def place_order(jwt_token: str, api_key: str, gate: RiskGate = None) -> str:
+    client = get_client(jwt_token, api_key)
+    if gate is not None:
+        client = GatedClient(client, gate)  # raises RiskRejected before anything is sent
+    return client.place_order({
+        "variety": "NORMAL",
+        "tradingsymbol": "SBIN-EQ",
+        "symboltoken": "3045",
+        "transactiontype": "BUY",
+        "exchange": "NSE",
+        "ordertype": "LIMIT",
+        "producttype": "INTRADAY",
+        "duration": "DAY",
+        "price": "700",
+        "squareoff": "0",
+        "stoploss": "0",
+        "quantity": "1",
+    })
 
 if __name__ == "__main__":
     try:
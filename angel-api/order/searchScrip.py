@@ -1,36 +1,21 @@
 # search_scrip.py
 import os
-import http.client
-import json
 from dotenv import load_dotenv
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_token import get_jwt_token_from_smartapi, AuthError
+from angel_client import get_client
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+from instruments import load_master
 
 load_dotenv()  # load from .env
-API_HOST = "apiconnect.angelone.in"
 
 def search_scrip(jwt_token: str, api_key: str) -> str:
-    conn = http.client.HTTPSConnection(API_HOST)
-    payload = json.dumps({
-     "exchange": "NSE",
-     "searchscrip": "SBIN"
-})
-    headers = {
-        "Authorization": f"{jwt_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-UserType": "USER",
-        "X-SourceID": "WEB",
-        "X-ClientLocalIP": "CLIENT_LOCAL_IP",
-        "X-ClientPublicIP": "CLIENT_PUBLIC_IP",
-        "X-MACAddress": "MAC_ADDRESS",
-        "X-PrivateKey": api_key,
-    }
-     
-    conn.request("POST", "/rest/secure/angelbroking/order/v1/searchScrip", payload, headers)
-    res = conn.getresponse()
-    return res.read().decode("utf-8")
+    return get_client(jwt_token, api_key).search_scrip("NSE", "SBIN")
+
+def search_scrip_local(exchange: str, searchscrip: str, limit: int = 20) -> list:
+    # Same lookup against the daily-cached Angel instrument master; no network call
+    return load_master("angel").search(searchscrip, exchange=exchange, limit=limit)
 
 if __name__ == "__main__":
     try:
@@ -1,32 +1,21 @@
 # get_position.py
 import os
-import http.client
 from dotenv import load_dotenv
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_token import get_jwt_token_from_smartapi, AuthError
+from angel_client import get_client
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+from portfolio import angel_portfolio
 
 load_dotenv()  # load from .env
-API_HOST = "apiconnect.angelone.in"
 
 def get_position(jwt_token: str, api_key: str) -> str:
-    conn = http.client.HTTPSConnection(API_HOST)
-    payload = ""
-    headers = {
-        "Authorization": f"{jwt_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-UserType": "USER",
-        "X-SourceID": "WEB",
-        "X-ClientLocalIP": "CLIENT_LOCAL_IP",
-        "X-ClientPublicIP": "CLIENT_PUBLIC_IP",
-        "X-MACAddress": "MAC_ADDRESS",
-        "X-PrivateKey": api_key,
-    }
-     
-    conn.request("GET", "/rest/secure/angelbroking/order/v1/getPosition", payload, headers)
-    res = conn.getresponse()
-    return res.read().decode("utf-8")
+    return get_client(jwt_token, api_key).get_position()
+
+def get_live_portfolio(jwt_token: str, api_key: str, funds: float = 0.0):
+    # Seeded once from holdings + positions; feed it ticks (update_array) instead of re-polling
+    return angel_portfolio(get_client(jwt_token, api_key), funds)
 
 if __name__ == "__main__":
     try:
@@ -38,6 +27,7 @@ if __name__ == "__main__":
         print(jwt_token)
         portfolio = get_position(jwt_token, api_key)
         print(portfolio)
+        print(get_live_portfolio(jwt_token, api_key).summary())
 
     except (AuthError, Exception) as e:
         print(f"Failed: {e}")
@@ -0,0 +1,430 @@
+# ratelimit.py
+"""
+Per-endpoint token-bucket rate limiting and request scheduling for Angel REST.
+
+Every endpoint gets one token bucket per published limit window (per second,
+per minute, per hour). A bucket holds a small burst and refills at the rest
+of the window's budget, so that burst plus refill never passes SAFETY times
+the limit in any window of that length, even right after a full bucket.
+Requests wait in the scheduler until all of their
+endpoint's buckets have a token and an in-flight slot is free; waiting
+requests are granted in (priority, arrival) order, so order traffic
+(placeOrder / modifyOrder / cancelOrder) overtakes queued data requests.
+
+With shared=True the bucket state lives in a small memory-mapped file keyed
+by API key and guarded by an OS file lock, so several processes using the
+same key draw from one budget.
+
+Usage:
+    scheduler = get_scheduler(api_key)
+    with scheduler.slot("getLtpData"):
+        ...send the request...
+    print(scheduler.report())
+"""
+import os
+import sys
+import time
+import mmap
+import struct
+import asyncio
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager, asynccontextmanager
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Angel SmartAPI published limits: endpoint -> [(requests, per_seconds), ...]
+LIMITS = {
+    "placeOrder":      [(20, 1), (500, 60), (1000, 3600)],
+    "modifyOrder":     [(20, 1), (500, 60), (1000, 3600)],
+    "cancelOrder":     [(20, 1), (500, 60), (1000, 3600)],
+    "getLtpData":      [(10, 1), (500, 60), (5000, 3600)],
+    "quote":           [(10, 1), (500, 60), (5000, 3600)],
+    "getCandleData":   [(3, 1), (180, 60), (5000, 3600)],
+    "getOrderBook":    [(1, 1)],
+    "getTradeBook":    [(1, 1)],
+    "getPosition":     [(1, 1)],
+    "getAllHolding":   [(1, 1)],
+    "searchScrip":     [(1, 1)],
+    "gainersLosers":   [(1, 1)],
+    "estimateCharges": [(1, 1)],
+}
+SAFETY = 0.9  # run buckets slightly under the published rate
+BURST = 0.25  # share of a window's budget that may go out back to back
+
+PRIORITY_ORDER = 0
+PRIORITY_DATA = 1
+ORDER_ENDPOINTS = {"placeOrder", "modifyOrder", "cancelOrder"}
+
+_MAGIC = b"ANGELRL1"
+
+
+class _Buckets:
+    """
+    Token buckets for every (endpoint, window) pair, stored as (tokens, last)
+    doubles. In shared mode the array is an mmap'd file and every update
+    happens under an exclusive file lock.
+    """
+
+    def __init__(self, limits: dict, path: str = None, clock=time.time):
+        self.slots = {}
+        self.params = []  # slot -> (capacity, refill_per_second)
+        self._clock = clock
+        for endpoint in sorted(limits):
+            idx = []
+            for count, per in limits[endpoint]:
+                idx.append(len(self.params))
+                self.params.append(self._bucket(count, per))
+            self.slots[endpoint] = idx
+
+        size = 16 * len(self.params)
+        self.path = path
+        self._fh = None
+        if path is None:
+            self._buf = bytearray(size)
+            self._init_state()
+            return
+
+        layout = hashlib.sha1(repr(self.params).encode()).digest()[:8]
+        self._fh = open(path, "a+b")
+        with self._locked():
+            self._fh.seek(0)
+            header = self._fh.read(16)
+            if header != _MAGIC + layout or os.path.getsize(path) != 16 + size:
+                # New file, or written with different limits: start fresh
+                self._fh.seek(0)
+                self._fh.truncate()
+                self._fh.write(_MAGIC + layout + bytes(size))
+                self._fh.flush()
+                fresh = True
+            else:
+                fresh = False
+            self._map = mmap.mmap(self._fh.fileno(), 16 + size)
+            self._buf = memoryview(self._map)[16:]
+            if fresh:
+                self._init_state()
+
+    @staticmethod
+    def _bucket(count: int, per: float) -> tuple:
+        """
+        (capacity, refill) admitting at most count * SAFETY requests in any
+        `per` seconds: a full bucket plus a window of refill is capacity +
+        refill * per.
+        """
+        budget = count * SAFETY
+        capacity = max(1.0, float(int(budget * BURST)))
+        if budget > capacity:
+            return capacity, (budget - capacity) / per
+        # Under two requests per window: one token, refilled in just over
+        # `per` seconds, so never two inside one window
+        return 1.0, budget / per
+
+    def _init_state(self):
+        now = self._clock()
+        for i, (capacity, _) in enumerate(self.params):
+            struct.pack_into("dd", self._buf, 16 * i, capacity, now)
+
+    @contextmanager
+    def _locked(self):
+        if self._fh is None:
+            yield
+            return
+        fd = self._fh.fileno()
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def try_take(self, endpoint: str) -> float:
+        """Takes one token from each of the endpoint's buckets, or none of them.
+        Returns 0.0 on success, else seconds until the scarcest bucket refills."""
+        slots = self.slots.get(endpoint)
+        if not slots:
+            return 0.0  # unknown endpoint: not limited
+        buf, params = self._buf, self.params
+        with self._locked():
+            now = self._clock()
+            state = []
+            wait = 0.0
+            for i in slots:
+                capacity, refill = params[i]
+                tokens, last = struct.unpack_from("dd", buf, 16 * i)
+                tokens = min(capacity, tokens + (now - last) * refill)
+                state.append(tokens)
+                if tokens < 1.0:
+                    wait = max(wait, (1.0 - tokens) / refill)
+            if wait:
+                return wait
+            for i, tokens in zip(slots, state):
+                struct.pack_into("dd", buf, 16 * i, tokens - 1.0, now)
+            return 0.0
+
+    def close(self):
+        if self._fh is not None:
+            self._buf.release()
+            self._map.close()
+            self._fh.close()
+            self._fh = None
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq", "endpoint", "enqueued", "granted", "future", "loop")
+
+    def __init__(self, priority, seq, endpoint):
+        self.priority = priority
+        self.seq = seq
+        self.endpoint = endpoint
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.future = None
+        self.loop = None
+
+
+class _EndpointStats:
+    __slots__ = ("waiting", "granted", "total_wait", "max_wait", "waits")
+
+    def __init__(self, endpoint: str):
+        self.waiting = 0
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.waits = REGISTRY.histogram("ratelimit_wait_seconds", endpoint=endpoint)
+
+
+class RequestScheduler:
+    """
+    Grants request slots within per-endpoint rate limits and an overall
+    in-flight cap. Thread-safe; slot() blocks, aslot() awaits.
+    """
+
+    def __init__(self, limits: dict = None, max_in_flight: int = 8, state_path: str = None):
+        self.limits = dict(limits or LIMITS)
+        self.max_in_flight = max_in_flight
+        self._buckets = _Buckets(self.limits, state_path)
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._in_flight = 0
+        self._seq = 0
+        self._timer = None
+        self._stats = {}
+
+    # ---- dispatch ----
+    def _dispatch(self):
+        """Grants slots to eligible waiters in priority order. Holds self._cond."""
+        if not self._waiting:
+            return
+        blocked = set()  # FIFO per endpoint: a blocked head blocks its followers
+        next_wake = 0.0
+        granted_any = False
+        for t in sorted(self._waiting, key=lambda t: (t.priority, t.seq)):
+            if self._in_flight >= self.max_in_flight:
+                next_wake = 0.0  # the next release() re-dispatches
+                break
+            if t.endpoint in blocked:
+                continue
+            wait = self._buckets.try_take(t.endpoint)
+            if wait:
+                blocked.add(t.endpoint)
+                if not next_wake or wait < next_wake:
+                    next_wake = wait
+                continue
+            self._grant(t)
+            granted_any = True
+        if granted_any:
+            self._waiting = [t for t in self._waiting if not t.granted]
+            self._cond.notify_all()
+        if next_wake and self._timer is None:
+            # Wake up once when the scarcest bucket refills, instead of
+            # every waiter polling on its own timeout.
+            self._timer = threading.Timer(next_wake, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self):
+        with self._cond:
+            self._timer = None
+            self._dispatch()
+
+    def _grant(self, t: _Ticket):
+        t.granted = True
+        self._in_flight += 1
+        waited = time.monotonic() - t.enqueued
+        s = self._stats[t.endpoint]
+        s.waiting -= 1
+        s.granted += 1
+        s.total_wait += waited
+        if waited > s.max_wait:
+            s.max_wait = waited
+        s.waits.record(int(waited * 1e9))
+        if t.future is not None:
+            t.loop.call_soon_threadsafe(_resolve, t.future)
+
+    def _enqueue(self, endpoint: str, priority, loop=None) -> _Ticket:
+        if priority is None:
+            priority = PRIORITY_ORDER if endpoint in ORDER_ENDPOINTS else PRIORITY_DATA
+        self._seq += 1
+        t = _Ticket(priority, self._seq, endpoint)
+        if loop is not None:
+            t.loop = loop
+            t.future = loop.create_future()
+        s = self._stats.get(endpoint)
+        if s is None:
+            s = self._stats[endpoint] = _EndpointStats(endpoint)
+        s.waiting += 1
+        self._waiting.append(t)
+        self._dispatch()
+        return t
+
+    def _abandon(self, t: _Ticket):
+        """Gives back a ticket whose waiter was interrupted. Holds self._cond."""
+        if t.granted:
+            self._in_flight -= 1
+            self._dispatch()
+        elif t in self._waiting:
+            self._waiting.remove(t)
+            self._stats[t.endpoint].waiting -= 1
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._dispatch()
+
+    # ---- public ----
+    def acquire(self, endpoint: str, priority: int = None):
+        """Blocks until a slot for endpoint is granted. Pair with release()."""
+        with self._cond:
+            t = self._enqueue(endpoint, priority)
+            try:
+                while not t.granted:
+                    self._cond.wait()
+            except BaseException:
+                self._abandon(t)
+                raise
+
+    def release(self):
+        self._release()
+
+    @contextmanager
+    def slot(self, endpoint: str, priority: int = None):
+        self.acquire(endpoint, priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, endpoint: str, priority: int = None):
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            t = self._enqueue(endpoint, priority, loop)
+        try:
+            await t.future
+        except BaseException:
+            with self._cond:
+                self._abandon(t)
+            raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        """endpoint -> {queue_depth, granted, avg_wait_ms, max_wait_ms}, plus in_flight."""
+        with self._cond:
+            out = {
+                ep: {
+                    "queue_depth": s.waiting,
+                    "granted": s.granted,
+                    "avg_wait_ms": (s.total_wait / s.granted * 1e3) if s.granted else 0.0,
+                    "max_wait_ms": s.max_wait * 1e3,
+                }
+                for ep, s in self._stats.items()
+            }
+            out["in_flight"] = self._in_flight
+            return out
+
+    def report(self) -> str:
+        stats = self.stats()
+        lines = [f"in flight: {stats.pop('in_flight')}"]
+        for ep, s in sorted(stats.items()):
+            lines.append(
+                f"{ep:<16} queued {s['queue_depth']:>4}  granted {s['granted']:>6}  "
+                f"avg wait {s['avg_wait_ms']:8.1f} ms  max wait {s['max_wait_ms']:8.1f} ms"
+            )
+        return "\n".join(lines)
+
+    def close(self):
+        self._buckets.close()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(api_key: str, max_in_flight: int = 8, shared: bool = True) -> RequestScheduler:
+    """
+    Returns the process-wide scheduler for api_key. With shared=True the
+    bucket state is kept in a temp-dir file so every process using the same
+    key shares one budget.
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(api_key)
+        if scheduler is None:
+            state_path = None
+            if shared:
+                digest = hashlib.sha1(api_key.encode()).hexdigest()[:12]
+                state_path = os.path.join(tempfile.gettempdir(), f"angel-ratelimit-{digest}.bin")
+            scheduler = _schedulers[api_key] = RequestScheduler(
+                max_in_flight=max_in_flight, state_path=state_path
+            )
+        return scheduler
+
+
+if __name__ == "__main__":
+    import numpy as np
+
+    # Fake clock: send each request the moment the buckets allow it, then
+    # count what was admitted in every sliding window of each published limit
+    for endpoint, windows in LIMITS.items():
+        clock = [0.0]
+        buckets = _Buckets({endpoint: windows}, clock=lambda: clock[0])
+        horizon = 2 * max(per for _, per in windows)
+        sent = []
+        while clock[0] < horizon:
+            wait = buckets.try_take(endpoint)
+            if wait:
+                clock[0] += wait + 1e-9
+            else:
+                sent.append(clock[0])
+        sent = np.array(sent)
+        for count, per in windows:
+            most = int((np.searchsorted(sent, sent + per - 1e-9) - np.arange(len(sent))).max())
+            assert most <= max(1, int(count * SAFETY)), (endpoint, count, per, most)
+            print(f"{endpoint:<16} {count:>5}/{per:<5} s: at most {most:>5} in any window")
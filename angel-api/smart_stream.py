@@ -0,0 +1,516 @@
+# smart_stream.py
+"""
+Angel One SmartWebSocketV2 market-data stream with the KiteTicker interface.
+
+Instead of polling getLtpData symbol by symbol, SmartStream keeps one
+websocket to Angel's smart-stream feed, authenticated with the session's
+JWT and feedToken (auth_token.py), and pushes every tick as it arrives.
+
+    - same callbacks and methods as KiteTicker (on_connect, on_ticks,
+      on_message, on_close, on_error, on_reconnect, on_noreconnect,
+      subscribe, unsubscribe, set_mode, connect, close), so ticker code
+      written for Kite runs against Angel
+    - on_ticks_array(ws, ticks) gets the ticks decoded into tick_decoder's
+      TICK_DTYPE (TickRing / BarAggregator ready); on_ticks dicts are only
+      built when on_ticks is set
+    - every frame already read from the socket is decoded as one batch, so
+      a burst costs one NumPy pass instead of one call per packet
+    - plain stdlib sockets (no websocket-client / twisted), a "ping" every
+      10 s, and reconnect with backoff that resubscribes all tokens
+
+Tokens are Angel symboltokens: ints/strings use the default exchange,
+(exchange, token) tuples or "NFO:43854" pick another one.
+
+Usage:
+    stream = get_stream()
+    stream.on_ticks_array = lambda ws, ticks: print(ticks["token"], ticks["ltp"])
+    stream.on_connect = lambda ws, response: ws.subscribe([3045, 1594])
+    stream.connect(threaded=True)
+"""
+import os
+import ssl
+import json
+import time
+import base64
+import socket
+import struct
+import hashlib
+import threading
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from angel_packets import ANGEL_MODES, EXCHANGE_TYPES, EXCHANGE_OF, AngelDecoder, parse_packet
+from kite_packets import MODE_LTP, MODE_QUOTE, MODE_FULL
+from metrics import REGISTRY
+
+load_dotenv()  # load from .env
+STREAM_URL = "wss://smartapisocket.angelone.in/smart-stream"
+HEARTBEAT_INTERVAL = 10.0  # seconds between "ping"s
+MAX_TOKENS = 1000          # subscriptions per connection
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONT, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+# ---- RFC 6455 framing (shared with bench/ws_standin.py) ----
+def accept_key(key: str) -> str:
+    return base64.b64encode(hashlib.sha1(key.encode() + _GUID).digest()).decode()
+
+
+def _mask(payload: bytes, key: bytes) -> bytes:
+    n = len(payload)
+    mask = int.from_bytes((key * (n // 4 + 1))[:n], "big")
+    return (int.from_bytes(payload, "big") ^ mask).to_bytes(n, "big")
+
+
+def encode_frame(opcode: int, payload: bytes, mask: bool) -> bytes:
+    """One final frame; clients must mask, servers must not."""
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x80 | opcode, n | (0x80 if mask else 0))
+    elif n < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126 | (0x80 if mask else 0), n)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127 | (0x80 if mask else 0), n)
+    if not mask:
+        return header + payload
+    key = os.urandom(4)
+    return header + key + _mask(payload, key)
+
+
+def decode_frames(buf: bytearray) -> tuple:
+    """Complete frames at the start of buf -> ([(fin, opcode, payload)], bytes consumed)."""
+    frames, pos, end = [], 0, len(buf)
+    while end - pos >= 2:
+        b0, b1 = buf[pos], buf[pos + 1]
+        n, head = b1 & 0x7F, 2
+        if n == 126:
+            if end - pos < 4:
+                break
+            n, head = struct.unpack_from("!H", buf, pos + 2)[0], 4
+        elif n == 127:
+            if end - pos < 10:
+                break
+            n, head = struct.unpack_from("!Q", buf, pos + 2)[0], 10
+        masked = b1 & 0x80
+        start = pos + head + (4 if masked else 0)
+        if end < start + n:
+            break
+        payload = bytes(buf[start:start + n])
+        if masked:
+            payload = _mask(payload, bytes(buf[start - 4:start]))
+        frames.append((b0 & 0x80, b0 & 0x0F, payload))
+        pos = start + n
+    return frames, pos
+
+
+class WebSocket:
+    """Minimal blocking websocket client: handshake, send, batched receive."""
+
+    def __init__(self, url: str, headers: dict = None, timeout: float = 10.0, context=None):
+        self.url = urlsplit(url)
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.context = context
+        self.sock = None
+        self._buf = bytearray()
+        self._fragments = []
+        self._send_lock = threading.Lock()
+
+    def connect(self):
+        u = self.url
+        secure = u.scheme == "wss"
+        port = u.port or (443 if secure else 80)
+        sock = socket.create_connection((u.hostname, port), self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if secure:
+            sock = (self.context or ssl.create_default_context()).wrap_socket(sock, server_hostname=u.hostname)
+        key = base64.b64encode(os.urandom(16)).decode()
+        lines = [f"GET {u.path or '/'}{'?' + u.query if u.query else ''} HTTP/1.1",
+                 f"Host: {u.hostname}:{port}", "Upgrade: websocket", "Connection: Upgrade",
+                 f"Sec-WebSocket-Key: {key}", "Sec-WebSocket-Version: 13"]
+        lines += [f"{k}: {v}" for k, v in self.headers.items()]
+        sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode())
+        response = b""
+        while b"\r\n\r\n" not in response:
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("connection closed during websocket handshake")
+            response += chunk
+        head, _, rest = response.partition(b"\r\n\r\n")
+        status = head.split(b"\r\n", 1)[0].decode(errors="replace")
+        if " 101 " not in status + " ":
+            sock.close()
+            raise ConnectionError(f"websocket handshake rejected: {status}")
+        if accept_key(key).encode() not in head:
+            sock.close()
+            raise ConnectionError("websocket handshake: bad Sec-WebSocket-Accept")
+        self._buf = bytearray(rest)
+        self.sock = sock
+
+    def send(self, payload, opcode: int = None):
+        if opcode is None:
+            opcode = OP_TEXT if isinstance(payload, str) else OP_BINARY
+        if isinstance(payload, str):
+            payload = payload.encode()
+        with self._send_lock:
+            self.sock.sendall(encode_frame(opcode, payload, mask=True))
+
+    def recv_frames(self, timeout: float) -> list:
+        """
+        Blocks up to timeout for data, then returns every complete message
+        buffered so far as [(opcode, payload)]; pings are answered here.
+        """
+        frames, used = decode_frames(self._buf)
+        if not frames:
+            self.sock.settimeout(timeout)
+            try:
+                chunk = self.sock.recv(1 << 16)
+            except socket.timeout:
+                return []
+            if not chunk:
+                raise ConnectionError("connection closed by server")
+            self._buf += chunk
+            frames, used = decode_frames(self._buf)
+        del self._buf[:used]
+        messages = []
+        for fin, opcode, payload in frames:
+            if opcode == OP_PING:
+                self.send(payload, OP_PONG)
+            elif opcode == OP_PONG:
+                continue
+            elif not fin or (opcode == OP_CONT and self._fragments):
+                self._fragments.append((opcode, payload))
+                if fin:
+                    first = self._fragments[0][0]
+                    messages.append((first, b"".join(p for _, p in self._fragments)))
+                    self._fragments = []
+            else:
+                messages.append((opcode, payload))
+        return messages
+
+    def close(self, code: int = 1000, reason: str = ""):
+        sock, self.sock = self.sock, None
+        if sock is None:
+            return
+        try:
+            with self._send_lock:
+                sock.sendall(encode_frame(OP_CLOSE, struct.pack("!H", code) + reason.encode(), mask=True))
+        except OSError:
+            pass
+        try:
+            sock.shutdown(socket.SHUT_RDWR)  # wakes a recv() blocked in another thread
+        except OSError:
+            pass
+        sock.close()
+
+
+class SmartStream:
+    MODE_LTP = MODE_LTP
+    MODE_QUOTE = MODE_QUOTE
+    MODE_FULL = MODE_FULL  # SnapQuote
+
+    def __init__(self, jwt_token: str, api_key: str, client_code: str, feed_token: str,
+                 url: str = STREAM_URL, exchange: str = "NSE", context=None,
+                 heartbeat: float = HEARTBEAT_INTERVAL, timeout: float = 10.0):
+        self.url = url
+        self.headers = {
+            "Authorization": jwt_token,
+            "x-api-key": api_key,
+            "x-client-code": client_code,
+            "x-feed-token": feed_token,
+        }
+        self.exchange_type = self._exchange_type(exchange)
+        self.context = context
+        self.heartbeat = heartbeat
+        self.timeout = timeout
+        self.subscribed = {}  # (exchange_type, token) -> mode
+        self.decoder = AngelDecoder()
+        self.stats = {"messages": 0, "ticks": 0, "batches": 0, "connects": 0, "errors": 0}
+
+        self.on_connect = None
+        self.on_ticks = None
+        self.on_ticks_array = None
+        self.on_message = None
+        self.on_close = None
+        self.on_error = None
+        self.on_reconnect = None
+        self.on_noreconnect = None
+        self.on_order_update = None
+
+        self._ws = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._correlation = 0
+
+    # ---- tokens ----
+    @staticmethod
+    def _exchange_type(exchange) -> int:
+        if isinstance(exchange, int):
+            return exchange
+        return EXCHANGE_OF.get(exchange) or EXCHANGE_TYPES[exchange]
+
+    def _key(self, token) -> tuple:
+        if isinstance(token, tuple):
+            return self._exchange_type(token[0]), str(int(token[1]))
+        if isinstance(token, str) and ":" in token:
+            exchange, token = token.split(":", 1)
+            return self._exchange_type(exchange), str(int(token))
+        return self.exchange_type, str(int(token))
+
+    def _request(self, action: int, mode: str, keys: list):
+        """Sends one (un)subscribe message for keys, grouped by exchange."""
+        by_exchange = {}
+        for exchange_type, token in keys:
+            by_exchange.setdefault(exchange_type, []).append(token)
+        self._correlation += 1
+        self._ws.send(json.dumps({
+            "correlationID": f"ks{self._correlation:08d}",
+            "action": action,
+            "params": {"mode": ANGEL_MODES[mode],
+                       "tokenList": [{"exchangeType": e, "tokens": t} for e, t in by_exchange.items()]},
+        }))
+
+    def _send(self, action: int, by_mode: dict):
+        if not self.is_connected():
+            return  # sent on (re)connect
+        try:
+            for mode, keys in by_mode.items():
+                self._request(action, mode, keys)
+        except OSError as e:
+            self._fail(e)
+
+    # ---- KiteTicker interface ----
+    def subscribe(self, instrument_tokens: list, mode: str = MODE_QUOTE) -> bool:
+        return self.set_mode(mode, instrument_tokens)
+
+    def set_mode(self, mode: str, instrument_tokens: list) -> bool:
+        """Subscribes tokens in mode; a token in another mode is moved (unsubscribe + subscribe)."""
+        if mode not in ANGEL_MODES:
+            raise ValueError(f"unknown mode {mode!r}")
+        with self._lock:
+            keys = [self._key(t) for t in instrument_tokens]
+            new = {k for k in keys if k not in self.subscribed}
+            if len(self.subscribed) + len(new) > MAX_TOKENS:
+                raise ValueError(f"{len(self.subscribed) + len(new)} tokens exceed {MAX_TOKENS} per connection")
+            old, send = {}, []
+            for k in keys:
+                current = self.subscribed.get(k)
+                if current == mode:
+                    continue
+                if current is not None:
+                    old.setdefault(current, []).append(k)
+                self.subscribed[k] = mode
+                send.append(k)
+            self._send(0, old)
+            self._send(1, {mode: send} if send else {})
+        return True
+
+    def unsubscribe(self, instrument_tokens: list) -> bool:
+        with self._lock:
+            by_mode = {}
+            for k in map(self._key, instrument_tokens):
+                mode = self.subscribed.pop(k, None)
+                if mode is not None:
+                    by_mode.setdefault(mode, []).append(k)
+            self._send(0, by_mode)
+        return True
+
+    def resubscribe(self):
+        with self._lock:
+            by_mode = {}
+            for k, mode in self.subscribed.items():
+                by_mode.setdefault(mode, []).append(k)
+            self._send(1, by_mode)
+
+    def is_connected(self) -> bool:
+        return self._ws is not None and self._ws.sock is not None
+
+    def connect(self, threaded: bool = False, disable_ssl_verification: bool = False, proxy=None,
+                reconnect: bool = True, reconnect_interval: float = 5, reconnect_max_tries: int = 50,
+                reconnect_tries: int = None):
+        """Like KiteTicker.connect; blocks unless threaded. proxy is not supported."""
+        if disable_ssl_verification:
+            self.context = ssl._create_unverified_context()
+        args = (reconnect, reconnect_interval, reconnect_tries or reconnect_max_tries)
+        self._stop.clear()
+        if threaded:
+            self._thread = threading.Thread(target=self._run, args=args, name="smart-stream", daemon=True)
+            self._thread.start()
+        else:
+            self._run(*args)
+
+    def close(self, code: int = 1000, reason: str = None):
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            ws.close(code, reason or "")
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(self.timeout)
+
+    def stop(self):
+        self.close()
+
+    def stop_retry(self):
+        self._stop.set()
+
+    # ---- connection loop ----
+    def _fail(self, error):
+        """A send failed: drop the socket; the receive loop reconnects."""
+        self.stats["errors"] += 1
+        if self.on_error:
+            self.on_error(self, 1006, str(error))
+        ws = self._ws
+        if ws is not None:
+            ws.close(1011, "send failed")
+
+    def _run(self, reconnect: bool, interval: float, max_tries: int):
+        attempts = 0
+        while not self._stop.is_set():
+            ws = WebSocket(self.url, self.headers, self.timeout, self.context)
+            try:
+                ws.connect()
+            except OSError as e:
+                self.stats["errors"] += 1
+                if self.on_error:
+                    self.on_error(self, None, str(e))
+            else:
+                attempts = 0
+                self.stats["connects"] += 1
+                self._ws = ws
+                code, reason = self._session(ws)
+                if self.on_close:
+                    self.on_close(self, code, reason)
+            if self._stop.is_set() or not reconnect:
+                break
+            attempts += 1
+            if attempts > max_tries:
+                if self.on_noreconnect:
+                    self.on_noreconnect(self)
+                break
+            if self.on_reconnect:
+                self.on_reconnect(self, attempts)
+            self._stop.wait(min(interval * 2 ** (attempts - 1), 60))
+        self._ws = None
+
+    def _session(self, ws) -> tuple:
+        """Runs one connection until it drops; returns (code, reason) for on_close."""
+        self.resubscribe()
+        if self.on_connect:
+            self.on_connect(self, {"url": self.url})
+        last_ping = last_seen = time.monotonic()
+        try:
+            while not self._stop.is_set() and ws.sock is not None:
+                now = time.monotonic()
+                if now - last_ping >= self.heartbeat:
+                    ws.send("ping")
+                    last_ping = now
+                if now - last_seen > 3 * self.heartbeat:
+                    return 1006, "no data or pong within 3 heartbeats"
+                messages = ws.recv_frames(max(last_ping + self.heartbeat - now, 0.01))
+                if messages:
+                    last_seen = time.monotonic()
+                    closed = self._dispatch(messages)
+                    if closed:
+                        return closed
+        except (OSError, AttributeError) as e:  # AttributeError: socket closed under us
+            if self._stop.is_set() or ws.sock is None:
+                return 1000 if self._stop.is_set() else 1006, "closed"
+            self.stats["errors"] += 1
+            if self.on_error:
+                self.on_error(self, 1006, str(e))
+            return 1006, str(e)
+        finally:
+            ws.close()
+            if self._ws is ws:
+                self._ws = None
+        return (1000, "closed") if self._stop.is_set() else (1006, "connection dropped")
+
+    def _dispatch(self, messages: list):
+        packets = []
+        for opcode, payload in messages:
+            if opcode == OP_BINARY:
+                packets.append(payload)
+                if self.on_message:
+                    self.on_message(self, payload, True)
+            elif opcode == OP_TEXT:
+                text = payload.decode(errors="replace")
+                if text == "pong":
+                    continue
+                if self.on_message:
+                    self.on_message(self, text, False)
+                if "errorCode" in text and self.on_error:
+                    try:
+                        error = json.loads(text)
+                        self.on_error(self, error.get("errorCode"), error.get("errorMessage"))
+                    except ValueError:
+                        self.on_error(self, None, text)
+            elif opcode == OP_CLOSE:
+                code = struct.unpack_from("!H", payload)[0] if len(payload) >= 2 else 1005
+                return code, payload[2:].decode(errors="replace")
+        if not packets:
+            return None
+        self.stats["messages"] += len(packets)
+        self.stats["batches"] += 1
+        if self.on_ticks_array:
+            ticks = self.decoder.decode(packets)
+            self.stats["ticks"] += len(ticks)
+            if len(ticks):
+                REGISTRY.tick_lag("angel", self.decoder.exchange_ms[:len(ticks)], unit=1e-3)
+                self.on_ticks_array(self, ticks)
+        if self.on_ticks:
+            ticks = [t for t in map(parse_packet, packets) if t is not None]
+            if not self.on_ticks_array:
+                self.stats["ticks"] += len(ticks)
+            if ticks:
+                self.on_ticks(self, ticks)
+        return None
+
+
+def get_stream(exchange: str = "NSE", **kwargs) -> SmartStream:
+    """SmartStream for the .env account, using the cached session's JWT and feedToken."""
+    from auth_token import get_session_manager
+    api_key = os.getenv("ANGEL_API_KEY")
+    if not api_key:
+        raise ValueError("ANGEL_API_KEY not set in .env")
+    session = get_session_manager().get_session()
+    client_code = session.get("client_code") or os.getenv("ANGEL_CLIENT_CODE")
+    return SmartStream(session["jwtToken"], api_key, client_code, session["feedToken"],
+                       exchange=exchange, **kwargs)
+
+
+if __name__ == "__main__":
+    # python smart_stream.py [--standin] [token ...]   (default SBIN-EQ 3045, RELIANCE-EQ 2885)
+    args = [a for a in sys.argv[1:] if a != "--standin"]
+    tokens = args or ["3045", "2885"]
+    if "--standin" in sys.argv:
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench"))
+        from ws_standin import FeedStandIn
+        standin = FeedStandIn(interval=0.001).start()
+        stream = SmartStream("jwt", "key", "client", "feed", url=standin.url)
+    else:
+        from auth_token import AuthError
+        try:
+            stream = get_stream()
+        except (AuthError, Exception) as e:
+            print(f"Failed: {e}")
+            sys.exit(1)
+
+    latest = {}
+
+    def on_ticks_array(ws, ticks):
+        latest.update(zip(ticks["token"].tolist(), ticks["ltp"].tolist()))
+
+    stream.on_ticks_array = on_ticks_array
+    stream.on_connect = lambda ws, response: ws.subscribe(tokens, ws.MODE_FULL)
+    stream.on_error = lambda ws, code, reason: print("Error:", code, reason)
+    stream.connect(threaded=True)
+    try:
+        while True:
+            time.sleep(1)
+            s = stream.stats
+            print(f"{s['ticks']} ticks in {s['batches']} batches, ltp {latest}")
+    except KeyboardInterrupt:
+        stream.close()
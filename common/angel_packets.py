@@ -0,0 +1,211 @@
+# angel_packets.py
+"""
+Angel One SmartWebSocketV2 binary packets -> Kite-style ticks.
+
+Every binary websocket message of Angel's smart-stream feed is one
+little-endian packet whose length gives the mode:
+
+    0    mode u1, exchange type u1, token (25 bytes, NUL padded)
+    27   sequence number, exchange timestamp (epoch ms), ltp          -> 51  LTP
+    51   ltq, avg price, volume, total buy/sell qty (f8), o, h, l, c  -> 123 Quote
+    123  last trade time (epoch s), oi, oi change %, 10 x best-5
+         (flag u2: 1 buy / 0 sell, qty, price, orders u2), upper/lower
+         circuit, 52 week high/low                                   -> 379 SnapQuote
+
+Prices are in paise (1e-7 rupee for currency derivatives).
+
+parse_packet() builds the dict KiteTicker would pass to on_ticks (same keys,
+mode names "ltp"/"quote"/"full", int instrument_token) plus the Angel-only
+fields. AngelDecoder decodes a batch of packets straight into TICK_DTYPE
+(tick_decoder.py), so TickRing / BarAggregator take Angel ticks unchanged.
+build_packet() is the reverse, for stand-ins and tests.
+"""
+import struct
+import datetime as dt
+import numpy as np
+from kite_packets import MODE_LTP, MODE_QUOTE, MODE_FULL
+from tick_decoder import TICK_DTYPE
+
+# Kite mode name <-> Angel subscription mode (SnapQuote is the full mode)
+ANGEL_MODES = {MODE_LTP: 1, MODE_QUOTE: 2, MODE_FULL: 3}
+MODE_NAMES = {v: k for k, v in ANGEL_MODES.items()}
+EXCHANGE_TYPES = {"nse_cm": 1, "nse_fo": 2, "bse_cm": 3, "bse_fo": 4, "mcx_fo": 5, "ncx_fo": 7, "cde_fo": 13}
+# REST exchange names (placeOrder, searchScrip, ...) -> feed exchange type
+EXCHANGE_OF = {"NSE": 1, "NFO": 2, "BSE": 3, "BFO": 4, "MCX": 5, "NCDEX": 7, "CDS": 13}
+PACKET_LENGTHS = {1: 51, 2: 123, 3: 379}
+INDEX_TOKEN_MIN = 99_900_000  # index tokens (Nifty 99926000, Sensex 99919000, ...) are not tradable
+
+_HEAD = struct.Struct("<BB25sqqq")    # 51 bytes
+_QUOTE = struct.Struct("<qqqddqqqq")  # 51..123
+_SNAP = struct.Struct("<qqq")         # 123..147
+_LEVEL = struct.Struct("<Hqqh")       # depth entry, 20 bytes
+_TAIL = struct.Struct("<qqqq")        # 347..379
+
+_DIVISOR = np.full(256, 100.0)
+_DIVISOR[EXCHANGE_TYPES["cde_fo"]] = 1e7
+
+
+def divisor_for(exchange_type: int) -> float:
+    return 1e7 if exchange_type == EXCHANGE_TYPES["cde_fo"] else 100.0
+
+
+def _time(value: float):
+    try:
+        return dt.datetime.fromtimestamp(value)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def parse_packet(packet: bytes) -> dict:
+    """One binary packet -> Kite-style tick dict (None for an unknown length)."""
+    n = len(packet)
+    if n not in (51, 123, 379):
+        return None
+    mode, exchange_type, token, sequence, exchange_ts, ltp = _HEAD.unpack_from(packet, 0)
+    token = int(token.rstrip(b"\0"))
+    divisor = divisor_for(exchange_type)
+    d = {"tradable": token < INDEX_TOKEN_MIN, "mode": MODE_NAMES.get(mode, mode),
+         "instrument_token": token, "exchange_type": exchange_type,
+         "sequence_number": sequence, "exchange_timestamp": _time(exchange_ts / 1000),
+         "last_price": ltp / divisor}
+    if n == 51:
+        return d
+    ltq, avg, volume, buy_qty, sell_qty, open_, high, low, close = _QUOTE.unpack_from(packet, 51)
+    d.update({"last_traded_quantity": ltq, "average_traded_price": avg / divisor,
+              "volume_traded": volume, "total_buy_quantity": int(buy_qty),
+              "total_sell_quantity": int(sell_qty),
+              "ohlc": {"open": open_ / divisor, "high": high / divisor,
+                       "low": low / divisor, "close": close / divisor}})
+    d["change"] = (d["last_price"] - d["ohlc"]["close"]) * 100 / d["ohlc"]["close"] if close else 0
+    if n == 123:
+        return d
+    ltt, oi, oi_change = _SNAP.unpack_from(packet, 123)
+    d["last_trade_time"] = _time(ltt)
+    d["oi"] = oi
+    d["oi_change_percentage"] = oi_change
+    depth = {"buy": [], "sell": []}
+    for i in range(10):
+        flag, qty, price, orders = _LEVEL.unpack_from(packet, 147 + i * 20)
+        depth["buy" if flag == 1 else "sell"].append(
+            {"quantity": qty, "price": price / divisor, "orders": orders})
+    d["depth"] = depth
+    upper, lower, high52, low52 = _TAIL.unpack_from(packet, 347)
+    d["upper_circuit"] = upper / divisor
+    d["lower_circuit"] = lower / divisor
+    d["52_week_high"] = high52 / divisor
+    d["52_week_low"] = low52 / divisor
+    return d
+
+
+def build_packet(mode: int, exchange_type: int, token, ltp: int, sequence: int = 0,
+                 exchange_ts: int = 0, ltq: int = 0, avg_price: int = 0, volume: int = 0,
+                 buy_qty: float = 0.0, sell_qty: float = 0.0, ohlc=(0, 0, 0, 0),
+                 last_trade_ts: int = 0, oi: int = 0, oi_change: int = 0, depth=(),
+                 circuits=(0, 0), week52=(0, 0)) -> bytes:
+    """
+    Packet for `mode` (1/2/3) from raw wire values (prices in paise).
+    depth: up to 10 (flag, qty, price, orders), buy levels flagged 1.
+    """
+    packet = _HEAD.pack(mode, exchange_type, str(token).encode(), sequence, exchange_ts, ltp)
+    if mode == 1:
+        return packet
+    packet += _QUOTE.pack(ltq, avg_price, volume, buy_qty, sell_qty, *ohlc)
+    if mode == 2:
+        return packet
+    levels = list(depth)[:10] + [(0, 0, 0, 0)] * (10 - len(depth))
+    return (packet + _SNAP.pack(last_trade_ts, oi, oi_change)
+            + b"".join(_LEVEL.pack(*level) for level in levels)
+            + _TAIL.pack(*circuits, *week52))
+
+
+def _wire(fields: list, length: int) -> np.dtype:
+    names, formats, offsets = zip(*fields)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": length})
+
+
+_LEVEL_DTYPE = np.dtype({"names": ["flag", "qty", "price", "orders"],
+                         "formats": ["<u2", "<i8", "<i8", "<u2"],
+                         "offsets": [0, 2, 10, 18], "itemsize": 20})
+_LTP_FIELDS = [("mode", "u1", 0), ("exchange_type", "u1", 1), ("token", "S25", 2),
+               ("exchange_ts", "<i8", 35), ("ltp", "<i8", 43)]
+_QUOTE_FIELDS = _LTP_FIELDS + [
+    ("ltq", "<i8", 51), ("avg_price", "<i8", 59), ("volume", "<i8", 67),
+    ("buy_qty", "<f8", 75), ("sell_qty", "<f8", 83),
+    ("open", "<i8", 91), ("high", "<i8", 99), ("low", "<i8", 107), ("close", "<i8", 115),
+]
+_SNAP_FIELDS = _QUOTE_FIELDS + [
+    ("last_trade_ts", "<i8", 123), ("oi", "<i8", 131), ("depth", (_LEVEL_DTYPE, (10,)), 147),
+]
+
+# packet length -> (wire dtype, price fields, plain fields)
+LAYOUTS = {
+    51: (_wire(_LTP_FIELDS, 51), ("ltp",), ()),
+    123: (_wire(_QUOTE_FIELDS, 123), ("ltp", "avg_price", "open", "high", "low", "close"),
+          ("ltq", "volume", "buy_qty", "sell_qty")),
+    379: (_wire(_SNAP_FIELDS, 379), ("ltp", "avg_price", "open", "high", "low", "close"),
+          ("ltq", "volume", "buy_qty", "sell_qty", "last_trade_ts", "oi")),
+}
+
+
+class AngelDecoder:
+    """Batches of Angel packets -> one reused TICK_DTYPE buffer."""
+
+    def __init__(self, capacity: int = 4096):
+        self.ticks = np.zeros(capacity, TICK_DTYPE)
+        # TICK_DTYPE holds whole seconds; the feed's millisecond stamps of the
+        # last decode() are kept alongside for tick-lag metrics
+        self.exchange_ms = np.zeros(capacity, np.int64)
+        self.stats = {"batches": 0, "ticks": 0}
+
+    def decode(self, packets: list) -> np.ndarray:
+        """Decodes packets (in order) into the buffer; returns a view of the ticks."""
+        if len(packets) > len(self.ticks):
+            self.ticks = np.zeros(len(packets), TICK_DTYPE)
+            self.exchange_ms = np.zeros(len(packets), np.int64)
+        out = self.ticks
+        i, n = 0, 0
+        while i < len(packets):
+            # A run of equal-length packets is one fixed-stride record array
+            length, j = len(packets[i]), i + 1
+            while j < len(packets) and len(packets[j]) == length:
+                j += 1
+            layout = LAYOUTS.get(length)
+            if layout is not None:
+                src = np.frombuffer(b"".join(packets[i:j]), layout[0])
+                self._fill(out[n:n + j - i], src, layout)
+                self.exchange_ms[n:n + j - i] = src["exchange_ts"]
+                n += j - i
+            i = j
+        self.stats["batches"] += 1
+        self.stats["ticks"] += n
+        return out[:n]
+
+    @staticmethod
+    def _fill(dst: np.ndarray, src: np.ndarray, layout: tuple):
+        _, prices, plain = layout
+        divisor = _DIVISOR[src["exchange_type"]]
+        token = src["token"].astype(np.uint32)
+        dst.view(np.uint8).fill(0)
+        dst["token"] = token
+        dst["mode"] = src["mode"]  # Angel 1/2/3 match tick_decoder.MODES
+        dst["tradable"] = token < INDEX_TOKEN_MIN
+        dst["exchange_ts"] = src["exchange_ts"] // 1000
+        for name in prices:
+            dst[name] = src[name] / divisor
+        for name in plain:
+            dst[name] = src[name]
+        if "close" in prices:
+            close = dst["close"]
+            np.divide((dst["ltp"] - close) * 100, close, out=dst["change"], where=close != 0)
+        if "depth" in src.dtype.names:
+            depth = src["depth"]
+            # buy levels first, each side in feed order
+            order = np.argsort(depth["flag"] != 1, axis=1, kind="stable")
+            depth = np.take_along_axis(depth, order, axis=1)
+            dst["bid"] = depth["price"][:, :5] / divisor[:, None]
+            dst["ask"] = depth["price"][:, 5:] / divisor[:, None]
+            dst["bid_qty"] = depth["qty"][:, :5]
+            dst["ask_qty"] = depth["qty"][:, 5:]
+            dst["bid_orders"] = depth["orders"][:, :5]
+            dst["ask_orders"] = depth["orders"][:, 5:]
+
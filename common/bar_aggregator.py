@@ -0,0 +1,319 @@
+# bar_aggregator.py
+"""
+Streaming tick -> OHLCV+OI bar aggregator for KiteTicker.
+
+Replaces polling kite.historical_data during market hours: every on_ticks
+batch updates the open bar of each subscribed token for every interval,
+vectorized over the batch (state is one numpy array per field, indexed by
+token row). Bar volume is the delta of the cumulative volume_traded between
+the last tick of the previous bar and the last tick of this one.
+
+A bar closes when the first tick of a later bar arrives, or when
+close_due() finds it past its end (so illiquid tokens still close on time;
+start() runs that on a timer). Closed bars go to the on_bar callback
+immediately and are appended to the shared CandleStore by a background
+thread, so the websocket thread never touches the disk. A late tick for a
+bar that close_due() already closed reopens it; it is emitted again and the
+store replaces the earlier version. A tick older than the token's current
+bar is dropped (counted in stats["late"]) rather than folded into it.
+
+The first bar seen for a token started before we subscribed, so its
+open/volume are incomplete; it is never emitted.
+
+Usage:
+    bars = BarAggregator(symbols={408065: "NSE:INFY"}, on_bar=print)
+    bars.start()
+
+    def on_ticks(ws, ticks):
+        bars.update(ticks)
+"""
+import time
+import queue
+import threading
+import numpy as np
+from candle_store import CandleStore
+from tick_ring import tick_time
+
+# Interval name (Kite naming, plus "second") -> seconds. Bars align to epoch
+# multiples, which are IST clock boundaries for everything up to 30 minutes.
+INTERVALS = {
+    "second": 1,
+    "minute": 60,
+    "3minute": 180,
+    "5minute": 300,
+    "10minute": 600,
+    "15minute": 900,
+    "30minute": 1800,
+}
+FIELDS = {
+    "start": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "vol_base": np.int64,   # cumulative volume before this bar
+    "vol_last": np.int64,   # cumulative volume at the last tick
+    "oi": np.int64,
+    "is_open": np.bool_,
+    "partial": np.bool_,
+}
+
+
+class BarAggregator:
+    def __init__(self, intervals=("second", "minute", "5minute", "15minute"), symbols: dict = None,
+                 store: CandleStore = None, store_intervals=None, on_bar=None,
+                 max_tokens: int = 4096, grace: float = 1.0):
+        unknown = [i for i in intervals if i not in INTERVALS]
+        if unknown:
+            raise ValueError(f"unsupported intervals: {unknown}")
+        self.intervals = tuple(intervals)
+        self.symbols = dict(symbols or {})  # instrument_token -> CandleStore symbol
+        self.store = store or CandleStore()
+        # Second bars are for callbacks only unless asked for explicitly
+        self.store_intervals = set(self.intervals) - {"second"} if store_intervals is None else set(store_intervals)
+        self.on_bar = on_bar
+        self.max_tokens = max_tokens
+        self.grace = grace
+        self.rows = {}
+        self.tokens = np.zeros(max_tokens, np.int64)
+        self._state = {
+            interval: {name: np.zeros(max_tokens, dtype) for name, dtype in FIELDS.items()}
+            for interval in self.intervals
+        }
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="bar-writer", daemon=True)
+        self._writer.start()
+        self._timer = None
+        self._stop = threading.Event()
+        self.stats = {"ticks": 0, "bars": 0, "stored": 0, "store_errors": 0, "late": 0}
+
+    def _row(self, token: int) -> int:
+        row = self.rows.get(token)
+        if row is None:
+            row = len(self.rows)
+            if row >= self.max_tokens:
+                raise OverflowError(f"BarAggregator is full ({self.max_tokens} tokens)")
+            self.tokens[row] = token
+            self.rows[token] = row
+        return row
+
+    # ---- ticks ----
+    def update(self, ticks: list) -> int:
+        """Folds a batch of KiteTicker tick dicts into the open bars; returns ticks used."""
+        ticks = [t for t in ticks if t.get("last_price")]
+        if not ticks:
+            return 0
+        return self._update(
+            [t["instrument_token"] for t in ticks],
+            np.array([tick_time(t) for t in ticks], np.int64),
+            np.array([t["last_price"] for t in ticks], np.float64),
+            np.array([t.get("volume_traded", 0) for t in ticks], np.int64),
+            np.array([t.get("oi", 0) for t in ticks], np.int64),
+        )
+
+    def update_array(self, ticks: np.ndarray) -> int:
+        """Same as update() for a TICK_DTYPE array from tick_decoder."""
+        ticks = ticks[ticks["ltp"] > 0]
+        if not len(ticks):
+            return 0
+        ts = ticks["exchange_ts"]
+        ts = np.where(ts > 0, ts, np.where(ticks["last_trade_ts"] > 0, ticks["last_trade_ts"], int(time.time())))
+        return self._update(ticks["token"].tolist(), ts.astype(np.int64), ticks["ltp"],
+                            ticks["volume"].astype(np.int64), ticks["oi"].astype(np.int64))
+
+    def _update(self, tokens: list, ts, ltp, cum, oi) -> int:
+        n = len(tokens)
+        rows = np.empty(n, np.intp)
+        rank = np.zeros(n, np.intp)  # k-th tick of the same token in this batch
+        seen = {}
+        for i, token in enumerate(tokens):
+            row = self._row(token)
+            rows[i] = row
+            rank[i] = seen[row] = seen.get(row, -1) + 1
+
+        with self._lock:
+            if len(seen) == n:
+                self._apply(rows, ts, ltp, cum, oi)
+            else:
+                # Vectorized updates need unique rows: apply repeats in arrival order
+                for k in range(int(rank.max()) + 1):
+                    m = rank == k
+                    self._apply(rows[m], ts[m], ltp[m], cum[m], oi[m])
+            self.stats["ticks"] += n
+        return n
+
+    def _apply(self, rows, ts, ltp, cum, oi):
+        for interval in self.intervals:
+            st = self._state[interval]
+            secs = INTERVALS[interval]
+            bucket = ts - ts % secs
+            cur = st["start"][rows]
+            late = bucket < cur
+            if late.any():
+                # Only the current bar is held; an older one cannot be rebuilt
+                # from here. Late for this interval need not be late for a longer one.
+                self.stats["late"] += int(late.sum())
+                keep = ~late
+                at, px, vol, oi_at = rows[keep], ltp[keep], cum[keep], oi[keep]
+                bucket, cur = bucket[keep], cur[keep]
+            else:
+                at, px, vol, oi_at = rows, ltp, cum, oi
+            new = bucket > cur
+            closing = new & st["is_open"][at]
+            if closing.any():
+                self._emit(interval, at[closing])
+
+            if new.any():
+                r, first = at[new], cur[new] == 0
+                st["start"][r] = bucket[new]
+                st["open"][r] = st["high"][r] = st["low"][r] = px[new]
+                # Volume before this bar: last cumulative seen, or this tick's on first sight
+                st["vol_base"][r] = np.where(first, vol[new], st["vol_last"][r])
+                st["partial"][r] = first
+            st["is_open"][at] = True
+            st["high"][at] = np.maximum(st["high"][at], px)
+            st["low"][at] = np.minimum(st["low"][at], px)
+            st["close"][at] = px
+            st["vol_last"][at] = np.maximum(vol, st["vol_last"][at])
+            st["oi"][at] = oi_at
+
+    def close_due(self, now: float = None) -> int:
+        """Closes open bars whose end (+grace) has passed without a newer tick."""
+        now = time.time() if now is None else now
+        closed = 0
+        with self._lock:
+            n = len(self.rows)
+            for interval in self.intervals:
+                st = self._state[interval]
+                due = st["is_open"][:n] & (st["start"][:n] + INTERVALS[interval] + self.grace <= now)
+                rows = np.flatnonzero(due)
+                if len(rows):
+                    closed += self._emit(interval, rows)
+        return closed
+
+    def _emit(self, interval: str, rows) -> int:
+        st = self._state[interval]
+        st["is_open"][rows] = False
+        rows = rows[~st["partial"][rows]]
+        if not len(rows):
+            return 0
+        bars = {
+            "token": self.tokens[rows],
+            "ts": st["start"][rows],
+            "open": st["open"][rows],
+            "high": st["high"][rows],
+            "low": st["low"][rows],
+            "close": st["close"][rows],
+            "volume": st["vol_last"][rows] - st["vol_base"][rows],
+            "oi": st["oi"][rows],
+        }
+        self.stats["bars"] += len(rows)
+        if self.on_bar:
+            self.on_bar(interval, bars)
+        if interval in self.store_intervals:
+            self._queue.put((interval, bars))
+        return len(rows)
+
+    def current(self, interval: str, token: int) -> dict:
+        """The still-open bar of one token (None before its first tick)."""
+        row = self.rows.get(token)
+        if row is None:
+            return None
+        with self._lock:
+            st = self._state[interval]
+            bar = {name: st[name][row].item() for name in ("start", "open", "high", "low", "close", "oi")}
+            bar["volume"] = int(st["vol_last"][row] - st["vol_base"][row])
+        return bar
+
+    # ---- background work ----
+    def start(self, period: float = 0.25):
+        """Runs close_due() every `period` seconds on a daemon thread."""
+        def loop():
+            while not self._stop.wait(period):
+                self.close_due()
+        self._timer = threading.Thread(target=loop, name="bar-timer", daemon=True)
+        self._timer.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while True:  # drain whatever else is queued into one pass
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._store(batch)
+                    return
+                batch.append(item)
+            self._store(batch)
+
+    def _store(self, batch: list):
+        by_interval = {}
+        for interval, bars in batch:
+            by_interval.setdefault(interval, []).append(bars)
+        for interval, parts in by_interval.items():
+            cols = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+            tokens = cols.pop("token")
+            for token in np.unique(tokens):
+                m = tokens == token
+                symbol = self.symbols.get(int(token), str(int(token)))
+                try:
+                    self.store.append(symbol, interval, {k: v[m] for k, v in cols.items()}, sync=False)
+                    self.stats["stored"] += int(m.sum())
+                except Exception as e:
+                    self.stats["store_errors"] += 1
+                    print(f"Bar store failed for {symbol} {interval}: {e}")
+
+    def close(self, flush_open: bool = False):
+        """Stops the timer and waits for queued bars to be stored.
+        flush_open=True also closes and stores the bars still in progress."""
+        self._stop.set()
+        if self._timer:
+            self._timer.join()
+        if flush_open:
+            self.close_due(now=float("inf"))
+        self._queue.put(None)
+        self._writer.join()
+
+
+if __name__ == "__main__":
+    import tempfile
+    import datetime as dt
+
+    n_tokens, seconds = 3000, 180
+    with tempfile.TemporaryDirectory() as root:
+        agg = BarAggregator(store=CandleStore(root))
+        t_open = dt.datetime(2025, 4, 2, 9, 15)
+        rng = np.random.default_rng(1)
+        cost = []
+        for s in range(seconds):
+            ts = t_open + dt.timedelta(seconds=s)
+            ticks = [{"instrument_token": tok, "last_price": 100 + rng.random(),
+                      "volume_traded": 1000 + s * 10, "oi": 0, "exchange_timestamp": ts}
+                     for tok in range(1, n_tokens + 1)]
+            t0 = time.perf_counter()
+            agg.update(ticks)
+            cost.append(time.perf_counter() - t0)
+        # A tick from two minutes back must not touch the current bar
+        before = agg.current("minute", 1)
+        agg.update([{"instrument_token": 1, "last_price": 500.0, "volume_traded": 1000, "oi": 0,
+                     "exchange_timestamp": t_open + dt.timedelta(seconds=seconds - 120)}])
+        assert agg.current("minute", 1) == before and agg.stats["late"] > 0, agg.current("minute", 1)
+        # Out of order inside one minute: late for the second bar, not for the minute bar
+        t_last = t_open + dt.timedelta(seconds=seconds)
+        for sec, price, cum in ((5, 100.0, 10_000_000), (6, 101.0, 10_000_010), (5, 90.0, 10_000_020)):
+            agg.update([{"instrument_token": n_tokens + 1, "last_price": price, "volume_traded": cum, "oi": 0,
+                         "exchange_timestamp": t_last + dt.timedelta(seconds=sec)}])
+        bar = agg.current("minute", n_tokens + 1)
+        assert (bar["low"], bar["close"], bar["volume"]) == (90.0, 90.0, 20), bar
+        assert agg.current("second", n_tokens + 1)["close"] == 101.0
+        t0 = time.perf_counter()
+        agg.close()
+        print(f"{n_tokens} tokens x {seconds} s: {np.mean(cost) * 1e3:.2f} ms per tick batch "
+              f"({np.mean(cost) / n_tokens * 1e6:.2f} us/tick), stats {agg.stats}, "
+              f"store drain {(time.perf_counter() - t0) * 1e3:.0f} ms")
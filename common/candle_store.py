@@ -0,0 +1,286 @@
+# candle_store.py
+"""
+Memory-mapped columnar OHLCV+OI store, one series per (symbol, interval).
+
+Layout under the store root:
+    <symbol>/<interval>/meta.json         {"rows": n, "gen": g}
+    <symbol>/<interval>/<column>.<g>.bin  raw little-endian column arrays
+
+Reads memory-map the column files (np.memmap, read-only), so loading a
+series is zero-copy and only the pages of the slice actually touched become
+resident. Timestamps are sorted epoch seconds, so a time-range slice is two
+binary searches.
+
+Appends are atomic: rows beyond meta["rows"] are invisible to readers until
+meta.json is replaced (os.replace) after the data is flushed. In-order rows
+are appended in place; overlapping or out-of-order rows (e.g. parallel
+downloader chunks) are merged into a new generation of files which is
+published by the same meta swap.
+
+Usage:
+    store = CandleStore()
+    store.append("NSE:3045", "ONE_MINUTE", from_angel(candles))
+    bars = store.read("NSE:3045", "ONE_MINUTE", start="2025-04-02 09:15", end="2025-04-02 15:30")
+"""
+import os
+import json
+import datetime as dt
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+COLUMNS = {
+    "ts": np.dtype("<i8"),      # epoch seconds (UTC)
+    "open": np.dtype("<f8"),
+    "high": np.dtype("<f8"),
+    "low": np.dtype("<f8"),
+    "close": np.dtype("<f8"),
+    "volume": np.dtype("<i8"),
+    "oi": np.dtype("<i8"),
+}
+# Shared by both brokers' scripts: <repo>/data/candles
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "candles")
+IST = dt.timezone(dt.timedelta(hours=5, minutes=30))
+
+
+def to_epoch(value) -> int:
+    """datetime / ISO string / "YYYY-MM-DD HH:MM" (naive = IST) -> epoch seconds."""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, str):
+        value = dt.datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=IST)
+    return int(value.timestamp())
+
+
+def from_angel(candles: list) -> dict:
+    """Angel getCandleData rows [ts, o, h, l, c, v(, oi)] -> column arrays."""
+    n = len(candles)
+    cols = {name: np.zeros(n, dtype) for name, dtype in COLUMNS.items()}
+    for i, c in enumerate(candles):
+        cols["ts"][i] = to_epoch(c[0])
+        cols["open"][i], cols["high"][i], cols["low"][i], cols["close"][i] = c[1:5]
+        cols["volume"][i] = c[5]
+        if len(c) > 6:
+            cols["oi"][i] = c[6]
+    return cols
+
+
+def from_kite(candles: list) -> dict:
+    """kite.historical_data dicts {date, open, high, low, close, volume(, oi)} -> column arrays."""
+    n = len(candles)
+    cols = {name: np.zeros(n, dtype) for name, dtype in COLUMNS.items()}
+    for i, c in enumerate(candles):
+        cols["ts"][i] = to_epoch(c["date"])
+        for name in ("open", "high", "low", "close", "volume"):
+            cols[name][i] = c[name]
+        cols["oi"][i] = c.get("oi") or 0
+    return cols
+
+
+class _SeriesLock:
+    """Exclusive lock for one series directory (writers only; readers never lock)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        self._fh = open(self.path, "a+")
+        if fcntl:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+        else:
+            self._fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        else:
+            self._fh.seek(0)
+            msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+        self._fh.close()
+
+
+class CandleStore:
+    def __init__(self, root: str = DEFAULT_ROOT):
+        self.root = root
+        self._maps = {}  # (symbol, interval) -> (meta stat, rows, {col: memmap})
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    # ---- paths & metadata ----
+    def _dir(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, symbol.replace(":", "_").replace("/", "_"), interval)
+
+    @staticmethod
+    def _read_meta(d: str) -> dict:
+        try:
+            with open(os.path.join(d, "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"rows": 0, "gen": 0}
+
+    @staticmethod
+    def _write_meta(d: str, meta: dict, sync: bool = True):
+        tmp = os.path.join(d, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(d, "meta.json"))
+
+    @staticmethod
+    def _col_path(d: str, name: str, gen: int) -> str:
+        return os.path.join(d, f"{name}.{gen}.bin")
+
+    def symbols(self) -> list:
+        return sorted(os.listdir(self.root))
+
+    def intervals(self, symbol: str) -> list:
+        d = os.path.dirname(self._dir(symbol, "x"))
+        return sorted(os.listdir(d)) if os.path.isdir(d) else []
+
+    # ---- reads ----
+    def _columns(self, symbol: str, interval: str):
+        """Returns (rows, {col: memmap}), reopening only when meta.json changed."""
+        d = self._dir(symbol, interval)
+        try:
+            st = os.stat(os.path.join(d, "meta.json"))
+            mtime = (st.st_ino, st.st_mtime_ns, st.st_size)  # meta is replaced, never edited
+        except FileNotFoundError:
+            return 0, {}
+        key = (symbol, interval)
+        with self._lock:
+            cached = self._maps.get(key)
+            if cached and cached[0] == mtime:
+                return cached[1], cached[2]
+            meta = self._read_meta(d)
+            rows, gen = meta["rows"], meta["gen"]
+            maps = {}
+            if rows:
+                for name, dtype in COLUMNS.items():
+                    maps[name] = np.memmap(self._col_path(d, name, gen), dtype=dtype,
+                                           mode="r", shape=(rows,))
+            self._maps[key] = (mtime, rows, maps)
+            return rows, maps
+
+    def read(self, symbol: str, interval: str, start=None, end=None, columns=None) -> dict:
+        """
+        Zero-copy column views for bars with start <= ts <= end (either bound
+        optional). start/end accept epoch seconds, datetimes or ISO strings.
+        """
+        rows, maps = self._columns(symbol, interval)
+        names = columns or list(COLUMNS)
+        if not rows:
+            return {name: np.empty(0, COLUMNS[name]) for name in names}
+        ts = maps["ts"]
+        lo = int(np.searchsorted(ts, to_epoch(start), "left")) if start is not None else 0
+        hi = int(np.searchsorted(ts, to_epoch(end), "right")) if end is not None else rows
+        return {name: maps[name][lo:hi] for name in names}
+
+    def read_frame(self, symbol: str, interval: str, start=None, end=None):
+        """Same as read() as a pandas DataFrame indexed by IST datetime (copies)."""
+        import pandas as pd
+        cols = self.read(symbol, interval, start, end)
+        index = pd.to_datetime(cols.pop("ts"), unit="s", utc=True).tz_convert("Asia/Kolkata")
+        return pd.DataFrame(cols, index=index)
+
+    def last_ts(self, symbol: str, interval: str):
+        rows, maps = self._columns(symbol, interval)
+        return int(maps["ts"][rows - 1]) if rows else None
+
+    # ---- writes ----
+    def append(self, symbol: str, interval: str, cols: dict, sync: bool = True) -> int:
+        """Atomically adds bars (dict of equal-length arrays; ts required).
+        Bars whose ts already exists replace the stored bar. Returns rows stored.
+        sync=False skips fsync (still atomic for readers and process crashes,
+        not for power loss); meant for frequent small live appends."""
+        n = len(cols["ts"])
+        if not n:
+            return self._read_meta(self._dir(symbol, interval))["rows"]
+        new = {}
+        for name, dtype in COLUMNS.items():
+            arr = cols.get(name)
+            new[name] = np.zeros(n, dtype) if arr is None else np.asarray(arr, dtype=dtype)
+        order = np.argsort(new["ts"], kind="stable")
+        if not np.all(order[:-1] < order[1:]):
+            new = {name: a[order] for name, a in new.items()}
+
+        d = self._dir(symbol, interval)
+        os.makedirs(d, exist_ok=True)
+        with _SeriesLock(os.path.join(d, ".lock")):
+            meta = self._read_meta(d)
+            rows, gen = meta["rows"], meta["gen"]
+            last = None
+            if rows:
+                with open(self._col_path(d, "ts", gen), "rb") as f:
+                    f.seek((rows - 1) * 8)
+                    last = int(np.frombuffer(f.read(8), "<i8")[0])
+
+            if last is None or new["ts"][0] > last:
+                # Fast path: strictly after the stored tail, append in place.
+                # Anything past meta["rows"] (e.g. from a crashed writer) is cut first.
+                for name, dtype in COLUMNS.items():
+                    with open(self._col_path(d, name, gen), "ab") as f:
+                        f.truncate(rows * dtype.itemsize)
+                        f.write(new[name].tobytes())
+                        if sync:
+                            f.flush()
+                            os.fsync(f.fileno())
+                total = rows + n
+                self._write_meta(d, {"rows": total, "gen": gen}, sync)
+                return total
+
+            # Overlap / out of order: merge into a new generation
+            old = {name: np.fromfile(self._col_path(d, name, gen), dtype=dtype, count=rows)
+                   for name, dtype in COLUMNS.items()}
+            ts = np.concatenate([old["ts"], new["ts"]])
+            # stable sort keeps old-before-new for equal ts; keep the last (newest) of each
+            order = np.argsort(ts, kind="stable")
+            ts_sorted = ts[order]
+            keep = np.ones(len(order), bool)
+            keep[:-1] = ts_sorted[1:] != ts_sorted[:-1]
+            order = order[keep]
+            new_gen = gen + 1
+            for name in COLUMNS:
+                merged = np.concatenate([old[name], new[name]])[order]
+                with open(self._col_path(d, name, new_gen), "wb") as f:
+                    f.write(merged.tobytes())
+                    if sync:
+                        f.flush()
+                        os.fsync(f.fileno())
+            total = int(len(order))
+            self._write_meta(d, {"rows": total, "gen": new_gen}, sync)
+            for name in COLUMNS:
+                try:
+                    os.remove(self._col_path(d, name, gen))
+                except OSError:
+                    pass  # still mapped by a reader on Windows; harmless leftover
+            return total
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    root = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ROOT
+    store = CandleStore(root)
+    t0 = time.perf_counter()
+    total = 0
+    for symbol in store.symbols():
+        for interval in store.intervals(symbol):
+            total += len(store.read(symbol, interval)["ts"])
+    print(f"Mapped {total} bars from {root} in {(time.perf_counter() - t0) * 1e3:.1f} ms")
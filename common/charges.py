@@ -0,0 +1,195 @@
+# charges.py
+"""
+Local, vectorized brokerage and statutory charges for Indian equity and F&O.
+
+Instead of one estimateCharges round-trip per estimate, charges() prices
+whole arrays of fills with a handful of NumPy operations (around ten
+million fills per second with integer codes, see __main__), so pre-trade
+cost checks and backtests can call it on every order. Per fill:
+
+    brokerage   min(flat, pct x turnover), at least `minimum`   (per broker)
+    stt         securities transaction tax (sell side, both sides for delivery)
+    exchange    exchange transaction charges (NSE / BSE)
+    sebi        SEBI turnover fee, Rs 10 per crore
+    stamp       stamp duty, buy side only
+    gst         18% of brokerage + exchange + sebi
+    total       (turnover is returned too)
+
+Segments: delivery, intraday (cash equity), futures, options (premium
+turnover). Rates are the published ones from 1 Oct 2024; they are plain
+tables below, so a rate change is a one-line edit. verify() samples orders
+against Angel's estimateCharges and reports where the two disagree.
+
+Usage:
+    c = charges(["intraday", "options"], ["NSE", "NFO"], ["BUY", "SELL"], [100, 75], [812.5, 142.0])
+    c["total"]          # array, rupees per fill
+"""
+import random
+import numpy as np
+
+SEGMENTS = {"delivery": 0, "intraday": 1, "futures": 2, "options": 3}
+EXCHANGES = {"NSE": 0, "NFO": 0, "BSE": 1, "BFO": 1}
+SIDES = {"BUY": 1, "SELL": 0}
+COMPONENTS = ("brokerage", "stt", "exchange", "sebi", "stamp", "gst", "total")
+
+# segment -> (flat Rs per order, fraction of turnover, minimum Rs):
+# brokerage = max(min(flat, fraction x turnover), minimum); options are flat (fraction 1.0)
+BROKERAGE = {
+    "angel": {"delivery": (20.0, 0.001, 2.0), "intraday": (20.0, 0.0003, 0.0),
+              "futures": (20.0, 0.0003, 0.0), "options": (20.0, 1.0, 0.0)},
+    "kite": {"delivery": (0.0, 0.0, 0.0), "intraday": (20.0, 0.0003, 0.0),
+             "futures": (20.0, 0.0003, 0.0), "options": (20.0, 1.0, 0.0)},
+}
+# segment -> (buy, sell) fraction of turnover
+STT = {"delivery": (0.001, 0.001), "intraday": (0.0, 0.00025),
+       "futures": (0.0, 0.0002), "options": (0.0, 0.001)}
+# segment -> (NSE, BSE) fraction of turnover
+EXCHANGE_CHARGES = {"delivery": (0.0000297, 0.0000375), "intraday": (0.0000297, 0.0000375),
+                    "futures": (0.0000173, 0.0), "options": (0.0003503, 0.000325)}
+# segment -> buy-side fraction of turnover
+STAMP = {"delivery": 0.00015, "intraday": 0.00003, "futures": 0.00002, "options": 0.00003}
+SEBI = 10 / 1e7
+GST = 0.18
+
+
+def _table(rates: dict) -> np.ndarray:
+    """{segment: value or tuple} -> array indexed by segment code."""
+    rows = [rates[name] for name in sorted(SEGMENTS, key=SEGMENTS.get)]
+    return np.array(rows, np.float64)
+
+
+_STT = _table(STT)[:, ::-1].copy()   # [segment, side code] (SELL=0, BUY=1)
+_EXCHANGE = _table(EXCHANGE_CHARGES)  # [segment, exchange code]
+_STAMP = _table(STAMP)                # [segment]
+_BROKERAGE = {broker: _table(rates) for broker, rates in BROKERAGE.items()}  # [segment, (flat, pct, min)]
+
+
+def _codes(values, mapping: dict, name: str) -> np.ndarray:
+    """Strings (or already-coded ints) -> int code array; strings are mapped once per distinct value."""
+    values = np.asarray(values)
+    if values.dtype.kind in "iu":
+        codes = values.astype(np.intp, copy=False)
+        n = max(mapping.values()) + 1  # EXCHANGES maps several names to one code
+        if codes.size and (codes.min() < 0 or codes.max() >= n):
+            bad = codes[(codes < 0) | (codes >= n)].flat[0]
+            raise ValueError(f"unknown {name} code: {bad} (expected 0..{n - 1})")
+        return codes
+    keys, inverse = np.unique(values, return_inverse=True)
+    try:
+        lookup = np.array([mapping[str(k).upper() if name != "segment" else str(k).lower()] for k in keys],
+                          np.intp)
+    except KeyError as e:
+        raise ValueError(f"unknown {name}: {e.args[0]}") from None
+    return lookup[inverse].reshape(values.shape)
+
+
+def charges(segment, exchange, side, quantity, price, broker: str = "angel") -> dict:
+    """
+    Charges per fill. segment/exchange/side are names ("intraday", "NSE",
+    "BUY") or codes from SEGMENTS / EXCHANGES / SIDES; all arguments
+    broadcast against each other. Returns {component: float64 array}.
+    """
+    seg = _codes(segment, SEGMENTS, "segment")
+    exch = _codes(exchange, EXCHANGES, "exchange")
+    buy = _codes(side, SIDES, "side")
+    turnover = np.asarray(quantity, np.float64) * np.asarray(price, np.float64)
+    seg, exch, buy, turnover = np.broadcast_arrays(seg, exch, buy, turnover)
+
+    flat, pct, minimum = _BROKERAGE[broker][seg].T
+    brokerage = np.maximum(np.minimum(flat, pct * turnover), minimum)
+    brokerage = np.minimum(brokerage, turnover)  # never more than the trade itself
+    stt = _STT[seg, buy] * turnover
+    exchange_charges = _EXCHANGE[seg, exch] * turnover
+    sebi = SEBI * turnover
+    stamp = np.where(buy == 1, _STAMP[seg] * turnover, 0.0)
+    gst = GST * (brokerage + exchange_charges + sebi)
+    total = brokerage + stt + exchange_charges + sebi + stamp + gst
+    return {"brokerage": brokerage, "stt": stt, "exchange": exchange_charges, "sebi": sebi,
+            "stamp": stamp, "gst": gst, "total": total, "turnover": turnover}
+
+
+def segment_of(product_type: str, exchange: str, symbol: str = "") -> str:
+    """Angel order fields -> segment (F&O by exchange; options by a CE/PE symbol suffix)."""
+    if exchange.upper() in ("NFO", "BFO"):
+        return "options" if symbol.upper().endswith(("CE", "PE")) else "futures"
+    return "intraday" if product_type.upper() in ("INTRADAY", "MIS") else "delivery"
+
+
+def order_charges(orders: list, broker: str = "angel") -> dict:
+    """Charges for estimateCharges-style order dicts (product_type, transaction_type, quantity, price, exchange, symbol_name)."""
+    return charges([segment_of(o["product_type"], o["exchange"], o.get("symbol_name", "")) for o in orders],
+                   [o["exchange"] for o in orders],
+                   [o["transaction_type"] for o in orders],
+                   [float(o["quantity"]) for o in orders],
+                   [float(o["price"]) for o in orders], broker)
+
+
+# estimateCharges breakup names -> our components
+_API_NAMES = (("brokerage", "brokerage"), ("security transaction", "stt"), ("stt", "stt"),
+              ("exchange", "exchange"), ("sebi", "sebi"), ("stamp", "stamp"), ("gst", "gst"))
+
+
+def _flatten_breakup(items: list, out: dict):
+    for item in items or []:
+        if item.get("breakup"):
+            _flatten_breakup(item["breakup"], out)
+            continue
+        name = (item.get("name") or "").lower()
+        for needle, component in _API_NAMES:
+            if needle in name:
+                out[component] = out.get(component, 0.0) + float(item.get("amount") or 0)
+                break
+
+
+def parse_estimate(resp: dict) -> list:
+    """estimateCharges response -> [{component: amount}] per order (total included)."""
+    result = []
+    for order in ((resp.get("data") or {}).get("charges") or []):
+        parsed = {"total": float(order.get("total_charges") or 0)}
+        _flatten_breakup(order.get("breakup"), parsed)
+        result.append(parsed)
+    return result
+
+
+def verify(client, orders: list, sample: int = 20, tolerance: float = 0.05, batch: int = 50,
+           seed: int = None) -> list:
+    """
+    Prices a random sample of orders both locally and through
+    client.request_json("estimateCharges") and returns the disagreements:
+    [{"order", "component", "local", "api"}] where |local - api| > tolerance rupees.
+    """
+    rng = random.Random(seed)
+    picked = rng.sample(orders, min(sample, len(orders)))
+    mismatches = []
+    for i in range(0, len(picked), batch):
+        chunk = picked[i:i + batch]
+        resp = client.request_json("estimateCharges", {"orders": chunk})
+        if not resp.get("status"):
+            raise RuntimeError(f"estimateCharges failed: {resp.get('errorcode')}: {resp.get('message')}")
+        local = order_charges(chunk)
+        for k, (order, api) in enumerate(zip(chunk, parse_estimate(resp))):
+            for component, amount in api.items():
+                mine = float(local[component][k])
+                if abs(mine - amount) > tolerance:
+                    mismatches.append({"order": order, "component": component, "local": round(mine, 4),
+                                       "api": amount})
+    return mismatches
+
+
+if __name__ == "__main__":
+    import time
+
+    n = 5_000_000
+    rng = np.random.default_rng(1)
+    seg = rng.integers(0, 4, n)
+    exch = rng.integers(0, 2, n)
+    side = rng.integers(0, 2, n)
+    qty = rng.integers(1, 1000, n)
+    price = rng.uniform(1, 5000, n)
+    t0 = time.perf_counter()
+    c = charges(seg, exch, side, qty, price)
+    elapsed = time.perf_counter() - t0
+    print(f"{n:,} fills in {elapsed * 1e3:.0f} ms: {n / elapsed / 1e6:.1f} M fills/s, "
+          f"total charges Rs {c['total'].sum():,.0f}")
+    one = charges("intraday", "NSE", ["BUY", "SELL"], 100, 812.5)
+    print("intraday round trip, 100 @ 812.50:", {k: round(float(v.sum()), 2) for k, v in one.items()})
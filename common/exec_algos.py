@@ -0,0 +1,476 @@
+# exec_algos.py
+"""
+TWAP / VWAP / iceberg execution of large parent orders.
+
+A ParentOrder is worked as a stream of child limit orders instead of one
+placeOrder call. Its schedule says how much should have been sent by now:
+
+    twap      evenly over [start, end]
+    vwap      along the intraday volume profile (volume_profile() averages
+              the last N days of minute candles from the CandleStore)
+    iceberg   everything at once, but never more than `display` working;
+              a new child goes out as soon as the previous one fills
+
+Every `interval` seconds (and on every fill) the scheduler sends the
+difference between that target and what is filled or working, rounded
+down to the lot size. Children are priced off the last tick (ltp plus
+`aggression` ticks toward the other side), never through the parent's
+limit; while the market is beyond the limit the parent waits, and the
+next tick wakes it. A child left more than `reprice_ticks` behind the
+market is cancelled, and its quantity goes out again at the new price with
+the next slice. At `end` the remainder goes out as a final slice; whatever
+is still unfilled `grace` seconds later expires. When a parent expires or
+is cancelled, its working children are cancelled and awaited before done
+resolves, so nothing of it is left resting on the exchange.
+
+All parents run as tasks on one asyncio loop. Children go through an
+order_manager.OrderManager (client ids, safe retries) behind one shared
+token bucket, so any number of parents stay inside the placeOrder rate
+limit. Fills come from the manager's order-book sync.
+
+Usage:
+    sched = angel_scheduler(get_client())       # or kite_scheduler(kite)
+    p = sched.submit(ParentOrder(template, 5000, "BUY", algo="vwap", duration=1800,
+                                 token=3045, limit=812.0, profile=volume_profile(store, "NSE:SBIN")))
+    await p.done                 # "filled" / "expired" / "cancelled"
+"""
+import json
+import time
+import asyncio
+import numpy as np
+from order_manager import angel_manager, kite_manager
+
+TWAP = "twap"
+VWAP = "vwap"
+ICEBERG = "iceberg"
+ALGOS = (TWAP, VWAP, ICEBERG)
+IST_OFFSET = 19800  # seconds east of UTC
+
+
+def volume_profile(store, symbol: str, interval: str = "minute", days: int = 20, now: float = None) -> np.ndarray:
+    """Average volume per minute of the IST day (1440 entries) over the last `days` days of candles."""
+    now = time.time() if now is None else now
+    cols = store.read(symbol, interval, start=int(now) - days * 86400, end=int(now), columns=["ts", "volume"])
+    profile = np.zeros(1440)
+    if len(cols["ts"]):
+        minute = ((np.asarray(cols["ts"]) + IST_OFFSET) % 86400) // 60
+        np.add.at(profile, minute, np.asarray(cols["volume"], np.float64))
+        profile /= days
+    return profile
+
+
+class ParentOrder:
+    def __init__(self, order: dict, quantity: int, side: str, algo: str = TWAP, start: float = None,
+                 end: float = None, duration: float = None, interval: float = 30.0, limit: float = None,
+                 token: int = None, lot: int = 1, tick: float = 0.05, display: int = None,
+                 profile: np.ndarray = None, aggression: int = 1, max_child: int = None,
+                 reprice_ticks: int = 5):
+        """
+        order is the child template (exchange, symbol, product, ...; quantity
+        and price are filled in per child). Give end or duration.
+        reprice_ticks=None leaves children at their first price.
+        """
+        if algo not in ALGOS:
+            raise ValueError(f"algo must be one of {ALGOS}")
+        if algo == ICEBERG and not display:
+            raise ValueError("iceberg needs a display quantity")
+        self.order = order
+        self.quantity = int(quantity)
+        self.side = 1 if side == "BUY" else -1
+        self.algo = algo
+        self.start = time.time() if start is None else start
+        self.end = end if end is not None else self.start + (duration or 0)
+        self.interval = interval
+        self.limit = limit
+        self.token = token
+        self.lot = lot or 1
+        self.tick = tick
+        self.display = display
+        self.reprice_ticks = reprice_ticks
+        self.aggression = aggression
+        self.max_child = max_child or (display if algo == ICEBERG else None)
+        self.filled = 0
+        self.working = 0
+        self.children = []
+        self.state = "pending"
+        self.cancelled = False
+        self.done = None   # asyncio.Future -> final state, set by ExecutionScheduler.submit
+        self._wake = None
+        self._curve = self._vwap_curve(profile) if algo == VWAP else None
+
+    def _vwap_curve(self, profile):
+        """(minute edges, cumulative weight) over [start, end], partial first/last minutes pro rata."""
+        first, last = int(self.start // 60) * 60, int(-(-self.end // 60)) * 60
+        edges = np.arange(first, max(last, first + 60) + 1, 60, dtype=np.float64)
+        minutes = ((edges[:-1].astype(np.int64) + IST_OFFSET) % 86400) // 60
+        weight = np.asarray(profile, np.float64)[minutes] if profile is not None else np.zeros(len(minutes))
+        if not weight.sum():
+            return None  # no history for this window: fall back to TWAP
+        overlap = np.clip(np.minimum(edges[1:], self.end) - np.maximum(edges[:-1], self.start), 0, 60) / 60
+        weight = weight * overlap
+        edges = np.clip(edges, self.start, self.end)
+        return edges, np.concatenate([[0.0], np.cumsum(weight)])
+
+    def target(self, now: float) -> int:
+        """Quantity that should be filled or working by `now`."""
+        if self.algo == ICEBERG or now >= self.end:
+            return self.quantity
+        if now <= self.start:
+            return 0
+        if self._curve is not None:
+            edges, cum = self._curve
+            frac = float(np.interp(now, edges, cum)) / cum[-1]
+        else:
+            frac = (now - self.start) / (self.end - self.start)
+        return int(self.quantity * frac)
+
+    def next_slice(self, now: float) -> int:
+        due = min(self.target(now), self.quantity) - self.filled - self.working
+        if self.max_child:
+            due = min(due, self.max_child - (self.working if self.algo == ICEBERG else 0))
+        return max(due // self.lot * self.lot, 0)
+
+    def cancel(self):
+        """Stops sending children and cancels the working ones."""
+        self.cancelled = True
+        if self._wake:
+            self._wake.set()
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ExecutionScheduler:
+    def __init__(self, manager, cancel, orders_per_sec: float = 8.0, burst: int = 8, grace: float = 30.0,
+                 cancel_timeout: float = 10.0, kite: bool = False):
+        """
+        manager is an OrderManager; cancel(child_order, orderid) cancels one
+        child at the broker (angel_canceller / kite_canceller) and raises if
+        it could not. kite=True builds Kite-style child orders.
+        """
+        self.manager = manager
+        self.cancel = cancel
+        self.grace = grace
+        self.cancel_timeout = cancel_timeout
+        self.kite = kite
+        self.stats = {"parents": 0, "children": 0, "paused": 0, "repriced": 0, "cancel_failed": 0,
+                      "left_working": 0}
+        self.parents = []
+        self.ltp = {}          # token -> last price
+        self._bucket = _TokenBucket(orders_per_sec, burst)
+        self._children = {}    # client tag -> (parent, child)
+        self._loop = None
+        self._fields = manager.sync.book.fields
+        sync, chained = manager.sync, manager.sync.on_events
+
+        def on_events(events):  # sync thread -> our loop
+            if chained:
+                chained(events)
+            if self._loop:
+                self._loop.call_soon_threadsafe(self._on_events, events)
+        sync.on_events = on_events
+
+    # ---- parents ----
+    def submit(self, parent: ParentOrder) -> ParentOrder:
+        """Starts working a parent; call from the scheduler's event loop."""
+        self._loop = asyncio.get_running_loop()
+        parent.done = self._loop.create_future()
+        parent._wake = asyncio.Event()
+        parent.state = "working"
+        self.parents.append(parent)
+        self.stats["parents"] += 1
+        self._loop.create_task(self._drive(parent))
+        return parent
+
+    async def _drive(self, p: ParentOrder):
+        error = None
+        try:
+            while not p.cancelled and p.filled < p.quantity:
+                now = time.time()
+                if now >= p.end + self.grace:
+                    break
+                self._reprice(p)
+                price = self._price(p)
+                if price is False:
+                    self.stats["paused"] += 1
+                else:
+                    size = p.next_slice(now)
+                    if size > 0:
+                        await self._bucket.acquire()
+                        self._send(p, size, price)
+                p._wake.clear()
+                wait = p.interval if now < p.end else min(p.interval, p.end + self.grace - now)
+                try:
+                    await asyncio.wait_for(p._wake.wait(), max(wait, 0.001))
+                except asyncio.TimeoutError:
+                    pass
+        except Exception as e:
+            error = e
+        try:
+            await self._cancel_all(p)
+        except Exception as e:
+            error = error or e
+        if error is not None:
+            p.state = f"failed: {error}"
+        else:
+            p.state = "filled" if p.filled >= p.quantity else "cancelled" if p.cancelled else "expired"
+        if not p.done.done():
+            p.done.set_result(p.state)
+
+    # ---- cancels ----
+    def _reprice(self, p: ParentOrder):
+        """Cancels children the market has moved more than reprice_ticks away from."""
+        ltp = self.ltp.get(p.token)
+        if ltp is None or not p.reprice_ticks or not p.working:
+            return
+        behind = p.reprice_ticks * p.tick
+        for record in p.children:
+            if record["done"] or record["cancelling"] or record["price"] is None:
+                continue
+            if (ltp - record["price"]) * p.side > behind:
+                record["cancelling"] = True
+                self.stats["repriced"] += 1
+                self._loop.create_task(self._cancel(record))
+
+    async def _cancel(self, record: dict):
+        m = record["order"]
+        try:
+            orderid = await asyncio.wait_for(asyncio.wrap_future(m.ack), self.cancel_timeout)
+            if not m.final.done():
+                await self._loop.run_in_executor(None, self.cancel, m.order, orderid)
+        except Exception:
+            # Already finished, never acked, or the broker refused: the final
+            # state still arrives through the order book
+            if not m.final.done():
+                self.stats["cancel_failed"] += 1
+                record["cancelling"] = False
+
+    async def _cancel_all(self, p: ParentOrder):
+        live = [r for r in p.children if not r["done"]]
+        if not live:
+            return
+        for record in live:
+            if not record["cancelling"]:
+                record["cancelling"] = True
+                self._loop.create_task(self._cancel(record))
+        # Final states (and the last fills) land through _child_final / _on_events first
+        await asyncio.wait([asyncio.wrap_future(r["order"].final) for r in live], timeout=self.cancel_timeout)
+        self.stats["left_working"] += sum(1 for r in live if not r["order"].final.done())
+
+    def _price(self, p: ParentOrder):
+        """Child limit price; None = market order, False = wait (market beyond the limit)."""
+        ltp = self.ltp.get(p.token)
+        if ltp is None:
+            return p.limit
+        if p.limit is not None and (ltp - p.limit) * p.side > 0:
+            return False
+        price = round((ltp + p.side * p.aggression * p.tick) / p.tick) * p.tick
+        if p.limit is not None:
+            price = min(price, p.limit) if p.side > 0 else max(price, p.limit)
+        return round(price, 2)
+
+    def _send(self, p: ParentOrder, size: int, price):
+        if self.kite:
+            child = dict(p.order, quantity=size, order_type="MARKET" if price is None else "LIMIT")
+            if price is not None:
+                child["price"] = price
+        else:
+            child = dict(p.order, quantity=str(size), ordertype="MARKET" if price is None else "LIMIT",
+                         price="0" if price is None else f"{price:.2f}")
+        m = self.manager.place(child)
+        record = {"order": m, "quantity": size, "price": price, "filled": 0, "done": False, "cancelling": False}
+        p.children.append(record)
+        p.working += size
+        self._children[m.tag] = (p, record)
+        self.stats["children"] += 1
+        loop = self._loop
+        m.final.add_done_callback(lambda f: loop.call_soon_threadsafe(self._child_final, p, record, f.result()))
+
+    # ---- fills & ticks ----
+    def _on_events(self, events: list):
+        fields = self._fields
+        for e in events:
+            if e.kind == "trade":
+                continue
+            hit = self._children.get(e.order.get(fields.tag))
+            if hit is None:
+                continue
+            p, record = hit
+            filled = int(float(e.order.get(fields.filled) or 0))
+            delta = filled - record["filled"]
+            if delta > 0:
+                record["filled"] = filled
+                p.filled += delta
+                if not record["done"]:
+                    p.working -= delta
+                p._wake.set()
+
+    def _child_final(self, p: ParentOrder, record: dict, state: str):
+        if record["done"]:
+            return
+        record["done"] = True
+        p.working -= record["quantity"] - record["filled"]
+        if state == "FILLED":  # may land before the event carrying the fill size
+            p.filled += record["quantity"] - record["filled"]
+            record["filled"] = record["quantity"]
+        p._wake.set()
+
+    def on_tick(self, token: int, ltp: float):
+        """Call from any thread (websocket callbacks)."""
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._tick, token, ltp)
+
+    def update_array(self, ticks):
+        """TICK_DTYPE batch, from any thread."""
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._ticks, ticks["token"].tolist(), ticks["ltp"].tolist())
+
+    def _ticks(self, tokens: list, prices: list):
+        for token, ltp in zip(tokens, prices):
+            self._tick(token, ltp)
+
+    def _tick(self, token: int, ltp: float):
+        if ltp <= 0:
+            return
+        old = self.ltp.get(token)
+        self.ltp[token] = ltp
+        if old is None or (old != ltp):
+            for p in self.parents:
+                if p.token != token or p.done.done():
+                    continue
+                self._reprice(p)
+                # Only parents held back by their limit need waking on a tick
+                if p.limit is not None and (old is None or (old - p.limit) * p.side > 0):
+                    p._wake.set()
+
+
+def angel_canceller(client):
+    """cancel() over AngelClient.cancel_order."""
+    def cancel(order: dict, orderid):
+        resp = json.loads(client.cancel_order(orderid, order.get("variety", "NORMAL")))
+        if not resp.get("status"):
+            raise RuntimeError(f"cancelOrder failed: {resp.get('errorcode')}: {resp.get('message')}")
+    return cancel
+
+
+def kite_canceller(kite):
+    """cancel() over kite.cancel_order."""
+    def cancel(order: dict, orderid):
+        kite.cancel_order(order.get("variety", "regular"), orderid)
+    return cancel
+
+
+def angel_scheduler(client, manager=None, **kwargs) -> ExecutionScheduler:
+    """ExecutionScheduler over AngelClient (its own OrderManager unless given one)."""
+    return ExecutionScheduler(manager or angel_manager(client), angel_canceller(client), **kwargs)
+
+
+def kite_scheduler(kite, manager=None, **kwargs) -> ExecutionScheduler:
+    """ExecutionScheduler over KiteConnect (its own OrderManager unless given one)."""
+    return ExecutionScheduler(manager or kite_manager(kite), kite_canceller(kite), kite=True, **kwargs)
+
+
+if __name__ == "__main__":
+    import random
+    import threading
+    from order_book import angel_sync
+    from order_manager import OrderManager, angel_sender
+
+    class MatchingBroker:
+        """Fills resting limit orders against a random-walk price, partially at times."""
+
+        def __init__(self, price: float = 800.0):
+            self.price = price
+            self.book = []
+            self.lock = threading.Lock()
+            self.rng = random.Random(3)
+
+        def place_order(self, order: dict) -> str:
+            with self.lock:
+                orderid = str(250402000000000 + len(self.book))
+                self.book.append(dict(order, orderid=orderid, status="open", filledshares="0",
+                                      averageprice=0.0, updatetime=str(time.time())))
+            return json.dumps({"status": True, "data": {"orderid": orderid}})
+
+        def cancel_order(self, orderid: str, variety: str = "NORMAL") -> str:
+            with self.lock:
+                for o in self.book:
+                    if o["orderid"] == orderid and o["status"] == "open":
+                        o["status"] = "cancelled"
+                        o["updatetime"] = str(time.time())
+                        return json.dumps({"status": True, "data": {"orderid": orderid}})
+            return json.dumps({"status": False, "errorcode": "AB9999", "message": "order not open"})
+
+        def step(self):
+            with self.lock:
+                self.price = max(self.price + self.rng.choice((-0.05, 0, 0.05)), 1)
+                for o in self.book:
+                    if o["status"] != "open":
+                        continue
+                    limit = float(o["price"]) if o["ordertype"] == "LIMIT" else None
+                    buy = o["transactiontype"] == "BUY"
+                    if limit is None or (self.price <= limit if buy else self.price >= limit):
+                        qty, filled = int(o["quantity"]), int(o["filledshares"])
+                        fill = qty - filled if self.rng.random() < 0.7 else max((qty - filled) // 2, 1)
+                        o["filledshares"] = str(filled + fill)
+                        o["status"] = "complete" if filled + fill == qty else "open"
+                        o["updatetime"] = str(time.time())
+            return self.price
+
+        def get_orderbook(self) -> str:
+            with self.lock:
+                return json.dumps({"status": True, "data": [dict(o) for o in self.book]})
+
+    async def main():
+        broker = MatchingBroker()
+        sync = angel_sync(broker, interval=0.05, trades=False)
+        sync.start()
+        manager = OrderManager(angel_sender(broker), sync, "ordertag", workers=16)
+        sched = ExecutionScheduler(manager, angel_canceller(broker), orders_per_sec=50, burst=20, grace=2.0)
+        template = {"variety": "NORMAL", "tradingsymbol": "SBIN-EQ", "symboltoken": "3045",
+                    "exchange": "NSE", "producttype": "INTRADAY", "duration": "DAY"}
+        profile = np.zeros(1440)
+        profile[:] = 1 + np.cos(np.linspace(0, 2 * np.pi, 1440)) ** 2  # U-shaped day
+        parents = []
+        for i in range(30):
+            algo = ALGOS[i % 3]
+            side = "BUY" if i % 2 else "SELL"
+            parents.append(sched.submit(ParentOrder(
+                dict(template, transactiontype=side), 1000, side, algo=algo, duration=3.0, interval=0.25,
+                token=3045, display=150 if algo == ICEBERG else None, profile=profile,
+                limit=810.0 if side == "BUY" else 790.0)))
+        for p in parents[:2]:   # cancelled midway: their working children must not stay behind
+            asyncio.get_running_loop().call_later(1.0, p.cancel)
+        t0 = time.perf_counter()
+        while not all(p.done.done() for p in parents):
+            sched.on_tick(3045, broker.step())
+            await asyncio.sleep(0.02)
+        elapsed = time.perf_counter() - t0
+        sync.close()
+        manager.close()
+        for algo in ALGOS:
+            ps = [p for p in parents if p.algo == algo]
+            print(f"{algo:8s} {len(ps)} parents: states {sorted({p.state for p in ps})}, "
+                  f"{sum(p.filled for p in ps)}/{sum(p.quantity for p in ps)} filled, "
+                  f"{sum(len(p.children) for p in ps)} children")
+        resting = sum(o["status"] == "open" for o in broker.book)
+        assert resting == 0, f"{resting} children left resting"
+        print(f"30 parents on one loop in {elapsed:.2f} s, {resting} children left resting; {sched.stats}; "
+              f"manager {manager.stats}")
+
+    asyncio.run(main())
@@ -0,0 +1,356 @@
+# instruments.py
+"""
+Offline, daily-refreshed instrument master for Angel and Kite.
+
+The broker masters (Kite's instruments CSV, Angel's OpenAPIScripMaster.json)
+are downloaded at most once per day, normalised to one schema and saved as
+a compact columnar .npz: numeric columns are numpy arrays; string columns
+are a table of unique, interned strings plus int32 codes. Later runs load
+that file in milliseconds instead of downloading and parsing the full
+master, and keep it in a fraction of the memory of ~100k Python dicts.
+
+Lookups:
+    master = load_master("kite")
+    master.token("NSE", "INFY")            # O(1) symbol -> token
+    master.get(408065)                     # O(1) token -> row dict
+    master.get(3045, "NSE")                # Angel tokens are only unique per exchange
+    master.search("INF", exchange="NSE")   # prefix search (binary search)
+
+    xmap = load_crossmap()
+    xmap.angel_to_kite(1594, "NSE")        # Angel symboltoken -> Kite instrument_token
+    xmap.kite_to_angel(408065)             # -> ("NSE", 1594)
+"""
+import os
+import io
+import csv
+import sys
+import json
+import bisect
+import datetime as dt
+import urllib.request
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "instruments")
+KITE_URL = "https://api.kite.trade/instruments"
+ANGEL_URL = "https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json"
+
+STR_COLUMNS = ("symbol", "name", "exchange", "segment", "instrument_type", "expiry")
+NUM_COLUMNS = {
+    "token": np.int64,
+    "strike": np.float64,
+    "lot_size": np.int32,
+    "tick_size": np.float64,
+}
+EQ_SERIES = {"EQ", "BE", "BZ", "SM", "ST", "IL", "IV", "GB", "GS", "N1", "N2", "N3"}
+
+
+# ---- normalisation ----
+def _kite_rows(kite=None) -> list:
+    """Kite master as list of normalised dicts (via kite.instruments() or the public CSV)."""
+    if kite is not None:
+        raw = kite.instruments()
+    else:
+        with urllib.request.urlopen(KITE_URL, timeout=60) as resp:
+            raw = list(csv.DictReader(io.StringIO(resp.read().decode("utf-8"))))
+    rows = []
+    for r in raw:
+        expiry = r.get("expiry") or ""
+        rows.append({
+            "token": int(r["instrument_token"]),
+            "symbol": r["tradingsymbol"],
+            "name": r.get("name") or "",
+            "exchange": r["exchange"],
+            "segment": r.get("segment") or "",
+            "instrument_type": r.get("instrument_type") or "",
+            "expiry": expiry.isoformat() if hasattr(expiry, "isoformat") else str(expiry),
+            "strike": float(r.get("strike") or 0),
+            "lot_size": int(float(r.get("lot_size") or 0)),
+            "tick_size": float(r.get("tick_size") or 0),
+        })
+    return rows
+
+
+def _angel_type(symbol: str, instrumenttype: str) -> str:
+    if instrumenttype.startswith("OPT"):
+        return symbol[-2:]  # CE / PE
+    if instrumenttype.startswith("FUT"):
+        return "FUT"
+    if not instrumenttype and symbol.rsplit("-", 1)[-1] in EQ_SERIES:
+        return "EQ"
+    return instrumenttype
+
+
+def _angel_rows() -> list:
+    with urllib.request.urlopen(ANGEL_URL, timeout=60) as resp:
+        raw = json.loads(resp.read())
+    rows = []
+    for r in raw:
+        try:
+            token = int(r["token"])
+        except (KeyError, ValueError):
+            continue
+        expiry = r.get("expiry") or ""
+        if expiry:
+            expiry = dt.datetime.strptime(expiry, "%d%b%Y").date().isoformat()
+        strike = float(r.get("strike") or 0)
+        rows.append({
+            "token": token,
+            "symbol": r["symbol"],
+            "name": r.get("name") or "",
+            "exchange": r["exch_seg"],
+            "segment": r["exch_seg"],
+            "instrument_type": _angel_type(r["symbol"], r.get("instrumenttype") or ""),
+            "expiry": expiry,
+            "strike": strike / 100 if strike > 0 else 0.0,     # Angel strikes are in paise
+            "lot_size": int(float(r.get("lotsize") or 0)),
+            "tick_size": float(r.get("tick_size") or 0) / 100,  # also in paise
+        })
+    return rows
+
+
+# ---- columnar master ----
+class InstrumentMaster:
+    def __init__(self, columns: dict):
+        self.columns = columns
+        self.n = len(columns["token"])
+        # String tables; low-cardinality ones are interned so every row shares one object
+        self._tables = {
+            c: columns[c + "_table"] if c == "symbol" else [sys.intern(v) for v in columns[c + "_table"]]
+            for c in STR_COLUMNS
+        }
+        self._codes = {c: columns[c + "_codes"] for c in STR_COLUMNS}
+        # Angel symboltokens repeat across exch_seg, so rows are keyed by
+        # (exchange, token); a bare token resolves only when it is unique
+        tokens = columns["token"].tolist()
+        exchanges = [self._tables["exchange"][c] for c in self._codes["exchange"].tolist()]
+        self._by_token = dict(zip(zip(exchanges, tokens), range(self.n)))
+        self._by_bare_token = {}
+        for i, token in enumerate(tokens):
+            self._by_bare_token[token] = -1 if token in self._by_bare_token else i
+
+        # {exchange: {symbol: row}}
+        syms = self._tables["symbol"]
+        sym_codes = self._codes["symbol"]
+        exch_codes = self._codes["exchange"]
+        self._by_symbol = {}
+        for e, exchange in enumerate(self._tables["exchange"]):
+            rows = np.flatnonzero(exch_codes == e)
+            self._by_symbol[exchange] = dict(zip([syms[c] for c in sym_codes[rows].tolist()], rows.tolist()))
+
+        # The symbol table is sorted (see from_rows), so prefix search is a
+        # bisect on the table plus a lookup of the rows carrying each code.
+        self._rows_by_symbol = np.argsort(sym_codes, kind="stable")
+        self._sorted_codes = sym_codes[self._rows_by_symbol]
+
+    # ---- build / persist ----
+    @classmethod
+    def from_rows(cls, rows: list) -> "InstrumentMaster":
+        columns = {}
+        for c, dtype in NUM_COLUMNS.items():
+            columns[c] = np.array([r[c] for r in rows], dtype=dtype)
+        for c in STR_COLUMNS:
+            table = sorted({r[c] for r in rows})
+            index = {v: i for i, v in enumerate(table)}
+            columns[c + "_table"] = table
+            columns[c + "_codes"] = np.array([index[r[c]] for r in rows], np.int32)
+        return cls(columns)
+
+    def save(self, path: str):
+        arrays = {c: self.columns[c] for c in NUM_COLUMNS}
+        for c in STR_COLUMNS:
+            arrays[c + "_codes"] = self._codes[c]
+            # one UTF-8 blob per table, newline separated (no pickling)
+            arrays[c + "_table"] = np.frombuffer("\n".join(self._tables[c]).encode("utf-8"), np.uint8)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "InstrumentMaster":
+        with np.load(path, allow_pickle=False) as z:
+            columns = {c: z[c] for c in NUM_COLUMNS}
+            for c in STR_COLUMNS:
+                columns[c + "_codes"] = z[c + "_codes"]
+                columns[c + "_table"] = z[c + "_table"].tobytes().decode("utf-8").split("\n")
+        return cls(columns)
+
+    # ---- lookups ----
+    def row(self, i: int) -> dict:
+        out = {c: self._tables[c][self._codes[c][i]] for c in STR_COLUMNS}
+        for c in NUM_COLUMNS:
+            out[c] = self.columns[c][i].item()
+        return out
+
+    def get(self, token: int, exchange: str = None) -> dict:
+        """Row for token on exchange; without exchange the token must be unique (always true for Kite)."""
+        if exchange is not None:
+            i = self._by_token.get((exchange, int(token)))
+        else:
+            i = self._by_bare_token.get(int(token))
+            if i == -1:
+                raise KeyError(f"token {token} is listed on several exchanges; pass exchange")
+        return None if i is None else self.row(i)
+
+    def token(self, exchange: str, symbol: str) -> int:
+        i = self._by_symbol.get(exchange, {}).get(symbol)
+        if i is None:
+            raise KeyError(f"{exchange}:{symbol} not in instrument master")
+        return int(self.columns["token"][i])
+
+    def lookup(self, exchange: str, symbol: str) -> dict:
+        i = self._by_symbol.get(exchange, {}).get(symbol)
+        return None if i is None else self.row(i)
+
+    def search(self, prefix: str, exchange: str = None, limit: int = 20) -> list:
+        """Rows whose symbol starts with prefix (case-sensitive, as brokers list them)."""
+        out = []
+        table = self._tables["symbol"]
+        exch_codes, exch = self._codes["exchange"], self._tables["exchange"]
+        for code in range(bisect.bisect_left(table, prefix), len(table)):
+            if not table[code].startswith(prefix):
+                break
+            lo = np.searchsorted(self._sorted_codes, code, "left")
+            hi = np.searchsorted(self._sorted_codes, code, "right")
+            for i in self._rows_by_symbol[lo:hi].tolist():
+                if exchange and exch[exch_codes[i]] != exchange:
+                    continue
+                out.append(self.row(i))
+                if len(out) >= limit:
+                    return out
+        return out
+
+    def tokens(self, **where) -> np.ndarray:
+        """Tokens of every row matching all string-column filters, e.g. exchange="NSE", instrument_type="EQ"."""
+        mask = np.ones(self.n, bool)
+        for c, value in where.items():
+            table = self._tables[c]
+            i = bisect.bisect_left(table, value)
+            if i == len(table) or table[i] != value:
+                return np.empty(0, np.int64)
+            mask &= self._codes[c] == i
+        return self.columns["token"][mask]
+
+    def __len__(self):
+        return self.n
+
+
+# ---- Angel <-> Kite cross map ----
+def _cross_key(r: dict):
+    kind = r["instrument_type"]
+    if kind == "EQ":
+        base = r["symbol"]
+        head, _, series = base.rpartition("-")
+        if head and series in EQ_SERIES:
+            base = head  # Angel "SBIN-EQ" -> Kite "SBIN"
+        return (r["exchange"], "EQ", base)
+    if kind in ("CE", "PE", "FUT"):
+        return (r["exchange"], kind, r["name"], r["expiry"], round(r["strike"], 2))
+    return None
+
+
+class CrossMap:
+    def __init__(self, exchanges: np.ndarray, angel_tokens: np.ndarray, kite_tokens: np.ndarray):
+        self.exchanges = exchanges
+        self.angel_tokens = angel_tokens
+        self.kite_tokens = kite_tokens
+        angel_keys = list(zip(exchanges.tolist(), angel_tokens.tolist()))
+        self._a2k = dict(zip(angel_keys, kite_tokens.tolist()))
+        self._k2a = dict(zip(kite_tokens.tolist(), angel_keys))
+
+    @classmethod
+    def build(cls, angel: InstrumentMaster, kite: InstrumentMaster) -> "CrossMap":
+        kite_keys = {}
+        for i in range(len(kite)):
+            key = _cross_key(kite.row(i))
+            if key is not None:
+                kite_keys[key] = int(kite.columns["token"][i])
+        pairs = []
+        for i in range(len(angel)):
+            key = _cross_key(angel.row(i))
+            k = kite_keys.get(key) if key is not None else None
+            if k is not None:
+                pairs.append((key[0], int(angel.columns["token"][i]), k))
+        e = np.array([p[0] for p in pairs], dtype="U8")
+        a = np.array([p[1] for p in pairs], np.int64)
+        k = np.array([p[2] for p in pairs], np.int64)
+        return cls(e, a, k)
+
+    def save(self, path: str):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, exchange=self.exchanges, angel=self.angel_tokens, kite=self.kite_tokens)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CrossMap":
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z["exchange"], z["angel"], z["kite"])
+
+    def angel_to_kite(self, symboltoken, exchange: str) -> int:
+        return self._a2k.get((exchange, int(symboltoken)))
+
+    def kite_to_angel(self, instrument_token) -> tuple:
+        """(exchange, Angel symboltoken); Kite tokens are unique on their own."""
+        return self._k2a.get(int(instrument_token))
+
+    def __len__(self):
+        return len(self.angel_tokens)
+
+
+# ---- daily cache ----
+def _today_path(name: str, data_dir: str) -> str:
+    return os.path.join(data_dir, f"{name}-{dt.date.today().isoformat()}.npz")
+
+
+def _prune(name: str, keep: str, data_dir: str):
+    for f in os.listdir(data_dir):
+        if f.startswith(name + "-") and f.endswith(".npz") and os.path.join(data_dir, f) != keep:
+            try:
+                os.remove(os.path.join(data_dir, f))
+            except OSError:
+                pass
+
+
+def load_master(broker: str, kite=None, data_dir: str = DATA_DIR, refresh: bool = False) -> InstrumentMaster:
+    """
+    Today's master for broker ("kite" or "angel"): loaded from disk when
+    present, otherwise downloaded once, saved, and older days pruned.
+    """
+    if broker not in ("kite", "angel"):
+        raise ValueError(f"unknown broker: {broker}")
+    os.makedirs(data_dir, exist_ok=True)
+    path = _today_path(broker, data_dir)
+    if os.path.exists(path) and not refresh:
+        return InstrumentMaster.load(path)
+    rows = _kite_rows(kite) if broker == "kite" else _angel_rows()
+    master = InstrumentMaster.from_rows(rows)
+    master.save(path)
+    _prune(broker, path, data_dir)
+    return master
+
+
+def load_crossmap(kite=None, data_dir: str = DATA_DIR, refresh: bool = False) -> CrossMap:
+    """Today's Angel <-> Kite token map, built from both masters on first use."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = _today_path("crossmap", data_dir)
+    if os.path.exists(path) and not refresh:
+        try:
+            return CrossMap.load(path)
+        except KeyError:  # written before exchanges were stored: rebuild
+            pass
+    xmap = CrossMap.build(load_master("angel", data_dir=data_dir, refresh=refresh),
+                          load_master("kite", kite, data_dir=data_dir, refresh=refresh))
+    xmap.save(path)
+    _prune("crossmap", path, data_dir)
+    return xmap
+
+
+if __name__ == "__main__":
+    import time
+
+    for broker in ("kite", "angel"):
+        t0 = time.perf_counter()
+        master = load_master(broker)
+        print(f"{broker}: {len(master)} instruments in {(time.perf_counter() - t0) * 1e3:.1f} ms")
+    t0 = time.perf_counter()
+    xmap = load_crossmap()
+    print(f"crossmap: {len(xmap)} pairs in {(time.perf_counter() - t0) * 1e3:.1f} ms")
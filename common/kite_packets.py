@@ -0,0 +1,130 @@
+# kite_packets.py
+"""
+Kite websocket binary packets <-> KiteTicker-style tick dicts.
+
+parse_packet()/parse_message() produce exactly the dicts KiteTicker hands to
+on_ticks (kiteconnect 4.x), without needing a KiteTicker instance, so
+recorded packets (tick_journal.py) can be replayed through unchanged code.
+build_message() does the reverse framing for replays that feed on_message.
+"""
+import struct
+import datetime as dt
+
+MODE_LTP = "ltp"
+MODE_QUOTE = "quote"
+MODE_FULL = "full"
+# instrument_token & 0xff -> segment
+EXCHANGE_MAP = {"nse": 1, "nfo": 2, "cds": 3, "bse": 4, "bfo": 5, "bcd": 6, "mcx": 7, "mcxsx": 8, "indices": 9}
+# Packet length per mode, for tradable instruments and for indices
+PACKET_LENGTHS = {MODE_LTP: 8, MODE_QUOTE: 44, MODE_FULL: 184}
+INDEX_PACKET_LENGTHS = {MODE_LTP: 8, MODE_QUOTE: 28, MODE_FULL: 32}
+
+_QUOTE = struct.Struct(">IIIIIIIIIII")   # 44 bytes
+_FULL_EXTRA = struct.Struct(">IIIII")    # 44..64
+_LEVEL = struct.Struct(">IIH2x")         # depth entry, 12 bytes
+_INDEX = struct.Struct(">IIIIIII")       # 28 bytes
+
+
+def divisor_for(token: int) -> float:
+    segment = token & 0xFF
+    if segment == EXCHANGE_MAP["cds"]:
+        return 10000000.0
+    if segment == EXCHANGE_MAP["bcd"]:
+        return 10000.0
+    return 100.0
+
+
+def _time(value: int):
+    try:
+        return dt.datetime.fromtimestamp(value)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def _change(last_price: float, close: float) -> float:
+    return (last_price - close) * 100 / close if close != 0 else 0
+
+
+def parse_packet(packet: bytes) -> dict:
+    """One binary packet -> tick dict (same keys and types as KiteTicker)."""
+    n = len(packet)
+    token = struct.unpack_from(">I", packet, 0)[0]
+    divisor = divisor_for(token)
+    tradable = (token & 0xFF) != EXCHANGE_MAP["indices"]
+
+    if n == 8:
+        return {"tradable": tradable, "mode": MODE_LTP, "instrument_token": token,
+                "last_price": struct.unpack_from(">I", packet, 4)[0] / divisor}
+
+    if n in (28, 32):
+        _, ltp, high, low, open_, close, _ = _INDEX.unpack_from(packet, 0)
+        d = {"tradable": tradable, "mode": MODE_QUOTE if n == 28 else MODE_FULL,
+             "instrument_token": token, "last_price": ltp / divisor,
+             "ohlc": {"high": high / divisor, "low": low / divisor,
+                      "open": open_ / divisor, "close": close / divisor}}
+        d["change"] = _change(d["last_price"], d["ohlc"]["close"])
+        if n == 32:
+            d["exchange_timestamp"] = _time(struct.unpack_from(">I", packet, 28)[0])
+        return d
+
+    if n in (44, 184):
+        (_, ltp, ltq, avg, volume, buy_qty, sell_qty,
+         open_, high, low, close) = _QUOTE.unpack_from(packet, 0)
+        d = {"tradable": tradable, "mode": MODE_QUOTE if n == 44 else MODE_FULL,
+             "instrument_token": token, "last_price": ltp / divisor,
+             "last_traded_quantity": ltq, "average_traded_price": avg / divisor,
+             "volume_traded": volume, "total_buy_quantity": buy_qty,
+             "total_sell_quantity": sell_qty,
+             "ohlc": {"open": open_ / divisor, "high": high / divisor,
+                      "low": low / divisor, "close": close / divisor}}
+        d["change"] = _change(d["last_price"], d["ohlc"]["close"])
+        if n == 184:
+            ltt, oi, oi_high, oi_low, ets = _FULL_EXTRA.unpack_from(packet, 44)
+            d["last_trade_time"] = _time(ltt)
+            d["oi"] = oi
+            d["oi_day_high"] = oi_high
+            d["oi_day_low"] = oi_low
+            d["exchange_timestamp"] = _time(ets)
+            depth = {"buy": [], "sell": []}
+            for i in range(10):
+                qty, price, orders = _LEVEL.unpack_from(packet, 64 + i * 12)
+                depth["sell" if i >= 5 else "buy"].append(
+                    {"quantity": qty, "price": price / divisor, "orders": orders})
+            d["depth"] = depth
+        return d
+
+    return None  # unknown packet length
+
+
+def split_message(payload: bytes) -> list:
+    """Binary websocket message -> packets ([count][len][packet][len][packet]...)."""
+    if len(payload) < 2:
+        return []  # 1-byte heartbeat
+    count = struct.unpack_from(">H", payload, 0)[0]
+    packets, pos = [], 2
+    for _ in range(count):
+        length = struct.unpack_from(">H", payload, pos)[0]
+        packets.append(payload[pos + 2:pos + 2 + length])
+        pos += 2 + length
+    return packets
+
+
+def parse_message(payload: bytes) -> list:
+    """Binary websocket message -> list of tick dicts, as KiteTicker.on_ticks gets it."""
+    return [t for t in map(parse_packet, split_message(payload)) if t is not None]
+
+
+def build_message(packets: list) -> bytes:
+    """Packets -> one binary websocket message."""
+    parts = [struct.pack(">H", len(packets))]
+    for p in packets:
+        parts.append(struct.pack(">H", len(p)))
+        parts.append(p)
+    return b"".join(parts)
+
+
+def packet_length(token: int, mode: str) -> int:
+    """Length of the packet Kite sends for token in mode."""
+    if (token & 0xFF) == EXCHANGE_MAP["indices"]:
+        return INDEX_PACKET_LENGTHS[mode]
+    return PACKET_LENGTHS[mode]
@@ -0,0 +1,364 @@
+# market_snapshot.py
+"""
+Latest quote per instrument in shared memory, for any number of processes.
+
+One feed process (ticker_example.py, a SmartStream script, ...) owns a
+SnapshotWriter and publishes every tick batch into a
+multiprocessing.shared_memory segment. Strategy, risk and UI processes open
+a SnapshotReader on the same name and read quotes straight out of the
+segment: no sockets, no copies of the whole table, no REST calls.
+
+Layout: a 64-byte header (magic, capacity, slots in use, last update) and
+then one 128-byte slot per instrument:
+
+    seq <u8 | token <u4 | mode <u4 | ltp bid ask <f8 | volume oi <u8 |
+    bid_qty ask_qty <u4 | exchange_ts <i8 (epoch s) | recv_ns <i8
+
+Slots are handed out in order and never move, so a reader caches
+token -> slot and only rescans the token column for tokens it has not seen.
+
+Each slot is guarded by a seqlock: the writer makes seq odd, writes the
+fields, then makes it even again. A reader unpacks the slot (seq first),
+re-reads seq and retries if the two differ or are odd, so it never sees a
+half-written quote and never blocks the writer. (Stores become visible in
+program order on x86; on weakly ordered CPUs the retry is best effort.)
+
+Usage:
+    snapshot = SnapshotWriter()              # feed process
+    snapshot.write_array(ticks)              # TICK_DTYPE batch, e.g. from on_ticks_array
+
+    quotes = SnapshotReader()                # any other process
+    quotes.get(408065)                       # Quote(token=408065, ltp=1502.5, ...)
+    quotes.ltp(408065)
+"""
+import time
+import struct
+import collections
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+DEFAULT_NAME = "kite_snapshot"
+DEFAULT_CAPACITY = 16384
+TAKEOVER_AFTER = 10.0  # seconds without a publish before a leftover segment counts as abandoned
+MAGIC = b"KSNP"
+HEADER_SIZE = 64
+SLOT_SIZE = 128
+
+SNAPSHOT_DTYPE = np.dtype({
+    "names": ["seq", "token", "mode", "ltp", "bid", "ask", "volume", "oi",
+              "bid_qty", "ask_qty", "exchange_ts", "recv_ns"],
+    "formats": ["<u8", "<u4", "<u4", "<f8", "<f8", "<f8", "<u8", "<u8",
+                "<u4", "<u4", "<i8", "<i8"],
+    "offsets": [0, 8, 12, 16, 24, 32, 40, 48, 56, 60, 64, 72],
+    "itemsize": SLOT_SIZE,
+})
+FIELDS = SNAPSHOT_DTYPE.names[1:]
+Quote = collections.namedtuple("Quote", FIELDS)
+
+_HEADER = struct.Struct("<4sIIIq")   # magic, slot size, capacity, used, updated_ns
+_unpack_slot = struct.Struct("<QIIdddQQIIqq").unpack_from
+_unpack_ltp = struct.Struct("<Q8xd").unpack_from   # seq, ltp
+_unpack_seq = struct.Struct("<Q").unpack_from
+_OWNED = set()  # segments created by a SnapshotWriter in this process (or its forked parent)
+
+
+def _slots(buf, capacity: int) -> np.ndarray:
+    return np.ndarray((capacity,), SNAPSHOT_DTYPE, buf, HEADER_SIZE)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Opens an existing segment without making this process responsible for unlinking it."""
+    try:
+        return shared_memory.SharedMemory(name, create=False, track=False)
+    except TypeError:  # Python < 3.13 always registers with the resource tracker
+        shm = shared_memory.SharedMemory(name, create=False)
+        if name not in _OWNED:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SnapshotWriter:
+    """Single writer: owns (and by default creates) the segment."""
+
+    def __init__(self, name: str = DEFAULT_NAME, capacity: int = DEFAULT_CAPACITY, create: bool = True):
+        size = HEADER_SIZE + capacity * SLOT_SIZE
+        if create:
+            try:
+                self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+            except FileExistsError:
+                # Left over from a feed process that died: take it over and reset it,
+                # unless another writer is still publishing into it
+                self.shm = shared_memory.SharedMemory(name)
+                if self.shm.size < size:
+                    self.shm.close()
+                    raise ValueError(f"existing segment {name} is smaller than {capacity} slots")
+                magic, _, _, _, updated = _HEADER.unpack_from(self.shm.buf, 0)
+                age = (time.time_ns() - updated) / 1e9
+                if magic == MAGIC and updated and age < TAKEOVER_AFTER:
+                    self.shm.close()
+                    raise RuntimeError(f"segment {name} is live (last publish {age:.1f} s ago)")
+            _OWNED.add(name)
+            self.shm.buf[:size] = bytes(size)
+            _HEADER.pack_into(self.shm.buf, 0, MAGIC, SLOT_SIZE, capacity, 0, 0)
+        else:
+            self.shm = _attach(name)
+            capacity = _HEADER.unpack_from(self.shm.buf, 0)[2]
+        self.name = name
+        self.capacity = capacity
+        self.slots = _slots(self.shm.buf, capacity)
+        self._header = np.ndarray((2,), "<u4", self.shm.buf, 8)        # capacity, used
+        self._updated = np.ndarray((1,), "<i8", self.shm.buf, 16)
+        self.index = {int(t): i for i, t in enumerate(self.slots["token"][:int(self._header[1])])}
+        self.stats = {"batches": 0, "ticks": 0}
+
+    def slot_of(self, tokens) -> np.ndarray:
+        """Slot per token, adding unseen tokens (published to readers by the write that fills them)."""
+        index = self.index
+        out = np.empty(len(tokens), np.int64)
+        for i, t in enumerate(tokens.tolist() if isinstance(tokens, np.ndarray) else tokens):
+            slot = index.get(t)
+            if slot is None:
+                slot = len(index)
+                if slot >= self.capacity:
+                    raise ValueError(f"snapshot full ({self.capacity} instruments)")
+                index[t] = slot
+                self.slots["token"][slot] = t
+            out[i] = slot
+        return out
+
+    def write_array(self, ticks: np.ndarray):
+        """Publishes a TICK_DTYPE batch; fields a tick's mode does not carry keep their last value."""
+        if not len(ticks):
+            return
+        slots = self.slot_of(ticks["token"])
+        # Build the new rows off to the side, so each slot is odd only for one row copy
+        rows = self.slots[slots]
+        recv_ns = time.time_ns()
+        rows["seq"] += 1
+        rows["mode"] = ticks["mode"]
+        rows["ltp"] = ticks["ltp"]
+        rows["exchange_ts"] = np.where(ticks["exchange_ts"] > 0, ticks["exchange_ts"], ticks["last_trade_ts"])
+        rows["recv_ns"] = recv_ns
+        quote = ticks["mode"] >= 2
+        rows["volume"] = np.where(quote, ticks["volume"], rows["volume"])
+        full = ticks["mode"] >= 3
+        if full.any():
+            for name, src in (("oi", ticks["oi"]), ("bid", ticks["bid"][:, 0]), ("ask", ticks["ask"][:, 0]),
+                              ("bid_qty", ticks["bid_qty"][:, 0]), ("ask_qty", ticks["ask_qty"][:, 0])):
+                rows[name] = np.where(full, src, rows[name])
+        seq = self.slots["seq"]
+        seq[slots] = rows["seq"]   # odd: slot being written
+        self.slots[slots] = rows
+        seq[slots] += 1            # even: slot consistent again
+        self._header[1] = len(self.index)
+        self._updated[0] = recv_ns
+        self.stats["batches"] += 1
+        self.stats["ticks"] += len(ticks)
+
+    def update(self, token: int, ltp: float, bid: float = None, ask: float = None, volume: int = None,
+               oi: int = None, exchange_ts: int = None, **fields):
+        """Publishes one quote given as values (unchanged fields keep their last value)."""
+        slot = int(self.slot_of([int(token)])[0])
+        rec = self.slots[slot:slot + 1]
+        rec["seq"] += 1
+        values = dict(ltp=ltp, bid=bid, ask=ask, volume=volume, oi=oi, exchange_ts=exchange_ts, **fields)
+        for name, value in values.items():
+            if value is not None:
+                rec[name] = value
+        now = time.time_ns()
+        rec["recv_ns"] = now
+        rec["seq"] += 1
+        self._header[1] = len(self.index)
+        self._updated[0] = now
+
+    def close(self, unlink: bool = True):
+        self.slots = self._header = self._updated = None  # release the buffer exports
+        self.shm.close()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+            _OWNED.discard(self.name)
+
+
+class SnapshotReader:
+    """Lock-free reader; open as many as needed, in any process."""
+
+    def __init__(self, name: str = DEFAULT_NAME, retries: int = 10_000):
+        self.shm = _attach(name)
+        magic, slot_size, capacity, _, _ = _HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC or slot_size != SLOT_SIZE:
+            self.shm.close()
+            raise ValueError(f"{name} is not a market snapshot")
+        self.name = name
+        self.capacity = capacity
+        self.retries = retries
+        self.buf = self.shm.buf
+        self.slots = _slots(self.buf, capacity)
+        self.index = {}    # token -> slot
+        self.offsets = {}  # token -> byte offset of its slot
+        self.stats = {"retries": 0}
+
+    def _refresh(self):
+        used = _HEADER.unpack_from(self.buf, 0)[3]
+        self.index = {t: i for i, t in enumerate(self.slots["token"][:used].tolist())}
+        self.offsets = {t: HEADER_SIZE + i * SLOT_SIZE for t, i in self.index.items()}
+
+    def _slot(self, token: int):
+        if token not in self.index:
+            self._refresh()
+        return self.index.get(token)
+
+    def _retry(self, token: int, unpack):
+        """Slow path: the slot is being written (or the token is new to this reader)."""
+        offset = self.offsets.get(token)
+        if offset is None:
+            self._refresh()
+            offset = self.offsets.get(token)
+            if offset is None:
+                return None
+        buf, seq = self.buf, _unpack_seq
+        for attempt in range(self.retries):
+            values = unpack(buf, offset)
+            if not values[0] & 1 and seq(buf, offset)[0] == values[0]:
+                return values
+            self.stats["retries"] += 1
+            if attempt % 64 == 63:
+                time.sleep(0)  # a writer thread in this process may need the GIL to finish
+        raise TimeoutError(f"token {token}: slot kept changing during {self.retries} reads")
+
+    def raw(self, token: int):
+        """Consistent slot tuple (seq, token, mode, ltp, ...) or None if never published."""
+        offset = self.offsets.get(token)
+        if offset is not None:
+            buf = self.buf
+            values = _unpack_slot(buf, offset)
+            if not values[0] & 1 and _unpack_seq(buf, offset)[0] == values[0]:
+                return values
+        return self._retry(token, _unpack_slot)
+
+    def ltp(self, token: int) -> float:
+        offset = self.offsets.get(token)
+        if offset is not None:
+            buf = self.buf
+            values = _unpack_ltp(buf, offset)
+            if not values[0] & 1 and _unpack_seq(buf, offset)[0] == values[0]:
+                return values[1]
+        values = self._retry(token, _unpack_ltp)
+        return None if values is None else values[1]
+
+    def get(self, token: int):
+        """Quote namedtuple for token, or None."""
+        values = self.raw(token)
+        return None if values is None else Quote._make(values[1:])
+
+    def read(self, tokens) -> np.ndarray:
+        """Consistent copy of several slots at once (SNAPSHOT_DTYPE; all zero where unknown)."""
+        tokens = [int(t) for t in tokens]
+        slots = [self.index.get(t) for t in tokens]
+        if None in slots:
+            slots = [self._slot(t) if s is None else s for t, s in zip(tokens, slots)]
+        where = np.array([i for i, s in enumerate(slots) if s is not None], np.int64)
+        idx = np.array([s for s in slots if s is not None], np.int64)
+        out = np.zeros(len(tokens), SNAPSHOT_DTYPE)
+        seq = self.slots["seq"]
+        pending = np.arange(len(idx))
+        for _ in range(self.retries):
+            sel = idx[pending]
+            before = seq[sel]
+            rows = self.slots[sel]
+            ok = (before == seq[sel]) & (before & 1 == 0)
+            out[where[pending[ok]]] = rows[ok]
+            pending = pending[~ok]
+            if not len(pending):
+                return out
+            self.stats["retries"] += len(pending)
+        raise TimeoutError(f"{len(pending)} slots kept changing during {self.retries} reads")
+
+    def tokens(self) -> list:
+        used = _HEADER.unpack_from(self.buf, 0)[3]
+        return self.slots["token"][:used].tolist()
+
+    @property
+    def updated_ns(self) -> int:
+        """Time of the writer's last publish (epoch ns), to detect a stalled feed."""
+        return _HEADER.unpack_from(self.buf, 0)[4]
+
+    def close(self):
+        self.slots = self.buf = None
+        self.shm.close()
+
+
+def _bench_feed(name: str, stop):
+    from tick_decoder import TICK_DTYPE
+    writer = SnapshotWriter(name, capacity=4096, create=False)
+    ticks = np.zeros(250, TICK_DTYPE)
+    ticks["mode"] = 3
+    i = 0
+    while not stop.is_set():
+        # 250-tick batches round-robin over 3000 tokens, as fast as possible
+        ticks["token"] = (np.arange(250) + 250 * (i % 12)) * 256 + 1
+        ticks["ltp"] = 100.0 + i
+        ticks["bid"][:, 0] = ticks["ltp"] - 0.05
+        ticks["ask"][:, 0] = ticks["ltp"] + 0.05
+        writer.write_array(ticks)
+        i += 1
+    writer.close(unlink=False)
+
+
+if __name__ == "__main__":
+    import sys
+    import multiprocessing as mp
+    from tick_decoder import TICK_DTYPE
+
+    name = f"snapshot_bench_{time.time_ns()}"
+    writer = SnapshotWriter(name, capacity=4096)
+    ticks = np.zeros(3000, TICK_DTYPE)
+    ticks["token"] = np.arange(3000) * 256 + 1
+    ticks["mode"] = 3
+    ticks["ask"][:, 0] = 0.05
+    writer.write_array(ticks)
+    t0 = time.perf_counter()
+    for _ in range(100):
+        writer.write_array(ticks)
+    print(f"write_array 3000 ticks: {(time.perf_counter() - t0) * 10:.2f} ms")
+
+    reader = SnapshotReader(name)
+    tokens = ticks["token"].tolist()
+    n = 300_000
+
+    def timed(label, read):
+        # reader CPU time, so a feed process sharing the core does not count
+        t0 = time.process_time()
+        for k in range(n):
+            read(tokens[k % 3000])
+        print(f"  {label}: {(time.process_time() - t0) / n * 1e9:.0f} ns/read (incl. loop)")
+
+    timed("loop baseline", lambda token: None)
+    print("idle:")
+    for label, read in (("ltp()", reader.ltp), ("raw()", reader.raw), ("get()", reader.get)):
+        timed(label, read)
+
+    # Feed in another process, writing 250-tick batches as fast as it can
+    stop = mp.Event()
+    feed = mp.Process(target=_bench_feed, args=(name, stop), daemon=True)
+    feed.start()
+    time.sleep(0.5)
+    print("under a live writer process:")
+    for label, read in (("ltp()", reader.ltp), ("raw()", reader.raw)):
+        timed(label, read)
+    torn = 0
+    for k in range(n):
+        q = reader.raw(tokens[k % 3000])
+        if abs(q[5] - q[3] - 0.05) > 1e-6:  # ask must always belong to the same ltp
+            torn += 1
+    print(f"  {n} checked reads: {reader.stats['retries']} retries, {torn} torn")
+    t0 = time.perf_counter()
+    rows = reader.read(tokens)
+    print(f"  read() 3000 tokens: {(time.perf_counter() - t0) * 1e3:.2f} ms")
+    stop.set()
+    feed.join()
+    reader.close()
+    writer.close()
+    sys.exit(1 if torn else 0)
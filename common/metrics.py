@@ -0,0 +1,363 @@
+# metrics.py
+"""
+Latency histograms and counters for broker calls, exported in the
+Prometheus text format.
+
+Histogram is HDR-style: nanosecond values go into log-linear buckets (64
+sub-buckets per power of two, so any percentile is within ~1.6% of the
+true value) held in a flat list, and record() is one bit_length, a shift
+and a list increment; count and max are derived from the buckets at
+export time instead of being updated per call. Nothing is allocated per
+call and no lock is taken, so it stays on in production (increments can
+race between threads in theory; a lost count is harmless here).
+
+What is recorded (all through the process-wide REGISTRY):
+
+    broker_request_seconds{broker,endpoint}            AngelClient / AsyncAngelClient
+                                                       requests, Kite via instrument_kite,
+                                                       generateSession
+    broker_request_errors_total{broker,endpoint,kind}  exception type or http_<status>
+    broker_request_retries_total{broker,endpoint}      stale keep-alive connections resent
+    ratelimit_wait_seconds{endpoint}                   RequestScheduler queueing
+    tick_lag_seconds{feed}                             arrival time minus exchange timestamp
+
+Kite stamps ticks in whole seconds, so its tick lag reads up to one second
+high; compare those percentiles over time, not as absolutes. Angel stamps
+them in milliseconds, and its lag is measured at that precision.
+
+Usage:
+    from metrics import REGISTRY, instrument_kite
+    REGISTRY.serve(9108)                  # GET http://127.0.0.1:9108/metrics
+    REGISTRY.write("/var/lib/node_exporter/trading.prom")   # or a textfile collector
+    kite = instrument_kite(KiteConnect(api_key=API_KEY))
+    print(REGISTRY.report())
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from itertools import accumulate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+SUB_BITS = 7                  # 2**7 values per linear run -> 64 sub-buckets per power of two
+HALF = 1 << (SUB_BITS - 1)
+MAX_BITS = 40                 # values clamp at 2**40 ns (~18 minutes)
+BUCKETS = (MAX_BITS - SUB_BITS + 2) * HALF
+QUANTILES = (0.5, 0.99, 0.999)
+
+HELP = {
+    "broker_request_seconds": "Broker API call latency.",
+    "broker_request_errors_total": "Broker API calls that failed.",
+    "broker_request_retries_total": "Broker API calls resent on a fresh connection.",
+    "ratelimit_wait_seconds": "Time spent queued for a rate-limit slot.",
+    "tick_lag_seconds": "Tick arrival time minus exchange timestamp.",
+}
+
+
+def _lowest(index: int) -> int:
+    """Smallest value that lands in bucket `index`."""
+    if index < 2 * HALF:
+        return index
+    shift = (index >> (SUB_BITS - 1)) - 1
+    return (index - (shift << (SUB_BITS - 1))) << shift
+
+
+class Histogram:
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.total = 0
+
+    def record(self, ns: int):
+        shift = ns.bit_length() - SUB_BITS
+        try:
+            self.counts[(shift << (SUB_BITS - 1)) + (ns >> shift) if shift > 0 else ns] += 1
+        except IndexError:  # beyond 2**MAX_BITS ns
+            self.counts[-1] += 1
+        self.total += ns
+
+    def record_n(self, ns: int, n: int):
+        """record(ns) n times."""
+        shift = ns.bit_length() - SUB_BITS
+        try:
+            self.counts[(shift << (SUB_BITS - 1)) + (ns >> shift) if shift > 0 else ns] += n
+        except IndexError:
+            self.counts[-1] += n
+        self.total += ns * n
+
+    def record_array(self, ns: np.ndarray):
+        """Vectorized record() for a batch (negative values count as 0)."""
+        ns = np.clip(np.asarray(ns, np.int64), 0, (1 << MAX_BITS) - 1)
+        if not len(ns):
+            return
+        _, bits = np.frexp(ns.astype(np.float64))  # exact bit_length below 2**53
+        shift = np.maximum(bits - SUB_BITS, 0)
+        index = np.where(shift > 0, (shift << (SUB_BITS - 1)) + (ns >> shift), ns)
+        hits = np.bincount(index, minlength=BUCKETS)
+        counts = self.counts
+        for i in np.flatnonzero(hits).tolist():
+            counts[i] += int(hits[i])
+        self.total += int(ns.sum())
+
+    # count and max are derived here rather than kept per record()
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    @property
+    def max(self) -> int:
+        for i in range(BUCKETS - 1, -1, -1):
+            if self.counts[i]:
+                return _lowest(i + 1) - 1
+        return 0
+
+    def value_at(self, q: float) -> int:
+        """Value (ns) at quantile q, the midpoint of its bucket."""
+        count = self.count
+        if not count:
+            return 0
+        rank = max(int(np.ceil(q * count)), 1)
+        for i, seen in enumerate(accumulate(self.counts)):
+            if seen >= rank:
+                return (_lowest(i) + _lowest(i + 1)) // 2
+        return 0
+
+    def reset(self):
+        self.counts = [0] * BUCKETS
+        self.total = 0
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: int = 1):
+        self.value += n
+
+
+class EndpointMetrics:
+    """The latency / retry / error series for one broker endpoint; clients keep one per endpoint."""
+    __slots__ = ("registry", "labels", "latency", "retries")
+
+    def __init__(self, registry, broker: str, endpoint: str):
+        self.registry = registry
+        self.labels = {"broker": broker, "endpoint": endpoint}
+        self.latency = registry.histogram("broker_request_seconds", **self.labels)
+        self.retries = registry.counter("broker_request_retries_total", **self.labels)
+
+    def error(self, kind):
+        """kind: an exception (its type name is used) or a string such as "http_503"."""
+        kind = kind if isinstance(kind, str) else type(kind).__name__
+        self.registry.counter("broker_request_errors_total", kind=kind, **self.labels).inc()
+
+    @contextmanager
+    def time(self):
+        t0 = time.perf_counter_ns()
+        try:
+            yield
+        except Exception as e:
+            self.error(e)
+            raise
+        finally:
+            self.latency.record(time.perf_counter_ns() - t0)
+
+
+class Metrics:
+    def __init__(self):
+        self._families = {}   # name -> {labels tuple: Histogram | Counter}
+        self._endpoints = {}
+        self._tick_lags = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    # ---- series ----
+    def _get(self, name: str, kind, labels: dict):
+        key = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is None or key not in family:
+            with self._lock:
+                family = self._families.setdefault(name, {})
+                if key not in family:
+                    family[key] = kind()
+        return family[key]
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self._get(name, Histogram, labels)
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self._get(name, Counter, labels)
+
+    def endpoint(self, broker: str, endpoint: str) -> EndpointMetrics:
+        m = self._endpoints.get((broker, endpoint))
+        if m is None:  # racing creators share the same underlying series
+            m = self._endpoints.setdefault((broker, endpoint), EndpointMetrics(self, broker, endpoint))
+        return m
+
+    def tick_lag(self, feed: str, exchange_ts: np.ndarray, now: float = None, unit: float = 1.0):
+        """
+        exchange_ts: exchange timestamps of one batch of ticks in `unit`
+        seconds (1.0 for epoch seconds, 1e-3 for milliseconds; 0 = not sent
+        in this mode).
+        """
+        now = time.time() if now is None else now
+        h = self._tick_lags.get(feed) or self._tick_lags.setdefault(
+            feed, self.histogram("tick_lag_seconds", feed=feed))
+        low, high = int(exchange_ts.min()), int(exchange_ts.max())
+        if high <= 0:
+            return
+        if low == high:  # the usual whole-second batch: every tick stamped alike
+            h.record_n(max(int((now - low * unit) * 1e9), 0), len(exchange_ts))
+            return
+        ts = exchange_ts[exchange_ts > 0]
+        low = int(ts.min())
+        if unit != 1.0 or high - low > 60:
+            h.record_array((now - ts.astype(np.float64) * unit) * 1e9)
+            return
+        hits = np.bincount(ts - low)
+        for offset in np.flatnonzero(hits).tolist():
+            h.record_n(max(int((now - low - offset) * 1e9), 0), int(hits[offset]))
+
+    def reset(self):
+        with self._lock:
+            for family in self._families.values():
+                for series in family.values():
+                    if isinstance(series, Histogram):
+                        series.reset()
+                    else:
+                        series.value = 0
+
+    # ---- export ----
+    def render(self) -> str:
+        """Prometheus text exposition format (histograms as summaries)."""
+        lines = []
+        for name, family in sorted(self._families.items()):
+            series = sorted(family.items())
+            summary = isinstance(series[0][1], Histogram)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {'summary' if summary else 'counter'}")
+            for key, s in series:
+                labels = ",".join(f'{k}="{v}"' for k, v in key)
+                if not summary:
+                    lines.append(f"{name}{{{labels}}} {s.value}")
+                    continue
+                sep = "," if labels else ""
+                count = s.count
+                for q in QUANTILES:
+                    value = f"{s.value_at(q) / 1e9:.9g}" if count else "NaN"
+                    lines.append(f'{name}{{{labels}{sep}quantile="{q}"}} {value}')
+                lines.append(f"{name}_sum{{{labels}}} {s.total / 1e9:.9g}")
+                lines.append(f"{name}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Atomically writes render() to path (node_exporter textfile collector)."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def serve(self, port: int = 9108, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serves render() at http://host:port/metrics from a daemon thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        return self._server
+
+    def close(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def report(self) -> str:
+        """One line per latency series: count, p50 / p99 / p99.9 / max in ms."""
+        lines = []
+        for name, family in sorted(self._families.items()):
+            for key, s in sorted(family.items()):
+                if not isinstance(s, Histogram) or not s.count:
+                    continue
+                labels = ",".join(str(v) for _, v in key)
+                p50, p99, p999 = (s.value_at(q) / 1e6 for q in QUANTILES)
+                lines.append(f"{name:<24} {labels:<28} n {s.count:>7}  p50 {p50:9.3f}  p99 {p99:9.3f}  "
+                             f"p99.9 {p999:9.3f}  max {s.max / 1e6:9.3f} ms")
+        return "\n".join(lines)
+
+
+REGISTRY = Metrics()
+
+
+def instrument_kite(kite, registry: Metrics = None):
+    """
+    Times every KiteConnect call (kite.ltp, place_order, generate_session, ...)
+    by wrapping its _request; the endpoint label is the route name, e.g.
+    "market.quote.ltp". Returns kite.
+    """
+    registry = registry or REGISTRY
+    request = kite._request
+
+    def timed(route, *args, **kwargs):
+        m = registry.endpoint("kite", route)
+        t0 = time.perf_counter_ns()
+        try:
+            return request(route, *args, **kwargs)
+        except Exception as e:
+            m.error(e)
+            raise
+        finally:
+            m.latency.record(time.perf_counter_ns() - t0)
+
+    kite._request = timed
+    return kite
+
+
+if __name__ == "__main__":
+    import random
+
+    registry = Metrics()
+    m = registry.endpoint("angel", "placeOrder")
+    rng = random.Random(1)
+    samples = [int(rng.lognormvariate(16.5, 0.4)) for _ in range(200000)]  # ~15 ms median
+
+    n = 200000
+    perf_ns = time.perf_counter_ns
+    t0 = perf_ns()
+    for i in range(n):
+        s = perf_ns()
+        m.latency.record(perf_ns() - s)
+    overhead = (perf_ns() - t0) / n
+    m.latency.reset()
+    for ns in samples:
+        m.latency.record(ns)
+    exact = sorted(samples)
+    for q in QUANTILES:
+        got, want = m.latency.value_at(q), exact[int(np.ceil(q * len(exact))) - 1]
+        print(f"p{q * 100:g}: {got / 1e6:.3f} ms (exact {want / 1e6:.3f} ms, {abs(got - want) / want:.2%} off)")
+    m.retries.inc()
+    m.error(ConnectionResetError())
+    registry.tick_lag("kite", np.full(1000, int(time.time()) - 1))
+    stamp_ms = int(time.time() * 1000)
+    registry.tick_lag("angel", np.arange(stamp_ms - 250, stamp_ms - 50, 2), unit=1e-3)
+    assert registry.histogram("tick_lag_seconds", feed="angel").max < 0.4e9  # not rounded to whole seconds
+    print(f"timed call overhead {overhead:.0f} ns (two perf_counter_ns + record)")
+    print(registry.render())
@@ -0,0 +1,316 @@
+# order_book.py
+"""
+Incremental order / trade book sync with change events.
+
+get_orderbook() / kite.orders() return the whole day's book on every call.
+OrderBook keeps the last state of every order, indexed by order id, open
+or finished, symbol and tag, and apply() turns a fresh book into change
+events only:
+
+    new         first time an order is seen
+    partial     filled quantity went up, order still working
+    filled      status became complete
+    rejected    status became rejected
+    cancelled   status became cancelled (after a "partial" if it had fills)
+    modified    anything else that changed (price, quantity, trigger, status)
+    trade       a trade book row not seen before
+
+An order whose watched fields did not change costs one tuple compare, and
+OrderSync skips apply() altogether when the raw response is identical to
+the previous one, so the poll interval can shrink without extra CPU and
+consumers only ever see O(changes) events. Postbacks (Kite's websocket
+order updates, or an Angel postback URL) go through the same book, so a
+poll that later returns the same state emits nothing twice; a late update
+cannot move a finished order back to working.
+
+Usage:
+    sync = angel_sync(get_client(), interval=1.0, on_events=print)
+    sync.start()
+    sync.book.open_orders()                 # [order dict, ...]
+
+    sync = kite_sync(kite, on_events=print)
+    kws.on_order_update = sync.on_order_update
+"""
+import json
+import time
+import threading
+from operator import itemgetter
+from collections import namedtuple
+
+NEW = "new"
+PARTIAL = "partial"
+FILLED = "filled"
+REJECTED = "rejected"
+CANCELLED = "cancelled"
+MODIFIED = "modified"
+TRADE = "trade"
+
+OrderEvent = namedtuple("OrderEvent", "kind orderid order previous")
+
+# Broker field names for the parts of an order / trade the book looks at
+Fields = namedtuple("Fields", "orderid status filled quantity price trigger updated symbol tag tradeid")
+ANGEL_FIELDS = Fields("orderid", "status", "filledshares", "quantity", "price", "triggerprice",
+                      "updatetime", "tradingsymbol", "ordertag", "fillid")
+KITE_FIELDS = Fields("order_id", "status", "filled_quantity", "quantity", "price", "trigger_price",
+                     "exchange_update_timestamp", "tradingsymbol", "tag", "trade_id")
+
+
+def _terminal(status: str):
+    """Lower-cased broker status -> FILLED / REJECTED / CANCELLED, or None while working."""
+    if status == "complete":
+        return FILLED
+    if status == "rejected":
+        return REJECTED
+    if status.startswith("cancelled"):  # Kite also has "cancelled amo"
+        return CANCELLED
+    return None
+
+
+def _qty(value) -> int:
+    return int(float(value or 0))
+
+
+class OrderBook:
+    def __init__(self, fields: Fields = ANGEL_FIELDS):
+        self.fields = fields
+        self.stats = {"applied": 0, "unchanged": 0, "events": 0, "trades": 0, "stale": 0}
+        self.orders = {}     # orderid -> latest order dict
+        self.trades = {}     # orderid -> [trade dict, ...]
+        self._open = set()
+        self._by_symbol = {}
+        self._by_tag = {}
+        self._state = {}     # orderid -> fingerprint of the watched fields
+        self._seen_trades = set()
+        self._watch = (fields.status, fields.filled, fields.quantity, fields.price, fields.trigger,
+                       fields.updated)
+        self._watched = itemgetter(*self._watch)
+        self._lock = threading.Lock()
+
+    # ---- updates ----
+    def apply(self, orders: list) -> list:
+        """Full or partial book -> [OrderEvent] for the orders that changed."""
+        oid_of, watched, state = itemgetter(self.fields.orderid), self._watched, self._state
+        events = []
+        changed = 0
+        with self._lock:
+            for o in orders:
+                oid = oid_of(o)
+                try:
+                    key = watched(o)
+                except KeyError:  # postbacks may leave fields out
+                    key = tuple([o.get(k) for k in self._watch])
+                if state.get(oid) == key:
+                    continue
+                changed += self._change(oid, o, key, events)
+            self.stats["applied"] += len(orders)
+            self.stats["unchanged"] += len(orders) - changed
+            self.stats["events"] += len(events)
+        return events
+
+    def _change(self, oid, o: dict, key: tuple, events: list) -> bool:
+        f = self.fields
+        old = self.orders.get(oid)
+        status = str(o.get(f.status) or "").lower()
+        done = _terminal(status)
+        if old is None:
+            kinds = [NEW]
+            old_filled, old_done = 0, None
+        else:
+            kinds = []
+            old_filled = _qty(old.get(f.filled))
+            old_done = _terminal(str(old.get(f.status) or "").lower())
+            if old_done and not done:
+                self.stats["stale"] += 1  # late update for an order that already finished
+                return False
+        if _qty(o.get(f.filled)) > old_filled and done != FILLED:
+            kinds.append(PARTIAL)
+        if done and done != old_done:
+            kinds.append(done)
+        if not kinds:
+            kinds.append(MODIFIED)
+
+        self._state[oid] = key
+        self.orders[oid] = o
+        if done:
+            self._open.discard(oid)
+        else:
+            self._open.add(oid)
+        if old is None:
+            self._by_symbol.setdefault(o.get(f.symbol), set()).add(oid)
+            if o.get(f.tag):
+                self._by_tag.setdefault(o[f.tag], set()).add(oid)
+        for kind in kinds:
+            events.append(OrderEvent(kind, oid, o, old))
+        return True
+
+    def apply_trades(self, trades: list) -> list:
+        """Trade book -> [OrderEvent(TRADE)] for trades not seen before."""
+        f, seen = self.fields, self._seen_trades
+        events = []
+        with self._lock:
+            for t in trades:
+                key = (t[f.orderid], t.get(f.tradeid))
+                if key in seen:
+                    continue
+                seen.add(key)
+                self.trades.setdefault(key[0], []).append(t)
+                events.append(OrderEvent(TRADE, key[0], t, None))
+            self.stats["trades"] += len(events)
+            self.stats["events"] += len(events)
+        return events
+
+    # ---- queries ----
+    def get(self, orderid):
+        return self.orders.get(orderid)
+
+    def open_orders(self) -> list:
+        with self._lock:
+            return [self.orders[oid] for oid in self._open]
+
+    def orders_for(self, symbol: str) -> list:
+        with self._lock:
+            return [self.orders[oid] for oid in self._by_symbol.get(symbol, ())]
+
+    def orders_tagged(self, tag: str) -> list:
+        with self._lock:
+            return [self.orders[oid] for oid in self._by_tag.get(tag, ())]
+
+    def trades_for(self, orderid) -> list:
+        with self._lock:
+            return list(self.trades.get(orderid, ()))
+
+    def __len__(self):
+        return len(self.orders)
+
+
+class OrderSync:
+    def __init__(self, book: OrderBook, fetch_orders, fetch_trades=None, parse=None,
+                 interval: float = 1.0, on_events=None):
+        """
+        fetch_orders() / fetch_trades() return the raw book (response text or
+        list); parse(raw) turns it into a list of dicts (identity by default).
+        on_events(events) is called once per poll or postback that changed
+        something.
+        """
+        self.book = book
+        self.fetch_orders = fetch_orders
+        self.fetch_trades = fetch_trades
+        self.parse = parse or (lambda raw: raw)
+        self.interval = interval
+        self.on_events = on_events
+        self.stats = {"polls": 0, "unchanged": 0, "postbacks": 0, "errors": 0}
+        self._last_orders = self._last_trades = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self) -> list:
+        """Fetches both books once and returns (and dispatches) the change events."""
+        self.stats["polls"] += 1
+        events = []
+        raw = self.fetch_orders()
+        if raw == self._last_orders:
+            self.stats["unchanged"] += 1
+        else:
+            events += self.book.apply(self.parse(raw))
+            self._last_orders = raw
+        if self.fetch_trades:
+            raw = self.fetch_trades()
+            if raw != self._last_trades:
+                events += self.book.apply_trades(self.parse(raw))
+                self._last_trades = raw
+        self._dispatch(events)
+        return events
+
+    def on_postback(self, order: dict) -> list:
+        """One pushed order update (same fields as the order book)."""
+        self.stats["postbacks"] += 1
+        events = self.book.apply([order])
+        self._dispatch(events)
+        return events
+
+    def on_order_update(self, ws, data: dict):
+        """KiteTicker.on_order_update signature."""
+        self.on_postback(data)
+
+    def _dispatch(self, events: list):
+        if events and self.on_events:
+            self.on_events(events)
+
+    # ---- background polling ----
+    def start(self):
+        """Polls every `interval` seconds on a daemon thread."""
+        def loop():
+            while True:
+                try:
+                    self.poll()
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"Order sync failed: {e}")
+                if self._stop.wait(self.interval):
+                    return
+        self._thread = threading.Thread(target=loop, name="order-sync", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+def _angel_data(text: str) -> list:
+    resp = json.loads(text)
+    if not resp.get("status"):
+        raise RuntimeError(f"book failed: {resp.get('errorcode')}: {resp.get('message')}")
+    return resp.get("data") or []  # data is null when there are no orders yet
+
+
+def angel_sync(client, interval: float = 1.0, on_events=None, trades: bool = True) -> OrderSync:
+    """OrderSync over AngelClient.get_orderbook / get_tradebook."""
+    return OrderSync(OrderBook(ANGEL_FIELDS), client.get_orderbook, client.get_tradebook if trades else None,
+                     parse=_angel_data, interval=interval, on_events=on_events)
+
+
+def kite_sync(kite, interval: float = 1.0, on_events=None, trades: bool = True) -> OrderSync:
+    """OrderSync over kite.orders / kite.trades; pair with kws.on_order_update."""
+    return OrderSync(OrderBook(KITE_FIELDS), kite.orders, kite.trades if trades else None,
+                     interval=interval, on_events=on_events)
+
+
+if __name__ == "__main__":
+    import os
+    import copy
+    import random
+
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "angel-api", "response", "gettodayorderbook.json")
+    with open(path) as f:
+        sample = json.load(f)["data"]
+    book = OrderBook(ANGEL_FIELDS)
+    for e in book.apply(sample):
+        print(e.kind, e.orderid, e.order["tradingsymbol"])
+
+    # A 2,000-order day where each poll changes a handful of orders
+    rng = random.Random(1)
+    orders = []
+    for i in range(2000):
+        o = copy.deepcopy(sample[i % len(sample)])
+        o.update(orderid=str(250402000000000 + i), status="open", orderstatus="open",
+                 filledshares="0", unfilledshares=o["quantity"])
+        orders.append(o)
+    book = OrderBook(ANGEL_FIELDS)
+    book.apply(orders)
+    polls, kinds = 200, {}
+    t0 = time.perf_counter()
+    for _ in range(polls):
+        for i in rng.sample(range(len(orders)), 5):
+            if orders[i]["status"] != "open":
+                continue
+            o = orders[i] = dict(orders[i])
+            o["filledshares"] = str(_qty(o["filledshares"]) + 1)
+            if rng.random() < 0.3:
+                o["status"] = rng.choice(["complete", "cancelled", "rejected"])
+        for e in book.apply(orders):
+            kinds[e.kind] = kinds.get(e.kind, 0) + 1
+    elapsed = time.perf_counter() - t0
+    print(f"{polls} polls of {len(orders)} orders: {elapsed / polls * 1e6:.0f} us per diff, "
+          f"{len(book.open_orders())} open; events {kinds}")
@@ -0,0 +1,400 @@
+# order_manager.py
+"""
+Idempotent order placement with client order ids and asynchronous acks.
+
+Every order gets a client id before it leaves the process, sent as Angel's
+`ordertag` (Kite's `tag`), and moves through a small state machine:
+
+    PENDING -> SENT -> ACKED -> OPEN -> PARTIAL -> FILLED
+                 |       \\-> REJECTED / CANCELLED
+                 +-> UNKNOWN  (timeout / dropped connection after sending)
+                 +-> REJECTED (broker said no)        FAILED (gave up)
+
+A send that fails in a way that proves the order was not accepted (a
+retryable error code, connection refused) is simply sent again. A send
+whose outcome is unknown is never resent blindly: the order book is
+fetched and searched for the client id; if the order is there it is acked
+with the broker's order id, and only if it is still absent after a grace
+period is it resent, under the same client id; an order that turns up in
+the book while waiting to be resent is acked instead. That makes aggressive
+retries safe. Sends run on a thread pool, so place() returns at once with
+futures for the acknowledgement and the final state.
+
+Later state changes come from an order_book.OrderSync (polling and/or
+postbacks); the manager chains itself onto the sync's on_events.
+
+Usage:
+    om = angel_manager(get_client())
+    m = om.place({"variety": "NORMAL", "tradingsymbol": "SBIN-EQ", ...})
+    m.ack.result(timeout=5)          # broker order id
+    m.final.result()                 # FILLED / CANCELLED / REJECTED / FAILED
+"""
+import os
+import json
+import time
+import socket
+import threading
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
+from order_book import angel_sync, kite_sync
+from risk_gate import RiskRejected
+
+PENDING = "PENDING"
+SENT = "SENT"
+UNKNOWN = "UNKNOWN"
+ACKED = "ACKED"
+OPEN = "OPEN"
+PARTIAL = "PARTIAL"
+FILLED = "FILLED"
+CANCELLED = "CANCELLED"
+REJECTED = "REJECTED"
+FAILED = "FAILED"
+FINAL = {FILLED, CANCELLED, REJECTED, FAILED}
+
+TRANSITIONS = {
+    PENDING: {SENT, ACKED, FAILED},   # ACKED: found in the book between attempts
+    SENT: {PENDING, UNKNOWN, ACKED, REJECTED, FAILED},
+    UNKNOWN: {PENDING, ACKED, FAILED},
+    ACKED: {OPEN, PARTIAL, FILLED, CANCELLED, REJECTED},
+    OPEN: {OPEN, PARTIAL, FILLED, CANCELLED, REJECTED},
+    PARTIAL: {PARTIAL, FILLED, CANCELLED},
+}
+# order_book event kind -> state
+EVENT_STATES = {"new": OPEN, "modified": OPEN, "partial": PARTIAL, "filled": FILLED,
+                "cancelled": CANCELLED, "rejected": REJECTED}
+
+# Angel error codes that mean "not accepted, try again" (as in order/basket.py)
+ANGEL_RETRYABLE = {"AB1004", "AB2000", "AB1019"}
+# Errors raised before the request could have reached the broker
+_NOT_SENT = (ConnectionRefusedError, socket.gaierror)
+TAG_LENGTH = 20  # Angel ordertag / Kite tag limit
+
+
+class Retryable(Exception):
+    """The broker did not accept the order; sending it again is safe."""
+
+
+class Rejected(Exception):
+    """The broker refused the order for good."""
+
+
+class ManagedOrder:
+    def __init__(self, tag: str, order: dict):
+        self.tag = tag
+        self.order = order
+        self.state = PENDING
+        self.orderid = None
+        self.attempts = 0
+        self.error = None
+        self.history = [(PENDING, time.time())]
+        self.ack = Future()     # -> broker order id
+        self.final = Future()   # -> FILLED / CANCELLED / REJECTED / FAILED
+
+    def __repr__(self):
+        return f"ManagedOrder({self.tag}, {self.state}, orderid={self.orderid})"
+
+
+class OrderManager:
+    def __init__(self, send, sync, tag_field: str, prefix: str = "om", workers: int = 8,
+                 max_attempts: int = 5, backoff: float = 0.2, reconcile_checks: int = 3,
+                 reconcile_delay: float = 1.0):
+        """
+        send(order) -> broker order id; raises Retryable / Rejected, anything
+        else means the outcome is unknown. sync is the OrderSync used to
+        reconcile and to follow the order afterwards.
+        """
+        self.send = send
+        self.sync = sync
+        self.tag_field = tag_field
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.reconcile_checks = reconcile_checks
+        self.reconcile_delay = reconcile_delay
+        self.stats = {"placed": 0, "sent": 0, "retried": 0, "unknown": 0, "reconciled": 0,
+                      "resent": 0, "acked": 0, "rejected": 0, "failed": 0, "invalid": 0}
+        self.orders = {}        # tag -> ManagedOrder
+        self._by_orderid = {}
+        self._prefix = prefix + os.urandom(3).hex()  # differs per process, so restarts never reuse ids
+        if len(self._prefix) + 6 > TAG_LENGTH:
+            raise ValueError(f"prefix too long for a {TAG_LENGTH}-character tag")
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="order-manager")
+        chained = sync.on_events
+
+        def on_events(events):
+            self.on_events(events)
+            if chained:
+                chained(events)
+        sync.on_events = on_events
+
+    # ---- placing ----
+    def place(self, order: dict, tag: str = None) -> ManagedOrder:
+        """
+        Queues an order and returns its ManagedOrder at once. Passing the
+        same tag twice returns the first order instead of placing another.
+        """
+        with self._lock:
+            if tag is None:
+                tag = f"{self._prefix}{next(self._seq):06d}"
+            elif tag in self.orders:
+                return self.orders[tag]
+            if len(tag) > TAG_LENGTH:
+                raise ValueError(f"tag longer than {TAG_LENGTH} characters: {tag}")
+            m = self.orders[tag] = ManagedOrder(tag, dict(order, **{self.tag_field: tag}))
+            self.stats["placed"] += 1
+        self._pool.submit(self._run, m)
+        return m
+
+    def _run(self, m: ManagedOrder):
+        try:
+            existing = self.sync.book.orders_tagged(m.tag)
+            if existing:  # placed by an earlier run with the same tag
+                self._ack(m, existing[0][self.sync.book.fields.orderid])
+                return
+            while m.attempts < self.max_attempts:
+                if m.attempts:
+                    time.sleep(self.backoff * 2 ** (m.attempts - 1))
+                m.attempts += 1
+                if not self._start_send(m):
+                    return  # acked meanwhile from the order book
+                self.stats["sent"] += 1
+                try:
+                    orderid = self.send(m.order)
+                except (Retryable, *_NOT_SENT) as e:
+                    m.error = str(e)
+                    self.stats["retried"] += 1
+                    self._move(m, PENDING)
+                    continue
+                except (Rejected, RiskRejected) as e:
+                    m.error = str(e)
+                    self.stats["rejected"] += 1
+                    self._finish(m, REJECTED)
+                    return
+                except Exception as e:
+                    m.error = f"{type(e).__name__}: {e}"
+                    self.stats["unknown"] += 1
+                    self._move(m, UNKNOWN)
+                    orderid = self._reconcile(m)
+                    if orderid is None:
+                        if not self._move(m, PENDING):
+                            return  # turned up just now
+                        self.stats["resent"] += 1
+                        continue
+                    self.stats["reconciled"] += 1
+                self._ack(m, orderid)
+                return
+            self._finish(m, FAILED)
+        except Exception as e:  # a bug here must not leave the futures hanging
+            m.error = f"{type(e).__name__}: {e}"
+            self._finish(m, FAILED)
+
+    def _reconcile(self, m: ManagedOrder):
+        """Looks for the client id in the order book; None if it never arrived."""
+        for check in range(self.reconcile_checks):
+            if m.state != UNKNOWN:  # acked meanwhile through a postback / poll
+                return m.orderid
+            time.sleep(self.reconcile_delay if check else self.reconcile_delay / 4)
+            try:
+                self.sync.poll()
+            except Exception as e:
+                m.error = f"reconcile: {e}"
+                continue
+            found = self.sync.book.orders_tagged(m.tag)
+            if found:
+                return found[0][self.sync.book.fields.orderid]
+        return m.orderid
+
+    # ---- state machine ----
+    def _move(self, m: ManagedOrder, state: str) -> bool:
+        with self._lock:
+            if state not in TRANSITIONS.get(m.state, ()):
+                self.stats["invalid"] += 1
+                return False
+            m.state = state
+            m.history.append((state, time.time()))
+        return True
+
+    def _start_send(self, m: ManagedOrder) -> bool:
+        """PENDING -> SENT, unless an order id turned up since the last attempt."""
+        with self._lock:
+            if m.orderid is not None or SENT not in TRANSITIONS.get(m.state, ()):
+                self.stats["invalid"] += m.orderid is None
+                return False
+            m.state = SENT
+            m.history.append((SENT, time.time()))
+        return True
+
+    def _ack(self, m: ManagedOrder, orderid):
+        with self._lock:
+            if m.orderid is None:
+                m.orderid = orderid
+                self._by_orderid[orderid] = m
+                self.stats["acked"] += 1
+        if m.state in (PENDING, SENT, UNKNOWN):
+            self._move(m, ACKED)
+        if not m.ack.done():
+            m.ack.set_result(orderid)
+
+    def _finish(self, m: ManagedOrder, state: str):
+        if m.state not in FINAL:
+            if state not in TRANSITIONS.get(m.state, ()):
+                m.state = state  # FAILED can come from anywhere
+                m.history.append((state, time.time()))
+            else:
+                self._move(m, state)
+        if state == FAILED:
+            self.stats["failed"] += 1
+        if not m.ack.done():
+            m.ack.set_exception(Rejected(m.error or state))
+        if not m.final.done():
+            m.final.set_result(state)
+
+    def on_events(self, events: list):
+        """order_book events: acks orders seen by client id, then follows their state."""
+        fields = self.sync.book.fields
+        for e in events:
+            if e.kind == "trade":
+                continue
+            m = self._by_orderid.get(e.orderid)
+            if m is None:
+                m = self.orders.get(e.order.get(fields.tag))
+                if m is None:
+                    continue
+                self._ack(m, e.orderid)
+            state = EVENT_STATES[e.kind]
+            if state in FINAL:
+                self._finish(m, state)
+            elif m.state != state:
+                self._move(m, state)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+def angel_sender(client):
+    """send() over AngelClient.place_order (or a risk_gate.GatedClient)."""
+    def send(order: dict):
+        resp = json.loads(client.place_order(order))
+        orderid = (resp.get("data") or {}).get("orderid") if resp.get("status") else None
+        if orderid:
+            return orderid
+        if resp.get("errorcode") in ANGEL_RETRYABLE:
+            raise Retryable(f"{resp.get('errorcode')}: {resp.get('message')}")
+        raise Rejected(f"{resp.get('errorcode')}: {resp.get('message')}")
+    return send
+
+
+def kite_sender(kite):
+    """send() over kite.place_order; the order dict holds its keyword arguments, variety included."""
+    def send(order: dict):
+        try:
+            return kite.place_order(**order)
+        except Exception as e:
+            # kiteconnect raises its own exceptions for definite answers; a
+            # NetworkException / DataException, like a requests error, leaves
+            # the outcome unknown
+            kind = type(e)
+            if kind.__module__.startswith("kiteconnect") and kind.__name__ not in ("NetworkException",
+                                                                                  "DataException"):
+                raise Rejected(str(e)) from e
+            raise
+    return send
+
+
+def angel_manager(client, sync=None, **kwargs) -> OrderManager:
+    """OrderManager over AngelClient; polls the order book every second unless given a sync."""
+    if sync is None:
+        sync = angel_sync(client, trades=False)
+        sync.start()
+    return OrderManager(angel_sender(client), sync, "ordertag", **kwargs)
+
+
+def kite_manager(kite, sync=None, **kwargs) -> OrderManager:
+    """OrderManager over KiteConnect; pair the sync with kws.on_order_update for fast acks."""
+    if sync is None:
+        sync = kite_sync(kite, trades=False)
+        sync.start()
+    return OrderManager(kite_sender(kite), sync, "tag", **kwargs)
+
+
+if __name__ == "__main__":
+    import random
+
+    class FlakyBroker:
+        """Accepts orders but loses some requests and some responses."""
+
+        def __init__(self, seed: int = 1):
+            self.rng = random.Random(seed)
+            self.book = []
+            self.lock = threading.Lock()
+
+        def place_order(self, order: dict) -> str:
+            time.sleep(0.005)
+            roll = self.rng.random()
+            if roll < 0.1:
+                raise TimeoutError("request lost")        # never reached the broker
+            if roll < 0.15:
+                return json.dumps({"status": False, "errorcode": "AB1004", "message": "try again"})
+            with self.lock:
+                orderid = str(250402000000000 + len(self.book))
+                self.book.append(dict(order, orderid=orderid, status="complete", filledshares=order["quantity"],
+                                      updatetime="02-Apr-2025 09:15:00"))
+            if roll < 0.35:
+                raise TimeoutError("response lost")       # placed, but we cannot tell
+            return json.dumps({"status": True, "data": {"orderid": orderid}})
+
+        def get_orderbook(self) -> str:
+            with self.lock:
+                return json.dumps({"status": True, "data": list(self.book)})
+
+    broker = FlakyBroker()
+    sync = angel_sync(broker, interval=0.05, trades=False)
+    sync.start()
+    om = OrderManager(angel_sender(broker), sync, "ordertag", workers=16, backoff=0.01, reconcile_delay=0.1)
+    n = 200
+    t0 = time.perf_counter()
+    placed = [om.place({"tradingsymbol": "SBIN-EQ", "symboltoken": "3045", "transactiontype": "BUY",
+                        "quantity": "1", "price": "800"}) for _ in range(n)]
+    queued = time.perf_counter() - t0
+    states = {}
+    for m in placed:
+        states[m.final.result(timeout=30)] = states.get(m.final.result(), 0) + 1
+    elapsed = time.perf_counter() - t0
+    sync.close()
+    om.close()
+    tags = [o["ordertag"] for o in broker.book]
+    print(f"{n} orders queued in {queued * 1e3:.1f} ms, all final in {elapsed:.2f} s: {states}")
+    print(f"broker holds {len(broker.book)} orders ({len(tags) - len(set(tags))} duplicates); {om.stats}")
+
+    class LaggingBroker:
+        """Places the order but loses the response; the book shows it only once `visible` is set."""
+
+        def __init__(self):
+            self.book = []
+            self.visible = False
+
+        def place_order(self, order: dict) -> str:
+            self.book.append(dict(order, orderid=str(250402000000000 + len(self.book)), status="open",
+                                  filledshares="0", updatetime="02-Apr-2025 09:15:00"))
+            raise TimeoutError("response lost")
+
+        def get_orderbook(self) -> str:
+            return json.dumps({"status": True, "data": list(self.book) if self.visible else []})
+
+    # Reconcile gives up, then the order shows up during the retry backoff: it must not be sent again
+    broker = LaggingBroker()
+    sync = angel_sync(broker, trades=False)
+    om = OrderManager(angel_sender(broker), sync, "ordertag", backoff=0.5, reconcile_checks=1,
+                      reconcile_delay=0.01)
+    m = om.place({"tradingsymbol": "SBIN-EQ", "symboltoken": "3045", "transactiontype": "BUY",
+                  "quantity": "1", "price": "800"})
+    while not om.stats["resent"]:
+        time.sleep(0.005)
+    broker.visible = True
+    sync.poll()
+    om.close()
+    assert m.ack.result(timeout=1) == broker.book[0]["orderid"], m
+    assert len(broker.book) == 1 and om.stats["sent"] == 1, (broker.book, om.stats)
+    assert [s for s, _ in m.history] == [PENDING, SENT, UNKNOWN, PENDING, ACKED, OPEN], m.history
+    print("acked during backoff: not resent")
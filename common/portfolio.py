@@ -0,0 +1,434 @@
+# portfolio.py
+"""
+Real-time mark-to-market for holdings and positions, updated from ticks.
+
+Seed once from the broker's holdings and positions, then feed every tick
+batch to update() / update_array(). The state is split in two:
+
+    instruments  one row per token: ltp plus the summed weights of every
+                 position in it (net units, gross units, margin units),
+                 plain NumPy arrays indexed by row
+    positions    one record per holding / product position: quantity,
+                 multiplier, cash (sell value - buy value) and realised P&L
+
+Account totals are kept as running sums, so a tick batch costs three dot
+products over the ticked rows only, whatever the size of the book:
+
+    value   += net_units[rows] . (ltp_new - ltp_old)
+    pnl      = cash + value
+    unrealised = pnl - realised
+
+Margin in use is an estimate: a fraction of position value by segment
+(MARGIN_RATES), with short options charged on strike notional instead of
+premium. Fills (apply_fill, or trade events from order_book.OrderSync via
+on_events) move positions without another REST call; seed again now and
+then to pick up anything done outside this process. The seeded positions
+already contain every trade in today's trade book, so pass the sync to the
+factory (or hand the seeders' returned rows to sync.book.apply_trades())
+to mark those trades seen before the first poll replays them.
+
+Usage:
+    sync = angel_sync(client, on_events=...)
+    pf = angel_portfolio(client, sync=sync)     # or kite_portfolio(kite, sync=...)
+    kws.on_ticks_array = lambda ws, ticks: pf.update_array(ticks)
+    pf.summary()            # {"pnl", "unrealised", "margin", ...}
+"""
+import json
+import threading
+import numpy as np
+from charges import segment_of
+
+# Fraction of position value held as margin, by segment
+MARGIN_RATES = {
+    "holding": 0.0,          # paid for; not margin
+    "delivery": 1.0,         # today's delivery buys block the full value
+    "intraday": 0.2,
+    "futures": 0.15,
+    "option_long": 1.0,      # premium
+    "option_short": 0.15,    # of strike notional
+}
+
+
+def _num(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class Portfolio:
+    def __init__(self, capacity: int = 4096, funds: float = 0.0, margin_rates: dict = None):
+        self.capacity = capacity
+        self.funds = funds
+        self.margin_rates = dict(MARGIN_RATES, **(margin_rates or {}))
+        self.stats = {"batches": 0, "ticks": 0, "fills": 0, "unmatched": 0}
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drops every position (seed_* calls this first)."""
+        cap = self.capacity
+        self.rows = {}                    # token -> instrument row
+        self.tokens = np.zeros(cap, np.int64)
+        self.ltp = np.zeros(cap)
+        self.net_units = np.zeros(cap)    # sum of quantity x multiplier
+        self.gross_units = np.zeros(cap)  # sum of |quantity x multiplier|
+        self.margin_units = np.zeros(cap)  # sum of |units| x rate, for price-based margin
+        self._mark = np.zeros(cap, np.intp)
+        self.positions = []
+        self._by_row = {}                 # row -> [position, ...]
+        self._by_key = {}                 # (token, product) -> position
+        self._symbols = {}                # (exchange, tradingsymbol) -> token
+        self._exchanges = {}              # token -> exchange
+        self._sorted_tokens = np.zeros(0, np.int64)
+        self._sorted_rows = np.zeros(0, np.intp)
+        self._cash = self._realised = self._margin_fixed = 0.0
+        self._value = self._gross = self._margin = 0.0
+
+    # ---- instruments & positions ----
+    def _row(self, token: int) -> int:
+        row = self.rows.get(token)
+        if row is None:
+            row = len(self.rows)
+            if row >= self.capacity:
+                raise OverflowError(f"Portfolio is full ({self.capacity} instruments)")
+            self.rows[token] = row
+            self.tokens[row] = token
+            order = np.argsort(self.tokens[:row + 1], kind="stable")
+            self._sorted_tokens = self.tokens[:row + 1][order]
+            self._sorted_rows = order
+        return row
+
+    def add_position(self, token: int, quantity: float, cash: float, ltp: float = 0.0, *,
+                     product: str = "holding", segment: str = "delivery", multiplier: float = 1.0,
+                     realised: float = 0.0, strike: float = 0.0, symbol: str = "", exchange: str = ""):
+        """
+        One holding or position. cash is sell value - buy value (for a
+        holding, -quantity x average price), so P&L = cash + units x ltp.
+        """
+        token = int(token)
+        with self._lock:
+            if exchange:
+                # Ticks carry the token only and Angel reuses symboltokens across
+                # exchanges: refuse to mark two instruments off one row
+                known = self._exchanges.setdefault(token, exchange)
+                if known != exchange:
+                    raise ValueError(f"token {token} already held on {known}, cannot also hold {exchange}")
+            row = self._row(token)
+            pos = {"token": token, "symbol": symbol, "exchange": exchange, "product": product,
+                   "segment": segment, "quantity": float(quantity), "multiplier": float(multiplier) or 1.0,
+                   "cash": float(cash), "realised": float(realised), "strike": float(strike)}
+            self.positions.append(pos)
+            self._by_row.setdefault(row, []).append(pos)
+            self._by_key[(token, product)] = pos
+            if symbol:
+                self._symbols[(exchange, symbol)] = token
+            if ltp and not self.ltp[row]:
+                self.ltp[row] = ltp
+            self._cash += pos["cash"]
+            self._realised += pos["realised"]
+            self._reweigh(row)
+        return pos
+
+    def _rate(self, pos: dict, units: float) -> tuple:
+        """(price-based rate, fixed margin) for one position."""
+        if pos["product"] == "holding":
+            return self.margin_rates["holding"], 0.0
+        if pos["segment"] == "options":
+            if units >= 0:
+                return self.margin_rates["option_long"], 0.0
+            return 0.0, -units * pos["strike"] * self.margin_rates["option_short"]
+        return self.margin_rates[pos["segment"]], 0.0
+
+    def _reweigh(self, row: int):
+        """Recomputes one instrument's weights and moves the running totals by the difference."""
+        net = gross = margin = fixed = 0.0
+        for pos in self._by_row.get(row, ()):
+            units = pos["quantity"] * pos["multiplier"]
+            rate, pos_fixed = self._rate(pos, units)
+            old_fixed = pos.get("margin_fixed", 0.0)
+            pos["margin_fixed"] = pos_fixed
+            fixed += pos_fixed - old_fixed
+            net += units
+            gross += abs(units)
+            margin += abs(units) * rate
+        ltp = self.ltp[row]
+        self._value += (net - self.net_units[row]) * ltp
+        self._gross += (gross - self.gross_units[row]) * ltp
+        self._margin += (margin - self.margin_units[row]) * ltp
+        self._margin_fixed += fixed
+        self.net_units[row], self.gross_units[row], self.margin_units[row] = net, gross, margin
+
+    def apply_fill(self, token: int, quantity: float, price: float, product: str = "INTRADAY",
+                   segment: str = None, multiplier: float = 1.0, symbol: str = "", exchange: str = ""):
+        """A trade: quantity > 0 bought, < 0 sold. Realised P&L moves on the closing part."""
+        token = int(token)
+        pos = self._by_key.get((token, product))
+        if pos is None:
+            segment = segment or segment_of(product, exchange or "NSE", symbol)
+            pos = self.add_position(token, 0.0, 0.0, price, product=product, segment=segment,
+                                    multiplier=multiplier, symbol=symbol, exchange=exchange)
+        with self._lock:
+            m, held = pos["multiplier"], pos["quantity"]
+            if held and (held > 0) != (quantity > 0):
+                # Average cost of the open quantity, from cash = realised - units x average
+                avg = (pos["realised"] - pos["cash"]) / (held * m)
+                closed = min(abs(quantity), abs(held)) * (1 if held > 0 else -1)
+                gain = closed * (price - avg) * m
+                pos["realised"] += gain
+                self._realised += gain
+            pos["quantity"] = held + quantity
+            pos["cash"] -= quantity * price * m
+            self._cash -= quantity * price * m
+            self._reweigh(self.rows[token])
+            self.stats["fills"] += 1
+
+    # ---- ticks ----
+    def update_array(self, ticks: np.ndarray) -> int:
+        """TICK_DTYPE batch (tick_decoder / AngelDecoder); returns ticks applied."""
+        return self._update(ticks["token"], ticks["ltp"])
+
+    def update(self, ticks: list) -> int:
+        """KiteTicker tick dicts."""
+        return self._update(np.array([t["instrument_token"] for t in ticks], np.int64),
+                            np.array([t.get("last_price", 0.0) for t in ticks], np.float64))
+
+    def update_one(self, token: int, ltp: float):
+        """Single tick without NumPy overhead."""
+        row = self.rows.get(token)
+        if row is None or ltp <= 0:
+            return
+        with self._lock:
+            d = ltp - self.ltp[row]
+            self._value += self.net_units[row] * d
+            self._gross += self.gross_units[row] * d
+            self._margin += self.margin_units[row] * d
+            self.ltp[row] = ltp
+
+    def _update(self, tokens: np.ndarray, ltp: np.ndarray) -> int:
+        sorted_tokens = self._sorted_tokens
+        if not len(tokens) or not len(sorted_tokens):
+            return 0
+        pos = np.searchsorted(sorted_tokens, tokens)
+        np.minimum(pos, len(sorted_tokens) - 1, out=pos)
+        hit = (sorted_tokens[pos] == tokens) & (ltp > 0)
+        rows, ltp = self._sorted_rows[pos[hit]], ltp[hit]
+        if len(rows) > 1:
+            # Several ticks for one token in a batch: keep the one whose index
+            # survives the scatter (the last), so each row moves once
+            seq = np.arange(len(rows))
+            self._mark[rows] = seq
+            keep = self._mark[rows] == seq
+            if not keep.all():
+                rows, ltp = rows[keep], ltp[keep]
+        with self._lock:
+            d = ltp - self.ltp[rows]
+            self._value += float(self.net_units[rows] @ d)
+            self._gross += float(self.gross_units[rows] @ d)
+            self._margin += float(self.margin_units[rows] @ d)
+            self.ltp[rows] = ltp
+        self.stats["batches"] += 1
+        self.stats["ticks"] += len(rows)
+        return len(rows)
+
+    def recompute(self):
+        """Rebuilds the running totals from the arrays (clears float drift)."""
+        with self._lock:
+            n = len(self.rows)
+            ltp = self.ltp[:n]
+            self._value = float(self.net_units[:n] @ ltp)
+            self._gross = float(self.gross_units[:n] @ ltp)
+            self._margin = float(self.margin_units[:n] @ ltp)
+
+    # ---- fills from order_book ----
+    def on_events(self, events: list):
+        """OrderSync on_events: applies trade events (Kite or Angel trade book rows)."""
+        for e in events:
+            if e.kind != "trade":
+                continue
+            t = e.order
+            if "instrument_token" in t:  # Kite
+                token, qty, price = t["instrument_token"], _num(t.get("quantity")), _num(t.get("average_price"))
+                side, product = t.get("transaction_type"), t.get("product", "MIS")
+                multiplier = 1.0
+            else:                        # Angel: no token in the trade book, go by symbol
+                token = self._symbols.get((t.get("exchange"), t.get("tradingsymbol")))
+                qty, price = _num(t.get("fillsize")), _num(t.get("fillprice"))
+                side, product = t.get("transactiontype"), t.get("producttype", "INTRADAY")
+                multiplier = _num(t.get("multiplier")) or 1.0
+            if token is None:
+                self.stats["unmatched"] += 1
+                continue
+            self.apply_fill(token, qty if side == "BUY" else -qty, price, product, multiplier=multiplier,
+                            symbol=t.get("tradingsymbol", ""), exchange=t.get("exchange", ""))
+
+    # ---- reads ----
+    def summary(self) -> dict:
+        with self._lock:
+            pnl = float(self._cash + self._value)
+            margin = float(self._margin + self._margin_fixed)
+            return {
+                "pnl": pnl,
+                "realised": self._realised,
+                "unrealised": pnl - self._realised,
+                "net_exposure": float(self._value),
+                "gross_exposure": float(self._gross),
+                "margin": margin,
+                "margin_free": self.funds - margin,
+                "positions": len(self.positions),
+            }
+
+    def position_pnl(self) -> list:
+        """Per position: the record plus ltp, pnl and unrealised, at current prices."""
+        with self._lock:
+            result = []
+            for pos in self.positions:
+                ltp = float(self.ltp[self.rows[pos["token"]]])
+                pnl = pos["cash"] + pos["quantity"] * pos["multiplier"] * ltp
+                result.append(dict(pos, ltp=ltp, pnl=pnl, unrealised=pnl - pos["realised"]))
+            return result
+
+    # ---- seeding ----
+    def seed_angel(self, holdings: dict, positions: dict, trades: dict = None) -> list:
+        """
+        getAllHolding, getPosition and (optionally) getTradeBook responses,
+        parsed. Returns the trade rows the positions already include.
+        """
+        self.reset()
+        for h in ((holdings.get("data") or {}).get("holdings") or []):
+            qty = _num(h.get("quantity"))
+            self.add_position(h["symboltoken"], qty, -qty * _num(h.get("averageprice")), _num(h.get("ltp")),
+                              symbol=h.get("tradingsymbol", ""), exchange=h.get("exchange", ""))
+        for p in (positions.get("data") or []):
+            multiplier = _num(p.get("multiplier"))
+            self.add_position(p["symboltoken"], _num(p.get("netqty")),
+                              _num(p.get("totalsellvalue")) - _num(p.get("totalbuyvalue")), _num(p.get("ltp")),
+                              product=p.get("producttype", "INTRADAY"),
+                              segment=segment_of(p.get("producttype", ""), p.get("exchange", ""),
+                                                 p.get("tradingsymbol", "")),
+                              multiplier=multiplier if multiplier > 0 else 1.0,
+                              realised=_num(p.get("realised")), strike=_num(p.get("strikeprice")),
+                              symbol=p.get("tradingsymbol", ""), exchange=p.get("exchange", ""))
+        self.recompute()
+        return list(((trades or {}).get("data")) or [])
+
+    def seed_kite(self, holdings: list, positions: dict, trades: list = None) -> list:
+        """kite.holdings(), kite.positions() and (optionally) kite.trades(); returns the trade rows."""
+        self.reset()
+        for h in holdings:
+            qty = _num(h.get("quantity")) + _num(h.get("t1_quantity"))
+            self.add_position(h["instrument_token"], qty, -qty * _num(h.get("average_price")),
+                              _num(h.get("last_price")), symbol=h.get("tradingsymbol", ""),
+                              exchange=h.get("exchange", ""))
+        for p in positions.get("net", []):
+            symbol, exchange = p.get("tradingsymbol", ""), p.get("exchange", "")
+            self.add_position(p["instrument_token"], _num(p.get("quantity")),
+                              _num(p.get("sell_value")) - _num(p.get("buy_value")), _num(p.get("last_price")),
+                              product=p.get("product", "MIS"),
+                              segment=segment_of(p.get("product", ""), exchange, symbol),
+                              multiplier=_num(p.get("multiplier")) or 1.0, realised=_num(p.get("realised")),
+                              symbol=symbol, exchange=exchange)
+        self.recompute()
+        return list(trades or [])
+
+
+def _consistent(fetch_trades, fetch_positions, tries: int = 3) -> tuple:
+    """(positions, trades) with no fill landing between the two reads: trades, positions, trades again."""
+    trades = fetch_trades()
+    for _ in range(tries):
+        positions = fetch_positions()
+        again = fetch_trades()
+        if again == trades:
+            break
+        trades = again
+    return positions, trades
+
+
+def angel_portfolio(client, funds: float = 0.0, sync=None) -> Portfolio:
+    """
+    Portfolio seeded from AngelClient.get_holdings / get_position. Given the
+    OrderSync that will feed on_events, today's trades are marked seen in it.
+    """
+    holdings = json.loads(client.get_holdings())
+    if sync is None:
+        positions, trades = json.loads(client.get_position()), None
+    else:
+        positions, trades = _consistent(lambda: json.loads(client.get_tradebook()),
+                                        lambda: json.loads(client.get_position()))
+    for resp in (holdings, positions, trades or {"status": True}):
+        if not resp.get("status"):
+            raise RuntimeError(f"portfolio failed: {resp.get('errorcode')}: {resp.get('message')}")
+    pf = Portfolio(funds=funds)
+    rows = pf.seed_angel(holdings, positions, trades)
+    if sync is not None:
+        sync.book.apply_trades(rows)
+    return pf
+
+
+def kite_portfolio(kite, funds: float = None, sync=None) -> Portfolio:
+    """Portfolio seeded from kite.holdings / kite.positions; funds default to equity net margin."""
+    if funds is None:
+        funds = _num(kite.margins("equity").get("net"))
+    pf = Portfolio(funds=funds)
+    if sync is None:
+        pf.seed_kite(kite.holdings(), kite.positions())
+    else:
+        positions, trades = _consistent(kite.trades, kite.positions)
+        sync.book.apply_trades(pf.seed_kite(kite.holdings(), positions, trades))
+    return pf
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    from tick_decoder import TICK_DTYPE
+
+    response_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "angel-api", "response")
+    with open(os.path.join(response_dir, "allholdings.json")) as f:
+        holdings = json.load(f)
+    with open(os.path.join(response_dir, "getPosition.json")) as f:
+        positions = json.load(f)
+    with open(os.path.join(response_dir, "getexecutedtradebook.json")) as f:
+        trades = json.load(f)
+    pf = Portfolio(funds=1_000_000)
+    rows = pf.seed_angel(holdings, positions, trades)
+    s = pf.summary()
+    print(f"sample account: pnl {s['pnl']:,.2f} (realised {s['realised']:,.2f}), "
+          f"holdings P&L per broker {holdings['data']['totalholding']['totalprofitandloss']:,}")
+
+    # Seeding and then polling the same trade book must not move anything
+    from order_book import OrderBook, OrderSync
+    before = (pf.position_pnl(), pf.summary())
+    sync = OrderSync(OrderBook(), lambda: [], lambda: trades["data"], on_events=pf.on_events)
+    sync.book.apply_trades(rows)
+    replayed = sync.poll()
+    assert not replayed and (pf.position_pnl(), pf.summary()) == before, "trade book replayed over the seed"
+    print(f"seed + poll of the same {len(rows)}-row trade book: positions unchanged")
+
+    # 2,000 instruments, ticks in batches of 50
+    n, batch, rounds = 2000, 50, 20_000
+    rng = np.random.default_rng(1)
+    pf = Portfolio(funds=5_000_000)
+    for token in range(1, n + 1):
+        price = float(rng.uniform(50, 3000))
+        qty = float(rng.integers(-500, 500))
+        pf.add_position(token, qty, -qty * price, price, product="INTRADAY", segment="intraday")
+    ticks = np.zeros(batch, TICK_DTYPE)
+    batches = []
+    for _ in range(64):
+        ticks["token"] = rng.integers(1, n + 1, batch)
+        ticks["ltp"] = pf.ltp[ticks["token"] - 1] * rng.uniform(0.999, 1.001, batch)
+        batches.append(ticks.copy())
+    t0 = time.perf_counter()
+    for i in range(rounds):
+        pf.update_array(batches[i & 63])
+    elapsed = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(rounds):
+        pf.update_one(1 + (i % n), 100.0 + (i & 7))
+    one = time.perf_counter() - t0
+    before = pf.summary()["pnl"]
+    pf.recompute()
+    print(f"{n} instruments: {elapsed / rounds * 1e6:.1f} us per {batch}-tick batch "
+          f"({elapsed / rounds / batch * 1e9:.0f} ns/tick), update_one {one / rounds * 1e6:.2f} us; "
+          f"drift after {rounds * 2:,} updates Rs {abs(before - pf.summary()['pnl']):.2e}")
@@ -0,0 +1,194 @@
+# quote_cache.py
+"""
+Batched multi-symbol quotes with a TTL micro-cache and request coalescing.
+
+QuoteCache sits in front of a broker's market-quote endpoint:
+
+    - any number of symbols per call; the ones not cached are split into
+      the largest batch the endpoint accepts (Kite ltp/ohlc 1000, quote
+      500; Angel market quote 50) and the batches run concurrently
+    - results are kept for `ttl` seconds (250 ms by default), stamped with
+      the time the request was sent, so a quote is never older than ttl
+    - a symbol already being fetched is not requested again: concurrent
+      callers wait on the in-flight batch and share its result (also its
+      error), so N threads polling the same 500 symbols cost one upstream
+      request per TTL
+
+Symbols the broker does not return are cached as absent for the TTL too and
+left out of the result.
+
+Usage:
+    quotes = kite_quotes(kite)                     # kite.ltp, "NSE:INFY" keys
+    quotes.get(["NSE:INFY", "NSE:TCS"])            # {"NSE:INFY": {...}, ...}
+    quotes = angel_quotes(get_client(), "FULL")    # "NSE:3045" keys
+"""
+import json
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DEFAULT_TTL = 0.25
+# Instruments per request
+KITE_BATCH = {"ltp": 1000, "ohlc": 1000, "quote": 500}
+ANGEL_BATCH = 50
+ANGEL_MODES = ("LTP", "OHLC", "FULL")
+
+
+class QuoteCache:
+    def __init__(self, fetch, batch_size: int, ttl: float = DEFAULT_TTL, workers: int = 4):
+        """fetch(keys) -> {key: quote} for at most batch_size keys."""
+        self.fetch = fetch
+        self.batch_size = batch_size
+        self.ttl = ttl
+        self.workers = workers
+        self.stats = {"hits": 0, "coalesced": 0, "fetched": 0, "requests": 0, "errors": 0}
+        self._cache = {}     # key -> (sent_at, quote or None)
+        self._inflight = {}  # key -> Future of the batch fetching it
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def get(self, keys) -> dict:
+        """Quotes for keys (in the given order), from cache or one shared fetch."""
+        keys = list(dict.fromkeys(keys))
+        now = time.monotonic()
+        found, waits, batches = {}, [], []
+        with self._lock:
+            missing = []
+            for k in keys:
+                entry = self._cache.get(k)
+                if entry is not None and now - entry[0] < self.ttl:
+                    self.stats["hits"] += 1
+                    if entry[1] is not None:
+                        found[k] = entry[1]
+                elif k in self._inflight:
+                    self.stats["coalesced"] += 1
+                    waits.append(self._inflight[k])
+                else:
+                    missing.append(k)
+            for i in range(0, len(missing), self.batch_size):
+                batch, future = missing[i:i + self.batch_size], Future()
+                for k in batch:
+                    self._inflight[k] = future
+                batches.append((batch, future))
+            self.stats["fetched"] += len(missing)
+            if len(batches) > 1 and self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="quote-cache")
+        # Extra batches run in the pool, the first one in this thread
+        for batch, future in batches[1:]:
+            self._pool.submit(self._run, batch, future)
+        if batches:
+            self._run(*batches[0])
+        wanted = set(keys)
+        seen = set()
+        for future in waits + [f for _, f in batches]:
+            if id(future) in seen:
+                continue
+            seen.add(id(future))
+            for k, quote in future.result().items():
+                if k in wanted and quote is not None:
+                    found[k] = quote
+        return {k: found[k] for k in keys if k in found}
+
+    def get_one(self, key):
+        """Quote for one key, or None if the broker did not return it."""
+        return self.get([key]).get(key)
+
+    def _run(self, batch: list, future: Future):
+        sent_at = time.monotonic()
+        try:
+            quotes = self.fetch(batch)
+        except Exception as e:
+            with self._lock:
+                self.stats["errors"] += 1
+                for k in batch:
+                    if self._inflight.get(k) is future:
+                        del self._inflight[k]
+            future.set_exception(e)
+            return
+        with self._lock:
+            self.stats["requests"] += 1
+            for k in batch:
+                self._cache[k] = (sent_at, quotes.get(k))
+                if self._inflight.get(k) is future:
+                    del self._inflight[k]
+        future.set_result(quotes)
+
+    def invalidate(self, keys=None):
+        """Drops cached quotes (all of them by default); in-flight fetches are kept."""
+        with self._lock:
+            if keys is None:
+                self._cache.clear()
+            else:
+                for k in keys:
+                    self._cache.pop(k, None)
+
+    def close(self):
+        if self._pool:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+def kite_quotes(kite, kind: str = "ltp", ttl: float = DEFAULT_TTL) -> QuoteCache:
+    """
+    QuoteCache over kite.ltp / kite.ohlc / kite.quote. Keys are "EXCHANGE:SYMBOL"
+    strings or instrument tokens, as those methods take them.
+    """
+    method = getattr(kite, kind)
+
+    def fetch(keys):
+        data = method(list(keys))
+        return {k: data[str(k)] for k in keys if str(k) in data}
+
+    return QuoteCache(fetch, KITE_BATCH[kind], ttl)
+
+
+def angel_quotes(client, mode: str = "LTP", ttl: float = DEFAULT_TTL) -> QuoteCache:
+    """
+    QuoteCache over Angel's market quote endpoint (AngelClient.get_market_quote).
+    Keys are "EXCHANGE:SYMBOLTOKEN" strings, e.g. "NSE:3045"; quotes are the
+    entries of data.fetched.
+    """
+    if mode not in ANGEL_MODES:
+        raise ValueError(f"mode must be one of {ANGEL_MODES}")
+
+    def fetch(keys):
+        exchange_tokens = {}
+        for k in keys:
+            exchange, token = k.split(":", 1)
+            exchange_tokens.setdefault(exchange, []).append(token)
+        resp = json.loads(client.get_market_quote(mode, exchange_tokens))
+        if not resp.get("status"):
+            raise RuntimeError(f"quote failed: {resp.get('errorcode')}: {resp.get('message')}")
+        fetched = (resp.get("data") or {}).get("fetched") or []
+        return {f"{q['exchange']}:{q['symbolToken']}": q for q in fetched}
+
+    return QuoteCache(fetch, ANGEL_BATCH, ttl)
+
+
+if __name__ == "__main__":
+    latency = 0.02
+    calls = {"n": 0}
+
+    def fake_fetch(keys):
+        calls["n"] += 1
+        time.sleep(latency)
+        return {k: {"last_price": 100.0} for k in keys}
+
+    symbols = [f"NSE:SYM{i}" for i in range(500)]
+    quotes = QuoteCache(fake_fetch, batch_size=KITE_BATCH["quote"], ttl=0.25)
+
+    def poll(n):
+        for _ in range(n):
+            quotes.get(symbols)
+            time.sleep(0.01)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=poll, args=(50,)) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    print(f"20 pollers x 50 calls for {len(symbols)} symbols in {elapsed:.2f} s: "
+          f"{calls['n']} upstream requests ({calls['n'] / elapsed:.1f}/s, ttl {quotes.ttl}s)")
+    print(quotes.stats)
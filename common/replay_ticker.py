@@ -0,0 +1,244 @@
+# replay_ticker.py
+"""
+Market replay with the KiteTicker callback interface.
+
+ReplayTicker plays a recorded day back through the same callbacks and
+methods KiteTicker has (on_connect, on_ticks, on_message, on_close,
+subscribe, unsubscribe, set_mode, connect, close), so code written against
+ticker_example.py runs unchanged against local data. Sources:
+
+    journal  raw packets from tick_journal.py: exact KiteTicker tick dicts,
+             original inter-arrival timing (packets of one websocket
+             message stay one on_ticks batch)
+    candles  bars from the CandleStore, turned into open/high/low/close
+             quote ticks spread across each bar
+
+speed=1 is real time, speed=N is N times faster, speed=None is as fast as
+the callbacks consume. Only subscribed tokens are parsed, and in the mode
+set for them, so replaying a watchlist out of a full-market day takes
+seconds. With speed=None it is also a reproducible load generator.
+
+Usage:
+    kws = ReplayTicker(day="2025-04-02", speed=None)          # instead of KiteTicker(...)
+    kws = ReplayTicker(candles={408065: "NSE:INFY"}, interval="minute",
+                       start="2025-04-02 09:15", end="2025-04-02 15:30", speed=60)
+"""
+import time
+import struct
+import threading
+import datetime as dt
+import numpy as np
+import tick_journal
+from kite_packets import (MODE_LTP, MODE_QUOTE, MODE_FULL, EXCHANGE_MAP, parse_packet,
+                          build_message, packet_length, divisor_for)
+from candle_store import CandleStore
+from bar_aggregator import INTERVALS
+
+
+class ReplayTicker:
+    MODE_LTP = MODE_LTP
+    MODE_QUOTE = MODE_QUOTE
+    MODE_FULL = MODE_FULL
+
+    def __init__(self, api_key: str = None, access_token: str = None, day=None,
+                 journal_root: str = tick_journal.DEFAULT_ROOT, candles: dict = None,
+                 interval: str = "minute", start=None, end=None, store: CandleStore = None,
+                 speed: float = 1.0, **kwargs):
+        if (day is None) == (candles is None):
+            raise ValueError("pass either day= (tick journal) or candles= (candle store)")
+        self.day = day
+        self.journal_root = journal_root
+        self.candles = candles  # instrument_token -> CandleStore symbol
+        self.interval = interval
+        self.start = start
+        self.end = end
+        self.store = store
+        self.speed = speed
+        self.subscribed = {}  # token -> mode
+        self.stats = {"messages": 0, "ticks": 0, "elapsed": 0.0}
+
+        self.on_connect = None
+        self.on_ticks = None
+        self.on_message = None
+        self.on_close = None
+        self.on_error = None
+        self.on_reconnect = None
+        self.on_noreconnect = None
+        self.on_order_update = None
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._connected = False
+
+    # ---- KiteTicker interface ----
+    def subscribe(self, instrument_tokens: list) -> bool:
+        for t in instrument_tokens:
+            self.subscribed.setdefault(int(t), MODE_QUOTE)  # Kite's default mode
+        return True
+
+    def unsubscribe(self, instrument_tokens: list) -> bool:
+        for t in instrument_tokens:
+            self.subscribed.pop(int(t), None)
+        return True
+
+    def set_mode(self, mode: str, instrument_tokens: list) -> bool:
+        for t in instrument_tokens:
+            self.subscribed[int(t)] = mode
+        return True
+
+    def resubscribe(self):
+        pass
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def connect(self, threaded: bool = False, disable_ssl_verification: bool = False,
+                proxy=None, **reconnect_kwargs):
+        """Starts the replay; reconnect options are accepted and ignored."""
+        self._stop.clear()
+        if threaded:
+            self._thread = threading.Thread(target=self._run, name="replay-ticker", daemon=True)
+            self._thread.start()
+        else:
+            self._run()
+
+    def close(self, code: int = None, reason: str = None):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def stop(self):
+        self.close()
+
+    def stop_retry(self):
+        pass
+
+    # ---- replay ----
+    def _run(self):
+        self._connected = True
+        code, reason = 1000, "replay finished"
+        try:
+            if self.on_connect:
+                self.on_connect(self, {"replay": True})
+            messages = self._journal_messages() if self.day is not None else self._candle_messages()
+            self._play(messages)
+        except Exception as e:
+            code, reason = 1011, str(e)
+            if self.on_error:
+                self.on_error(self, code, reason)
+            else:
+                raise
+        finally:
+            self._connected = False
+            if self.on_close:
+                self.on_close(self, code, reason)
+
+    def _play(self, messages):
+        """messages yields (event_ns, packets); packets are sent as one message."""
+        t0 = time.perf_counter()
+        first_ns = None
+        for event_ns, packets in messages:
+            if self._stop.is_set():
+                break
+            if self.speed:
+                if first_ns is None:
+                    first_ns = event_ns
+                delay = (event_ns - first_ns) / 1e9 / self.speed - (time.perf_counter() - t0)
+                if delay > 0 and self._stop.wait(delay):
+                    break
+            if self.on_message:
+                self.on_message(self, build_message(packets), True)
+            if self.on_ticks:
+                ticks = [t for t in map(parse_packet, packets) if t is not None]
+                if ticks:
+                    self.on_ticks(self, ticks)
+            self.stats["messages"] += 1
+            self.stats["ticks"] += len(packets)
+        self.stats["elapsed"] = time.perf_counter() - t0
+
+    def _journal_messages(self):
+        records = tick_journal.read_day(self.day, self.journal_root)
+        view = records.view(tick_journal.PACKET_VIEW)
+        tokens = view["token"]
+        recv_ns = view["recv_ns"]
+        # Packets of one websocket message share their receive time
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(recv_ns)) + 1, [len(records)]))
+        subscribed, lengths = None, {}
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            if subscribed != self.subscribed:  # (un)subscribe / set_mode mid-replay
+                subscribed = dict(self.subscribed)
+                wanted = np.fromiter(subscribed, np.uint32, len(subscribed))
+                lengths = {t: packet_length(t, m) for t, m in subscribed.items()}
+            idx = lo + np.flatnonzero(np.isin(tokens[lo:hi], wanted))
+            if not len(idx):
+                continue
+            block = records[lo:hi].tobytes()
+            size, offset = tick_journal.RECORD_SIZE, tick_journal.PACKET_OFFSET
+            packets = []
+            for i, token, length in zip((idx - lo).tolist(), tokens[idx].tolist(), view["length"][idx].tolist()):
+                start = i * size + offset
+                # cut down to the subscribed mode
+                packets.append(block[start:start + min(length, lengths[token])])
+            yield int(recv_ns[lo]), packets
+
+    def _candle_messages(self):
+        store = self.store or CandleStore()
+        secs = INTERVALS.get(self.interval, 60)
+        events = []
+        for token, symbol in self.candles.items():
+            bars = store.read(symbol, self.interval, self.start, self.end)
+            if not len(bars["ts"]):
+                continue
+            cum, day = 0, None
+            for ts, o, h, l, c, v, oi in zip(*(bars[k].tolist() for k in
+                                                ("ts", "open", "high", "low", "close", "volume", "oi"))):
+                bar_day = ts // 86400
+                if bar_day != day:
+                    cum, day = 0, bar_day  # volume_traded is cumulative per day
+                # Bullish bars trade O-L-H-C, bearish O-H-L-C; volume split evenly
+                path = (o, l, h, c) if c >= o else (o, h, l, c)
+                for k, price in enumerate(path):
+                    cum += v // 4 + (v % 4 if k == 3 else 0)
+                    events.append((ts + k * secs // 4, token, price, cum, o, h, l, c, oi))
+        events.sort(key=lambda e: e[0])
+        i = 0
+        while i < len(events):
+            ts = events[i][0]
+            packets = []
+            while i < len(events) and events[i][0] == ts:
+                event = events[i]
+                i += 1
+                mode = self.subscribed.get(event[1])
+                if mode is not None:
+                    packets.append(_candle_packet(*event)[:packet_length(event[1], mode)])
+            if packets:
+                yield ts * 1_000_000_000, packets
+
+
+def _candle_packet(ts, token, price, cum, o, h, l, c, oi) -> bytes:
+    """Full-mode packet for one synthetic tick (cut to the subscribed mode by the caller)."""
+    div = divisor_for(token)
+    p = lambda x: int(round(x * div))
+    if token & 0xFF == EXCHANGE_MAP["indices"]:
+        return struct.pack(">IIIIIIII", token, p(price), p(h), p(l), p(o), p(c), 0, ts)
+    return (struct.pack(">IIIIIIIIIII", token, p(price), 0, p(price), cum, 0, 0, p(o), p(h), p(l), p(c))
+            + struct.pack(">IIIII", ts, oi, oi, oi, ts) + bytes(120))
+
+if __name__ == "__main__":
+    import sys
+
+    day = sys.argv[1] if len(sys.argv) > 1 else dt.date.today().isoformat()
+    kws = ReplayTicker(day=day, speed=None)
+    records = tick_journal.read_day(day)
+    tokens = np.unique(records.view(tick_journal.PACKET_VIEW)["token"]).tolist()
+
+    def on_connect(ws, response):
+        ws.subscribe(tokens)
+        ws.set_mode(ws.MODE_FULL, tokens)
+
+    kws.on_connect = on_connect
+    kws.on_ticks = lambda ws, ticks: None
+    kws.connect()
+    s = kws.stats
+    print(f"replayed {s['ticks']} ticks in {s['messages']} messages for {len(tokens)} tokens: "
+          f"{s['elapsed']:.2f} s ({s['ticks'] / max(s['elapsed'], 1e-9):,.0f} ticks/s)")
@@ -0,0 +1,401 @@
+# risk_gate.py
+"""
+In-process pre-trade risk gate for outbound orders.
+
+Every order is checked against per-instrument state kept in one slotted
+object per token (lot size, tick size, circuit band, last price, position,
+quantity working on each side), so a check is a dict lookup plus a few
+comparisons, a few microseconds with no I/O:
+
+    halted          kill switch is on
+    unknown         instrument not loaded (unless allow_unknown)
+    quantity        not a positive whole number / not a lot multiple / over max_order_qty
+    tick            limit price not on the tick grid
+    circuit         price outside the day's circuit band
+    price_band      limit price too far from ltp (fat finger)
+    value           quantity x price over max_order_value
+    position        position + working orders + this order over max_position
+    rate            over orders_per_sec (token bucket with `burst`)
+
+A passing check reserves the quantity on its side, so concurrent orders
+cannot together exceed the position limit; bind() ties the reservation to
+the broker's order id and release() drops it if the order never went out.
+Order / trade events from order_book.OrderSync (on_events) move fills into
+the position and free what is left when an order finishes. Positions set
+from a broker snapshot already include today's trade book, so seed them
+with seed() and the same trade rows: those are marked seen in the sync and
+its first poll does not add them again.
+
+A MARKET order is valued at ltp; with no tick yet it is valued at the upper
+circuit when the band is known and rejected otherwise.
+
+Decision counters and a log2 latency histogram (nanoseconds) are kept in
+memory; report() prints them.
+
+Usage:
+    gate = RiskGate(max_order_value=500_000)
+    gate.load(load_master("angel"), tokens, "NSE")
+    client = GatedClient(get_client(), gate)
+    client.place_order(order)       # raises RiskRejected("position: ...")
+"""
+import json
+import time
+import threading
+
+DEFAULT_LIMITS = {
+    "max_order_qty": 10_000,        # units per order
+    "max_order_value": 1_000_000.0,  # rupees per order
+    "max_position": 50_000,         # |units| per instrument, working orders included
+    "price_band": 0.05,             # limit price within 5% of ltp
+    "orders_per_sec": 10.0,
+    "burst": 20,
+}
+REASONS = ("halted", "unknown", "quantity", "tick", "circuit", "price_band", "value", "position", "rate")
+BUY, SELL = 1, -1
+
+
+class RiskRejected(Exception):
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+
+class _Instrument:
+    __slots__ = ("token", "lot", "tick", "lower", "upper", "ltp", "position", "working",
+                 "max_qty", "max_position")
+
+    def __init__(self, token: int, lot: int, tick: float, max_qty: int, max_position: int):
+        self.token = token
+        self.lot = lot or 1
+        self.tick = tick
+        self.lower = self.upper = 0.0   # circuit band; 0 = unknown
+        self.ltp = 0.0
+        self.position = 0
+        self.working = {BUY: 0, SELL: 0}
+        self.max_qty = max_qty
+        self.max_position = max_position
+
+
+class _Ticket:
+    __slots__ = ("inst", "side", "remaining")
+
+    def __init__(self, inst: _Instrument, side: int, remaining: int):
+        self.inst, self.side, self.remaining = inst, side, remaining
+
+
+class RiskGate:
+    def __init__(self, allow_unknown: bool = False, **limits):
+        unknown = set(limits) - set(DEFAULT_LIMITS)
+        if unknown:
+            raise ValueError(f"unknown limits: {sorted(unknown)}")
+        self.limits = dict(DEFAULT_LIMITS, **limits)
+        self.allow_unknown = allow_unknown
+        self.halted = False
+        self.stats = {"checked": 0, "passed": 0, **{r: 0 for r in REASONS}}
+        self.latency = [0] * 48   # bucket b counts checks taking < 2**b ns
+        self.instruments = {}     # token -> _Instrument
+        self._symbols = {}        # (exchange, tradingsymbol) -> token
+        self._exchanges = {}      # token -> exchange it was loaded for
+        self._orders = {}         # broker order id -> _Ticket
+        self._allowance = float(self.limits["burst"])
+        self._refilled = time.perf_counter()
+        self._lock = threading.Lock()
+
+    # ---- instrument state ----
+    def add(self, token: int, lot: int = 1, tick: float = 0.05, symbol: str = "", exchange: str = "",
+            max_qty: int = None, max_position: int = None) -> _Instrument:
+        token = int(token)
+        if exchange:
+            # Ticks and order bodies identify instruments by token, and Angel
+            # reuses symboltokens across exchanges: refuse to merge two of them
+            known = self._exchanges.setdefault(token, exchange)
+            if known != exchange:
+                raise ValueError(f"token {token} already loaded for {known}, cannot also hold {exchange}")
+        inst = self.instruments.get(token)
+        if inst is None:
+            inst = self.instruments[token] = _Instrument(
+                token, int(lot), float(tick),
+                self.limits["max_order_qty"] if max_qty is None else max_qty,
+                self.limits["max_position"] if max_position is None else max_position)
+        if symbol:
+            self._symbols[(exchange, symbol)] = token
+        return inst
+
+    def load(self, master, tokens, exchange: str = None) -> int:
+        """
+        Lot and tick size from an instruments.InstrumentMaster. tokens are
+        symboltokens on `exchange` or (exchange, token) pairs; bare tokens
+        without an exchange must be unique in the master.
+        """
+        n = 0
+        for token in tokens:
+            exch = exchange
+            if isinstance(token, tuple):
+                exch, token = token
+            row = master.get(token, exch)
+            if row is None:
+                continue
+            self.add(row["token"], row["lot_size"], row["tick_size"] or 0.05, row["symbol"], row["exchange"])
+            n += 1
+        return n
+
+    def set_band(self, token: int, lower: float, upper: float):
+        """Circuit limits (SnapQuote upper/lower_circuit, or kite.quote's circuit limits)."""
+        inst = self.instruments[int(token)]
+        inst.lower, inst.upper = float(lower), float(upper)
+
+    def set_position(self, token: int, quantity: int):
+        self.instruments[int(token)].position = int(quantity)
+
+    def seed(self, positions: dict, sync=None, trades: list = None):
+        """
+        positions: {token: net quantity} from a getPosition / kite.positions
+        snapshot; trades: the trade book rows that snapshot already includes,
+        marked seen in sync's book so on_events does not count them twice.
+        """
+        for token, quantity in positions.items():
+            self.set_position(token, quantity)
+        if sync is not None and trades:
+            sync.book.apply_trades(trades)
+
+    def update_ltp(self, token: int, ltp: float):
+        inst = self.instruments.get(token)
+        if inst is not None:
+            inst.ltp = ltp
+
+    def update_array(self, ticks):
+        """Last prices from a TICK_DTYPE batch."""
+        instruments = self.instruments
+        for token, ltp in zip(ticks["token"].tolist(), ticks["ltp"].tolist()):
+            inst = instruments.get(token)
+            if inst is not None and ltp > 0:
+                inst.ltp = ltp
+
+    # ---- checks ----
+    def check(self, token: int, side: int, quantity: int, price: float = 0.0, market: bool = False,
+              replaces=None) -> _Ticket:
+        """
+        Checks one order (side BUY / SELL) and reserves its quantity.
+        price is the limit price (ignored for market orders, which are valued
+        at ltp). replaces is the order id being modified: its reservation
+        is left out of the position check. Raises RiskRejected.
+        """
+        t0 = time.perf_counter_ns()
+        try:
+            with self._lock:
+                return self._check(token, side, quantity, price, market, replaces)
+        except RiskRejected as e:
+            self.stats[e.reason] += 1
+            raise
+        finally:
+            self.stats["checked"] += 1
+            self.latency[(time.perf_counter_ns() - t0).bit_length()] += 1
+
+    def _check(self, token, side, quantity, price, market, replaces) -> _Ticket:
+        limits = self.limits
+        if self.halted:
+            raise RiskRejected("halted")
+        inst = self.instruments.get(token)
+        if inst is None:
+            if not self.allow_unknown:
+                raise RiskRejected("unknown", str(token))
+            inst = self.add(token)
+        if quantity <= 0 or quantity != int(quantity):
+            raise RiskRejected("quantity", f"{quantity} is not a positive whole number")
+        quantity = int(quantity)
+        if quantity % inst.lot:
+            raise RiskRejected("quantity", f"{quantity} is not a multiple of lot size {inst.lot}")
+        if quantity > inst.max_qty:
+            raise RiskRejected("quantity", f"{quantity} over max {inst.max_qty}")
+
+        ltp = inst.ltp
+        if market:
+            # Fail closed: without a tick there is nothing to value the order at
+            price = ltp or inst.upper
+            if not price:
+                raise RiskRejected("price_band", "no ltp for market order")
+        else:
+            if price <= 0:
+                raise RiskRejected("tick", "limit order without a price")
+            if inst.tick:
+                steps = price / inst.tick
+                if abs(steps - round(steps)) > 1e-6:
+                    raise RiskRejected("tick", f"{price} not a multiple of {inst.tick}")
+            if inst.upper and not inst.lower <= price <= inst.upper:
+                raise RiskRejected("circuit", f"{price} outside {inst.lower}-{inst.upper}")
+            if ltp and abs(price - ltp) > limits["price_band"] * ltp:
+                raise RiskRejected("price_band", f"{price} vs ltp {ltp}")
+        if quantity * price > limits["max_order_value"]:
+            raise RiskRejected("value", f"{quantity * price:.2f} over {limits['max_order_value']}")
+
+        working = inst.working[side]
+        old = self._orders.get(replaces) if replaces is not None else None
+        if old is not None and old.inst is inst and old.side == side:
+            working -= old.remaining
+        if abs(inst.position + side * (working + quantity)) > inst.max_position:
+            raise RiskRejected("position", f"{inst.position} held, {working} working, max {inst.max_position}")
+
+        now = time.perf_counter()
+        allowance = min(limits["burst"], self._allowance + (now - self._refilled) * limits["orders_per_sec"])
+        self._refilled = now
+        if allowance < 1:
+            self._allowance = allowance
+            raise RiskRejected("rate", f"over {limits['orders_per_sec']}/s")
+        self._allowance = allowance - 1
+
+        inst.working[side] += quantity
+        self.stats["passed"] += 1
+        return _Ticket(inst, side, quantity)
+
+    def check_angel(self, order: dict, replaces=None) -> _Ticket:
+        """placeOrder / modifyOrder body (Angel field names, string values)."""
+        market = order.get("ordertype") == "MARKET"
+        side = order.get("transactiontype")
+        if side is None:  # modifyOrder bodies carry no side: take the one we reserved
+            old = self._orders.get(replaces)
+            if old is None:
+                self.stats["checked"] += 1
+                self.stats["unknown"] += 1
+                raise RiskRejected("unknown", f"order {replaces} was not placed through this gate")
+            side = old.side
+        else:
+            side = BUY if side == "BUY" else SELL
+        return self.check(int(order["symboltoken"]), side, float(order["quantity"]),
+                          0.0 if market else float(order.get("price") or 0), market, replaces)
+
+    def check_kite(self, params: dict, replaces=None) -> _Ticket:
+        """kite.place_order keyword arguments (exchange, tradingsymbol, transaction_type, ...)."""
+        token = self._symbols.get((params["exchange"], params["tradingsymbol"]))
+        if token is None:
+            self.stats["checked"] += 1
+            self.stats["unknown"] += 1
+            raise RiskRejected("unknown", f"{params['exchange']}:{params['tradingsymbol']}")
+        market = params.get("order_type") == "MARKET"
+        return self.check(token, BUY if params["transaction_type"] == "BUY" else SELL, params["quantity"],
+                          0.0 if market else float(params.get("price") or 0), market, replaces)
+
+    # ---- reservations ----
+    def bind(self, ticket: _Ticket, orderid):
+        """Ties a passed check to the broker's order id (a modify replaces the old reservation)."""
+        with self._lock:
+            old = self._orders.get(orderid)
+            if old is not None:
+                old.inst.working[old.side] -= old.remaining
+            self._orders[orderid] = ticket
+
+    def release(self, ticket: _Ticket):
+        """Drops the reservation of an order that was not placed."""
+        with self._lock:
+            ticket.inst.working[ticket.side] -= ticket.remaining
+            ticket.remaining = 0
+
+    def on_events(self, events: list):
+        """order_book.OrderSync events: trades move positions, finished orders free their reservation."""
+        with self._lock:
+            for e in events:
+                ticket = self._orders.get(e.orderid)
+                if e.kind == "trade":
+                    t = e.order
+                    qty = int(float(t.get("fillsize") or t.get("quantity") or 0))
+                    side = BUY if (t.get("transactiontype") or t.get("transaction_type")) == "BUY" else SELL
+                    if ticket is not None:
+                        inst = ticket.inst
+                        filled = min(qty, ticket.remaining)
+                        ticket.remaining -= filled
+                        inst.working[ticket.side] -= filled
+                    else:
+                        token = t.get("instrument_token") or self._symbols.get((t.get("exchange"),
+                                                                                t.get("tradingsymbol")))
+                        inst = self.instruments.get(token)
+                        if inst is None:
+                            continue
+                    inst.position += side * qty
+                elif e.kind in ("filled", "cancelled", "rejected") and ticket is not None:
+                    ticket.inst.working[ticket.side] -= ticket.remaining
+                    ticket.remaining = 0
+
+    # ---- reporting ----
+    def latency_percentile(self, q: float) -> float:
+        """Upper bound (microseconds) of the histogram bucket holding quantile q."""
+        total = sum(self.latency)
+        if not total:
+            return 0.0
+        seen = 0
+        for b, count in enumerate(self.latency):
+            seen += count
+            if seen >= q * total:
+                return (1 << b) / 1000
+        return (1 << (len(self.latency) - 1)) / 1000
+
+    def report(self) -> str:
+        s = self.stats
+        rejected = {r: s[r] for r in REASONS if s[r]}
+        return (f"{s['checked']} checked, {s['passed']} passed, rejected {rejected}; latency "
+                f"p50 < {self.latency_percentile(0.5):.1f} us, p99 < {self.latency_percentile(0.99):.1f} us")
+
+
+class GatedClient:
+    """AngelClient with place_order / modify_order behind a RiskGate; everything else passes through."""
+
+    def __init__(self, client, gate: RiskGate):
+        self.client = client
+        self.gate = gate
+
+    def place_order(self, order: dict) -> str:
+        return self._send(self.client.place_order, order, self.gate.check_angel(order))
+
+    def modify_order(self, order: dict) -> str:
+        return self._send(self.client.modify_order, order, self.gate.check_angel(order, order.get("orderid")))
+
+    def _send(self, call, order: dict, ticket: _Ticket) -> str:
+        try:
+            text = call(order)
+        except Exception:
+            self.gate.release(ticket)
+            raise
+        try:
+            resp = json.loads(text)
+        except ValueError:
+            resp = {}
+        orderid = (resp.get("data") or {}).get("orderid") if resp.get("status") else None
+        if orderid:
+            self.gate.bind(ticket, orderid)
+        else:
+            self.gate.release(ticket)
+        return text
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+if __name__ == "__main__":
+    gate = RiskGate(max_order_value=2_000_000, orders_per_sec=1e9, burst=1e9)
+    for token in range(1, 2001):
+        gate.add(token, lot=25 if token % 2 else 1, tick=0.05)
+        gate.update_ltp(token, 1000.0)
+        gate.set_band(token, 900.0, 1100.0)
+    order = {"symboltoken": "1001", "transactiontype": "BUY", "ordertype": "LIMIT",
+             "price": "1001.05", "quantity": "25"}
+
+    n = 100_000
+    t0 = time.perf_counter()
+    for i in range(n):
+        gate.release(gate.check(1 + (i % 1000) * 2, BUY, 25, 1001.05))
+    core = (time.perf_counter() - t0) / n
+    t0 = time.perf_counter()
+    for _ in range(n):
+        gate.release(gate.check_angel(order))
+    parsed = (time.perf_counter() - t0) / n
+    for price, qty in ((1001.03, 25), (1200.0, 25), (1001.0, 10), (1001.0, 50_025)):
+        try:
+            gate.check(1001, BUY, qty, price)
+        except RiskRejected as e:
+            print("rejected:", e)
+    untraded = RiskGate()
+    untraded.add(6)
+    try:
+        untraded.check(6, BUY, 5000, market=True)
+        raise AssertionError("market order without ltp passed")
+    except RiskRejected as e:
+        print("rejected:", e)
+    print(f"check {core * 1e6:.2f} us, check_angel {parsed * 1e6:.2f} us (incl. release); {gate.report()}")
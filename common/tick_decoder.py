@@ -0,0 +1,184 @@
+# tick_decoder.py
+"""
+Zero-copy NumPy decoder for Kite binary websocket messages.
+
+KiteTicker turns every packet into a dict (plus nested ohlc/depth dicts,
+floats and datetimes), roughly 80 Python objects per full-mode tick.
+TickDecoder instead decodes a message straight into one preallocated
+structured array (TICK_DTYPE):
+
+    - the frame is [count][len][packet][len][packet]..., so a run of
+      equal-length packets is a fixed-stride record array; an ndarray over
+      the frame buffer maps it with a big-endian dtype without copying
+    - each field of that run is converted into the output array with one
+      vectorized assignment (prices divided by the segment's divisor)
+
+Hook it to KiteTicker.on_message and leave on_ticks unset, so KiteTicker
+skips its own dict parsing:
+
+    decoder = attach(kws, on_ticks_array)    # on_ticks_array(ws, ticks)
+
+The array passed to on_ticks_array is a view into the decoder's buffer and
+is overwritten by the next message; copy what you keep.
+"""
+import struct
+import numpy as np
+from kite_packets import EXCHANGE_MAP
+from metrics import REGISTRY
+
+MODES = {"ltp": 1, "quote": 2, "full": 3}
+TICK_DTYPE = np.dtype([
+    ("token", "<u4"),
+    ("mode", "u1"),        # MODES
+    ("tradable", "?"),
+    ("ltp", "<f8"),
+    ("ltq", "<u4"),
+    ("avg_price", "<f8"),
+    ("volume", "<u8"),
+    ("buy_qty", "<u8"),
+    ("sell_qty", "<u8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("change", "<f8"),
+    ("last_trade_ts", "<i8"),  # epoch seconds
+    ("oi", "<u8"),
+    ("oi_high", "<u8"),
+    ("oi_low", "<u8"),
+    ("exchange_ts", "<i8"),    # epoch seconds
+    ("bid", "<f8", (5,)),
+    ("bid_qty", "<u4", (5,)),
+    ("bid_orders", "<u2", (5,)),
+    ("ask", "<f8", (5,)),
+    ("ask_qty", "<u4", (5,)),
+    ("ask_orders", "<u2", (5,)),
+])
+
+_LEVEL = [("qty", ">u4"), ("price", ">i4"), ("orders", ">u2"), ("pad", "V2")]
+
+
+def _wire(fields: list, length: int) -> np.dtype:
+    """Big-endian packet layout (packets sit length + 2 bytes apart in a frame)."""
+    names, formats, offsets = zip(*fields)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": length})
+
+
+_COMMON = [("token", ">u4", 0), ("ltp", ">i4", 4)]
+_QUOTE = _COMMON + [
+    ("ltq", ">u4", 8), ("avg_price", ">i4", 12), ("volume", ">u4", 16),
+    ("buy_qty", ">u4", 20), ("sell_qty", ">u4", 24),
+    ("open", ">i4", 28), ("high", ">i4", 32), ("low", ">i4", 36), ("close", ">i4", 40),
+]
+_FULL = _QUOTE + [
+    ("last_trade_ts", ">u4", 44), ("oi", ">u4", 48), ("oi_high", ">u4", 52),
+    ("oi_low", ">u4", 56), ("exchange_ts", ">u4", 60), ("depth", (_LEVEL, (10,)), 64),
+]
+_INDEX_QUOTE = _COMMON + [
+    ("high", ">i4", 8), ("low", ">i4", 12), ("open", ">i4", 16), ("close", ">i4", 20),
+]
+_INDEX_FULL = _INDEX_QUOTE + [("exchange_ts", ">u4", 28)]
+
+# packet length -> (wire dtype, mode, price fields, plain fields)
+LAYOUTS = {
+    8: (_wire(_COMMON, 8), MODES["ltp"], ("ltp",), ()),
+    28: (_wire(_INDEX_QUOTE, 28), MODES["quote"], ("ltp", "open", "high", "low", "close"), ()),
+    32: (_wire(_INDEX_FULL, 32), MODES["full"], ("ltp", "open", "high", "low", "close"),
+         ("exchange_ts",)),
+    44: (_wire(_QUOTE, 44), MODES["quote"], ("ltp", "avg_price", "open", "high", "low", "close"),
+         ("ltq", "volume", "buy_qty", "sell_qty")),
+    184: (_wire(_FULL, 184), MODES["full"], ("ltp", "avg_price", "open", "high", "low", "close"),
+          ("ltq", "volume", "buy_qty", "sell_qty", "last_trade_ts", "oi", "oi_high", "oi_low",
+           "exchange_ts")),
+}
+
+# Price divisor by segment (instrument_token & 0xff), as in KiteTicker
+_DIVISOR = np.full(256, 100.0)
+_DIVISOR[EXCHANGE_MAP["cds"]] = 1e7
+_DIVISOR[EXCHANGE_MAP["bcd"]] = 1e4
+
+
+class TickDecoder:
+    def __init__(self, capacity: int = 8192, on_ticks_array=None, on_message=None):
+        self.ticks = np.zeros(capacity, TICK_DTYPE)
+        self.on_ticks_array = on_ticks_array
+        self.on_message_next = on_message  # e.g. TickJournal.on_message, called first
+        self.stats = {"messages": 0, "ticks": 0}
+
+    def decode(self, payload) -> np.ndarray:
+        """Decodes one binary message into the buffer; returns a view of its ticks."""
+        if len(payload) < 4:
+            return self.ticks[:0]  # heartbeat
+        count = struct.unpack_from(">H", payload, 0)[0]
+        if count > len(self.ticks):
+            self.ticks = np.zeros(count, TICK_DTYPE)
+        out = self.ticks
+        unpack = struct.Struct(">H").unpack_from
+        pos, n = 2, 0
+        while n < count:
+            # Find the run of packets with this length
+            length = unpack(payload, pos)[0]
+            run_start, run = pos + 2, 0
+            while n + run < count and unpack(payload, pos)[0] == length:
+                pos += length + 2
+                run += 1
+            layout = LAYOUTS.get(length)
+            if layout is None:  # unknown packet type: skip the run
+                count -= run
+                continue
+            src = np.ndarray((run,), layout[0], payload, run_start, (length + 2,))
+            self._fill(out[n:n + run], src, layout)
+            n += run
+        self.stats["messages"] += 1
+        self.stats["ticks"] += n
+        return out[:n]
+
+    @staticmethod
+    def _fill(dst: np.ndarray, src: np.ndarray, layout: tuple):
+        _, mode, prices, plain = layout
+        token = src["token"]
+        segment = token & 0xFF
+        divisor = _DIVISOR[segment]
+        dst.view(np.uint8).fill(0)  # much cheaper than dst[:] = 0 on a structured array
+        dst["token"] = token
+        dst["mode"] = mode
+        dst["tradable"] = segment != EXCHANGE_MAP["indices"]
+        for name in prices:
+            dst[name] = src[name] / divisor
+        for name in plain:
+            dst[name] = src[name]
+        if "close" in prices:
+            close = dst["close"]
+            np.divide((dst["ltp"] - close) * 100, close, out=dst["change"], where=close != 0)
+        if "depth" in src.dtype.names:
+            depth = src["depth"]
+            dst["bid"] = depth["price"][:, :5] / divisor[:, None]
+            dst["ask"] = depth["price"][:, 5:] / divisor[:, None]
+            dst["bid_qty"] = depth["qty"][:, :5]
+            dst["ask_qty"] = depth["qty"][:, 5:]
+            dst["bid_orders"] = depth["orders"][:, :5]
+            dst["ask_orders"] = depth["orders"][:, 5:]
+
+    def on_message(self, ws, payload, is_binary):
+        """KiteTicker.on_message hook."""
+        if self.on_message_next:
+            self.on_message_next(ws, payload, is_binary)
+        if not is_binary or len(payload) < 4:
+            return
+        ticks = self.decode(payload)
+        if len(ticks):
+            REGISTRY.tick_lag("kite", ticks["exchange_ts"])
+        if len(ticks) and self.on_ticks_array:
+            self.on_ticks_array(ws, ticks)
+
+
+def attach(kws, on_ticks_array, capacity: int = 8192) -> TickDecoder:
+    """
+    Routes kws's binary messages through a TickDecoder into
+    on_ticks_array(ws, ticks). Keeps an existing on_message (called first)
+    and clears on_ticks so KiteTicker no longer builds tick dicts.
+    """
+    decoder = TickDecoder(capacity, on_ticks_array, on_message=kws.on_message)
+    kws.on_message = decoder.on_message
+    kws.on_ticks = None
+    return decoder
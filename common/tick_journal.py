@@ -0,0 +1,265 @@
+# tick_journal.py
+"""
+Append-only binary journal of raw KiteTicker packets, one file per day.
+
+KiteTicker hands every websocket message to on_message before parsing it.
+TickJournal.on_message only appends (receive time, payload) to a deque, so
+the websocket thread never blocks on disk. A writer thread wakes every
+flush_interval, splits the payloads into packets and writes them in one
+batch as fixed-size records:
+
+    recv_ns  <i8   local receive time, epoch nanoseconds
+    length   <u2   packet length (8 ltp, 28/32 index, 44 quote, 184 full)
+    reserved 6 bytes
+    packet   184 bytes, the exchange packet as sent (big-endian), zero padded
+
+Files live in <repo>/data/ticks/YYYY-MM-DD.ktj (IST date of receipt) behind
+a 16-byte header. At day rollover the previous file can be gzipped in the
+background. Reading memory-maps the file as a numpy structured array, and
+PACKET_VIEW reinterprets the same bytes as named big-endian fields, so a
+day can be scanned column-wise without copying or parsing.
+
+Usage:
+    journal = TickJournal()
+    kws.on_message = journal.on_message
+
+    ticks = decode(read_day("2025-04-02"))   # token, ltp, volume, ... arrays
+"""
+import os
+import gzip
+import time
+import struct
+import shutil
+import threading
+import collections
+import datetime as dt
+import numpy as np
+from kite_packets import split_message
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "ticks")
+MAGIC = b"KTJ1"
+HEADER_SIZE = 16
+PACKET_SIZE = 184
+RECORD_DTYPE = np.dtype([
+    ("recv_ns", "<i8"),
+    ("length", "<u2"),
+    ("reserved", "V6"),
+    ("packet", "V184"),
+])
+RECORD_SIZE = RECORD_DTYPE.itemsize  # 200
+PACKET_OFFSET = RECORD_DTYPE.fields["packet"][1]  # 16
+IST = dt.timezone(dt.timedelta(hours=5, minutes=30))
+
+# Named views into a record. Non-index packets (quote/full) use this layout;
+# index packets (28/32 bytes) put high/low/open/close/change at 8..24 and the
+# exchange timestamp at 28 instead, handled in decode().
+_P = PACKET_OFFSET
+PACKET_VIEW = np.dtype({
+    "names": ["recv_ns", "length", "token", "ltp", "ltq", "avg_price", "volume",
+              "buy_qty", "sell_qty", "open", "high", "low", "close",
+              "last_trade_ts", "oi", "oi_high", "oi_low", "exchange_ts", "index_exchange_ts"],
+    "formats": ["<i8", "<u2", ">u4", ">i4", ">i4", ">i4", ">u4",
+                ">u4", ">u4", ">i4", ">i4", ">i4", ">i4",
+                ">u4", ">u4", ">u4", ">u4", ">u4", ">u4"],
+    "offsets": [0, 8, _P, _P + 4, _P + 8, _P + 12, _P + 16,
+                _P + 20, _P + 24, _P + 28, _P + 32, _P + 36, _P + 40,
+                _P + 44, _P + 48, _P + 52, _P + 56, _P + 60, _P + 28],
+    "itemsize": RECORD_SIZE,
+})
+# Kite price divisors by segment (instrument_token & 0xff): CDS 1e7, BCD 1e4, rest 100
+_SEGMENT_DIVISOR = np.full(256, 100.0)
+_SEGMENT_DIVISOR[3] = 1e7
+_SEGMENT_DIVISOR[6] = 1e4
+_SEGMENT_INDICES = 9
+
+
+def day_path(day, root: str = DEFAULT_ROOT) -> str:
+    """Journal path for a date / "YYYY-MM-DD" (the .gz variant if only that exists)."""
+    name = day if isinstance(day, str) else day.isoformat()
+    path = os.path.join(root, f"{name}.ktj")
+    if not os.path.exists(path) and os.path.exists(path + ".gz"):
+        return path + ".gz"
+    return path
+
+
+def pack_records(messages: list) -> bytes:
+    """[(recv_ns, payload)] -> concatenated fixed-size records."""
+    records = []
+    header = struct.Struct("<qH6x")
+    pad = bytes(PACKET_SIZE)
+    for recv_ns, payload in messages:
+        for packet in split_message(payload):
+            packet = packet[:PACKET_SIZE]
+            records.append(header.pack(recv_ns, len(packet)) + packet + pad[len(packet):])
+    return b"".join(records)
+
+
+class TickJournal:
+    def __init__(self, root: str = DEFAULT_ROOT, flush_interval: float = 0.05,
+                 compress: bool = False, fsync: bool = False):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.fsync = fsync
+        self.stats = {"messages": 0, "records": 0, "bytes": 0, "errors": 0}
+        self._pending = collections.deque()
+        self._stop = threading.Event()
+        self._file = None
+        self._day = None
+        os.makedirs(root, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_loop, name="tick-journal", daemon=True)
+        self._writer.start()
+
+    # ---- websocket thread ----
+    def on_message(self, ws, payload, is_binary):
+        """KiteTicker.on_message hook: O(1), never touches the disk."""
+        if is_binary and len(payload) > 1:
+            self._pending.append((time.time_ns(), payload))
+
+    # ---- writer thread ----
+    def _open(self, day: str):
+        if self._file:
+            self._file.close()
+            if self.compress:
+                threading.Thread(target=compress_day, args=(self._day, self.root), daemon=True).start()
+        path = os.path.join(self.root, f"{day}.ktj")
+        self._file = open(path, "ab")
+        size = self._file.tell()
+        if size == 0:
+            self._file.write(MAGIC + struct.pack("<I8x", RECORD_SIZE))
+        elif (size - HEADER_SIZE) % RECORD_SIZE:
+            # Torn last record from a crash: drop it so records stay aligned
+            self._file.truncate(size - (size - HEADER_SIZE) % RECORD_SIZE)
+        self._day = day
+
+    def _flush(self):
+        batch = []
+        while self._pending:
+            batch.append(self._pending.popleft())
+        if not batch:
+            return
+        # Split the batch at IST midnight so each record lands in its own day file
+        by_day = collections.OrderedDict()
+        for recv_ns, payload in batch:
+            day = dt.datetime.fromtimestamp(recv_ns / 1e9, IST).date().isoformat()
+            by_day.setdefault(day, []).append((recv_ns, payload))
+        for day, messages in by_day.items():
+            try:
+                if day != self._day:
+                    self._open(day)
+                data = pack_records(messages)
+                self._file.write(data)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+                self.stats["messages"] += len(messages)
+                self.stats["records"] += len(data) // RECORD_SIZE
+                self.stats["bytes"] += len(data)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Tick journal write failed: {e}")
+
+    def _write_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self._flush()
+        self._flush()
+
+    def close(self):
+        self._stop.set()
+        self._writer.join()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def compress_day(day: str, root: str = DEFAULT_ROOT) -> str:
+    """Gzips a finished day file (tmp + rename) and removes the original."""
+    src = os.path.join(root, f"{day}.ktj")
+    dst = src + ".gz"
+    with open(src, "rb") as f, gzip.open(dst + ".tmp", "wb", compresslevel=6) as g:
+        shutil.copyfileobj(f, g, 1 << 20)
+    os.replace(dst + ".tmp", dst)
+    os.remove(src)
+    return dst
+
+
+def read_journal(path: str) -> np.ndarray:
+    """Records of one journal file: a read-only memmap (or an array for .gz)."""
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            raw = f.read()
+        if raw[:4] != MAGIC:
+            raise ValueError(f"not a tick journal: {path}")
+        n = (len(raw) - HEADER_SIZE) // RECORD_SIZE
+        return np.frombuffer(raw, RECORD_DTYPE, count=n, offset=HEADER_SIZE)
+    with open(path, "rb") as f:
+        if f.read(4) != MAGIC:
+            raise ValueError(f"not a tick journal: {path}")
+    n = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+    if n <= 0:
+        return np.empty(0, RECORD_DTYPE)
+    return np.memmap(path, RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(n,))
+
+
+def read_day(day, root: str = DEFAULT_ROOT) -> np.ndarray:
+    return read_journal(day_path(day, root))
+
+
+def decode(records: np.ndarray, tokens=None) -> dict:
+    """
+    Vectorized decode of journal records into column arrays: recv_ns, token,
+    length, ltp, ltq, volume, oi, exchange_ts (0 where the packet mode does
+    not carry the field). Prices are in rupees. tokens restricts the rows.
+    """
+    view = records.view(PACKET_VIEW)
+    token = view["token"]
+    if tokens is not None:
+        keep = np.isin(token, np.asarray(list(tokens), np.uint32))
+        view, token = view[keep], token[keep]
+    length = view["length"]
+    segment = token & 0xFF
+    divisor = _SEGMENT_DIVISOR[segment]
+    is_index = segment == _SEGMENT_INDICES
+    has_quote = (length >= 44) & ~is_index
+    has_full = (length >= 184) & ~is_index
+    zero = np.zeros(len(view), np.int64)
+    return {
+        "recv_ns": view["recv_ns"].astype(np.int64),
+        "token": token.astype(np.int64),
+        "length": length.astype(np.int64),
+        "ltp": view["ltp"] / divisor,
+        "ltq": np.where(has_quote, view["ltq"], zero),
+        "volume": np.where(has_quote, view["volume"], zero),
+        "oi": np.where(has_full, view["oi"], zero),
+        "exchange_ts": np.where(has_full, view["exchange_ts"],
+                                np.where(is_index & (length >= 32), view["index_exchange_ts"], zero)),
+    }
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    n_packets, per_message = 1_000_000, 100
+    with tempfile.TemporaryDirectory() as root:
+        journal = TickJournal(root)
+        packet = struct.pack(">IiiiIII", 408065, 150025, 10, 150000, 123456, 50, 60).ljust(PACKET_SIZE, b"\0")
+        payload = struct.pack(">H", per_message) + (struct.pack(">H", PACKET_SIZE) + packet) * per_message
+        t0 = time.perf_counter()
+        for _ in range(n_packets // per_message):
+            journal.on_message(None, payload, True)
+        callback = time.perf_counter() - t0
+        journal.close()
+        print(f"on_message: {callback / (n_packets // per_message) * 1e6:.2f} us per message; "
+              f"written {journal.stats['records']} records in {time.perf_counter() - t0:.2f} s")
+
+        path = os.path.join(root, os.listdir(root)[0])
+        t0 = time.perf_counter()
+        records = read_journal(path)
+        ltp = records.view(PACKET_VIEW)["ltp"]
+        total = int(ltp.sum(dtype=np.int64))
+        elapsed = time.perf_counter() - t0
+        print(f"scan ltp over {len(records)} records ({records.nbytes / 1e6:.0f} MB): "
+              f"{elapsed * 1e3:.0f} ms, {records.nbytes / elapsed / 1e9:.2f} GB/s, sum {total}")
+        t0 = time.perf_counter()
+        cols = decode(records)
+        print(f"decode all columns: {(time.perf_counter() - t0) * 1e3:.0f} ms, ltp[0] {cols['ltp'][0]}")
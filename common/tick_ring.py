@@ -0,0 +1,249 @@
+# tick_ring.py
+"""
+Preallocated per-instrument tick ring buffers for KiteTicker on_ticks.
+
+Every field is one 2-D numpy array [token row, slot], allocated once up
+front (np.zeros is lazily paged, so untouched rows cost no resident
+memory). A batch of ticks is written with one fancy-indexed assignment per
+field, so appends are O(1) and nothing grows per tick.
+
+Concurrency is single writer (the websocket thread), many readers, no
+locks: the writer fills a slot first and only then publishes it by bumping
+count[row]. Readers snapshot count, copy the slots they need and re-check
+count; slots the writer overwrote in the meantime are masked out.
+
+Usage:
+    ring = TickRing(tokens, capacity=1024)
+
+    def on_ticks(ws, ticks):
+        ring.write(ticks)
+
+    ring.latest("ltp")                          # last ltp of every token
+    ring.last(408065, 100)                      # last 100 ticks of one token
+    ltp, valid = ring.window("ltp", seconds=300)  # last 5 minutes, all tokens
+"""
+import time
+import numpy as np
+
+SCALARS = {
+    "ts": np.dtype("<i8"),        # exchange timestamp, epoch seconds
+    "ltp": np.dtype("<f8"),
+    "ltq": np.dtype("<i4"),
+    "volume": np.dtype("<i8"),    # cumulative volume_traded
+    "oi": np.dtype("<i8"),
+    "buy_qty": np.dtype("<i8"),   # total_buy_quantity
+    "sell_qty": np.dtype("<i8"),  # total_sell_quantity
+}
+DEPTH = {
+    "bid": np.dtype("<f8"),
+    "bid_qty": np.dtype("<i4"),
+    "ask": np.dtype("<f8"),
+    "ask_qty": np.dtype("<i4"),
+}
+
+
+def tick_time(tick: dict) -> int:
+    """Exchange time of a KiteTicker tick as epoch seconds (receive time if absent)."""
+    # kiteconnect builds naive datetimes with fromtimestamp(), so .timestamp() round-trips
+    value = tick.get("exchange_timestamp") or tick.get("last_trade_time")
+    return int(value.timestamp()) if value is not None else int(time.time())
+
+
+class TickRing:
+    def __init__(self, tokens=(), capacity: int = 1024, max_tokens: int = 4096, depth: int = 5):
+        self.capacity = capacity
+        self.max_tokens = max_tokens
+        self.depth = depth
+        self.rows = {}  # instrument_token -> row; only the writer adds entries
+        self.tokens = np.zeros(max_tokens, np.int64)
+        self.count = np.zeros(max_tokens, np.int64)  # ticks ever written per row
+        self._next = [0] * max_tokens  # writer-private copy of count
+        self.data = {name: np.zeros((max_tokens, capacity), dtype) for name, dtype in SCALARS.items()}
+        if depth:
+            for name, dtype in DEPTH.items():
+                self.data[name] = np.zeros((max_tokens, capacity, depth), dtype)
+        for token in tokens:
+            self.add(token)
+
+    def add(self, token: int) -> int:
+        row = self.rows.get(token)
+        if row is None:
+            row = len(self.rows)
+            if row >= self.max_tokens:
+                raise OverflowError(f"TickRing is full ({self.max_tokens} tokens)")
+            self.tokens[row] = token
+            self.rows[token] = row
+        return row
+
+    def __len__(self):
+        return len(self.rows)
+
+    # ---- writer (websocket thread only) ----
+    def write(self, ticks: list) -> int:
+        """Appends a batch of KiteTicker tick dicts; returns ticks written."""
+        n = len(ticks)
+        if not n:
+            return 0
+        cols = {
+            "ts": [tick_time(t) for t in ticks],
+            "ltp": [t.get("last_price", 0.0) for t in ticks],
+            "ltq": [t.get("last_traded_quantity", 0) for t in ticks],
+            "volume": [t.get("volume_traded", 0) for t in ticks],
+            "oi": [t.get("oi", 0) for t in ticks],
+            "buy_qty": [t.get("total_buy_quantity", 0) for t in ticks],
+            "sell_qty": [t.get("total_sell_quantity", 0) for t in ticks],
+        }
+        if self.depth:
+            try:
+                # Full mode always carries 5 levels per side: flatten in one pass
+                books = [t["depth"] for t in ticks]
+                buy = [lv for b in books for lv in b["buy"]]
+                sell = [lv for b in books for lv in b["sell"]]
+                shape = (n, self.depth)
+                cols["bid"] = np.array([lv["price"] for lv in buy], np.float64).reshape(shape)
+                cols["bid_qty"] = np.array([lv["quantity"] for lv in buy], np.int32).reshape(shape)
+                cols["ask"] = np.array([lv["price"] for lv in sell], np.float64).reshape(shape)
+                cols["ask_qty"] = np.array([lv["quantity"] for lv in sell], np.int32).reshape(shape)
+            except (KeyError, TypeError, ValueError):
+                cols["bid"], cols["bid_qty"], cols["ask"], cols["ask_qty"] = self._depth_slow(ticks)
+        return self._write([t["instrument_token"] for t in ticks], cols)
+
+    def write_array(self, ticks: np.ndarray) -> int:
+        """Appends a TICK_DTYPE array from tick_decoder (the on_ticks_array path)."""
+        if not len(ticks):
+            return 0
+        ts = ticks["exchange_ts"]
+        ts = np.where(ts > 0, ts, np.where(ticks["last_trade_ts"] > 0, ticks["last_trade_ts"], int(time.time())))
+        cols = {
+            "ts": ts,
+            "ltp": ticks["ltp"],
+            "ltq": ticks["ltq"],
+            "volume": ticks["volume"],
+            "oi": ticks["oi"],
+            "buy_qty": ticks["buy_qty"],
+            "sell_qty": ticks["sell_qty"],
+        }
+        if self.depth:
+            depth = self.depth
+            cols.update(bid=ticks["bid"][:, :depth], bid_qty=ticks["bid_qty"][:, :depth],
+                        ask=ticks["ask"][:, :depth], ask_qty=ticks["ask_qty"][:, :depth])
+        return self._write(ticks["token"].tolist(), cols)
+
+    def _write(self, tokens: list, cols: dict) -> int:
+        rows_map, nxt, cap = self.rows, self._next, self.capacity
+        n = len(tokens)
+        rows = [0] * n
+        slots = [0] * n
+        for i, token in enumerate(tokens):
+            row = rows_map.get(token)
+            if row is None:
+                row = self.add(token)
+            rows[i] = row
+            slots[i] = nxt[row] % cap
+            nxt[row] += 1
+        published = [nxt[r] for r in rows]
+        rows, slots = np.array(rows, np.intp), np.array(slots, np.intp)
+        d = self.data
+        for name, values in cols.items():
+            d[name][rows, slots] = values
+        # Publish only after every field of every slot is in place
+        self.count[rows] = published
+        return n
+
+    def _depth_slow(self, ticks: list) -> tuple:
+        """Mixed-mode batches: ticks without depth (ltp/quote) get zeroed levels."""
+        n, depth = len(ticks), self.depth
+        bid = np.zeros((n, depth), np.float64)
+        bid_qty = np.zeros((n, depth), np.int32)
+        ask = np.zeros((n, depth), np.float64)
+        ask_qty = np.zeros((n, depth), np.int32)
+        for i, t in enumerate(ticks):
+            book = t.get("depth")
+            if not book:
+                continue
+            for j, level in enumerate(book["buy"][:depth]):
+                bid[i, j] = level["price"]
+                bid_qty[i, j] = level["quantity"]
+            for j, level in enumerate(book["sell"][:depth]):
+                ask[i, j] = level["price"]
+                ask_qty[i, j] = level["quantity"]
+        return bid, bid_qty, ask, ask_qty
+
+    # ---- readers (any thread) ----
+    def latest(self, field: str = "ltp", tokens=None) -> np.ndarray:
+        """Most recent value of field for every token (or the given tokens), in row order."""
+        rows = np.arange(len(self.rows)) if tokens is None else self._rows(tokens)
+        count = self.count[rows]
+        values = self.data[field][rows, (count - 1) % self.capacity]
+        if np.issubdtype(values.dtype, np.floating):
+            values[count == 0] = np.nan
+        return values
+
+    def last(self, token: int, n: int = None, fields=None) -> dict:
+        """Up to n most recent ticks of one token, oldest first, as {field: array}."""
+        row = self.rows[token]
+        before = int(self.count[row])
+        n = min(n or self.capacity, before, self.capacity)
+        idx = np.arange(before - n, before) % self.capacity
+        out = {f: self.data[f][row, idx] for f in (fields or self.data)}
+        # Slots overwritten while copying, and the one being written now
+        # (count moves only after all its fields), are dropped from the front
+        lost = max(int(self.count[row]) - self.capacity + 1 - (before - n), 0)
+        return {f: a[lost:] for f, a in out.items()} if lost else out
+
+    def window(self, field: str = "ltp", seconds: float = 300, tokens=None, now: float = None):
+        """
+        Field values of the last `seconds` for all tokens (or the given ones)
+        as (values, valid): two [tokens, capacity] arrays in slot order (sort
+        by the "ts" field when order matters), where valid marks slots that
+        hold a tick inside the window. Copies whole rows, so it is a few
+        memcpy-speed passes rather than a per-tick gather.
+        """
+        rows = self._rows(tokens)
+        cap = self.capacity
+        before = self.count[rows]
+        values = np.array(self.data[field][rows], copy=isinstance(rows, slice))
+        ts = np.array(self.data["ts"][rows], copy=isinstance(rows, slice))
+        after = self.count[rows]
+        now = time.time() if now is None else now
+        valid = ts >= now - seconds
+        valid &= np.arange(cap) < before[:, None]  # never-written slots
+        for i in np.flatnonzero(after != before):
+            # Writer lapped this row while copying: drop the rewritten slots
+            first, n = before[i] % cap, min(after[i] - before[i], cap)
+            valid[i, first:first + n] = False
+            valid[i, :max(first + n - cap, 0)] = False
+        # The slot being written now: _write fills it field by field and only
+        # then publishes count, so its ts and value may come from different ticks
+        lapped = np.flatnonzero(after >= cap)
+        valid[lapped, after[lapped] % cap] = False
+        return values, valid
+
+    def _rows(self, tokens):
+        if tokens is None:
+            return slice(0, len(self.rows))
+        return [self.rows[t] for t in tokens]
+
+
+if __name__ == "__main__":
+    import datetime as dt
+
+    n_tokens, batches = 3000, 50
+    ring = TickRing(range(1, n_tokens + 1))
+    now = dt.datetime.now()
+    level = {"price": 100.0, "quantity": 10, "orders": 1}
+    ticks = [{
+        "instrument_token": tok, "last_price": 100.0 + tok * 0.05, "last_traded_quantity": 1,
+        "volume_traded": 1000, "oi": 0, "total_buy_quantity": 5, "total_sell_quantity": 7,
+        "exchange_timestamp": now, "depth": {"buy": [level] * 5, "sell": [level] * 5},
+    } for tok in range(1, n_tokens + 1)]
+    t0 = time.perf_counter()
+    for _ in range(batches):
+        ring.write(ticks)
+    per_batch = (time.perf_counter() - t0) / batches
+    print(f"full-mode batch of {n_tokens} ticks: {per_batch * 1e3:.2f} ms "
+          f"({per_batch / n_tokens * 1e6:.2f} us/tick)")
+    t0 = time.perf_counter()
+    ltp, valid = ring.window("ltp", 300)
+    print(f"5-minute ltp window for {n_tokens} tokens: {(time.perf_counter() - t0) * 1e3:.2f} ms, "
+          f"{int(valid.sum())} ticks")
@@ -0,0 +1,268 @@
+# ticker_shards.py
+"""
+Sharded KiteTicker subscriptions: thousands of tokens over several
+websocket connections, merged back into one tick stream.
+
+Kite caps instruments per connection (3000) and connections per API key
+(3). ShardedTicker spreads subscribed tokens evenly across `connections`
+shards. Each shard is one KiteTicker with its own TickDecoder, running in
+its own process by default, so frame decoding uses several cores (several
+KiteTickers in one process would also share twisted's single reactor).
+
+    - subscribe/unsubscribe only send the delta to the shards involved;
+      when shards drift apart by more than `slack` tokens, only the
+      surplus of the heavy shards is moved to the light ones
+    - each shard connects staggered, subscribes its own tokens once, and on
+      reconnect KiteTicker resubscribes just that connection's tokens, so a
+      dropped socket never triggers a resubscribe of everything
+    - decoded arrays from all shards go through one queue to a single
+      dispatcher thread, so on_ticks_array sees one merged, single-threaded
+      stream (safe for TickRing / BarAggregator)
+
+Usage:
+    shards = ShardedTicker(API_KEY, ACCESS_TOKEN, on_ticks_array=handle)
+    shards.subscribe(tokens, mode="full")
+    shards.start()
+"""
+import time
+import queue
+import threading
+import multiprocessing as mp
+from tick_decoder import attach
+
+MAX_PER_CONNECTION = 3000
+MAX_CONNECTIONS = 3
+
+
+def connect_ticker(kws):
+    """KiteTicker.connect with auto-reconnect; the kwarg name varies across 4.x builds."""
+    for kwargs in ({"reconnect": True, "reconnect_interval": 5, "reconnect_tries": 50},
+                   {"reconnect": True, "reconnect_interval": 5, "reconnect_max_tries": 50},
+                   {}):
+        try:
+            return kws.connect(threaded=True, **kwargs)
+        except TypeError:
+            continue
+
+
+def _run_shard(shard_id: int, api_key: str, access_token: str, factory, factory_kwargs: dict,
+               commands, output, stagger: float):
+    """One connection: owns a ticker, applies (un)subscribe commands, emits decoded arrays."""
+    if factory is None:
+        from kiteconnect import KiteTicker as factory
+    kws = factory(api_key, access_token, **(factory_kwargs or {}))
+    modes = {}       # token -> mode, what this shard should carry
+    pending = set()  # tokens not yet sent on the current connection
+    lock = threading.Lock()
+
+    def send(ws, tokens):
+        by_mode = {}
+        for t in tokens:
+            by_mode.setdefault(modes[t], []).append(t)
+        for mode, group in by_mode.items():
+            ws.subscribe(group)
+            ws.set_mode(mode, group)
+
+    def on_connect(ws, response):
+        # First connect sends everything; after a reconnect KiteTicker has already
+        # resubscribed its own tokens, so only what changed while offline is sent
+        with lock:
+            todo = [t for t in pending if t in modes]
+            pending.clear()
+            if todo:
+                send(ws, todo)
+        output.put(("connect", shard_id, len(todo)))
+
+    kws.on_connect = on_connect
+    kws.on_close = lambda ws, code, reason: output.put(("close", shard_id, (code, reason)))
+    kws.on_error = lambda ws, code, reason: output.put(("error", shard_id, (code, reason)))
+    kws.on_reconnect = lambda ws, attempts: output.put(("reconnect", shard_id, attempts))
+    kws.on_noreconnect = lambda ws: output.put(("noreconnect", shard_id, None))
+    attach(kws, lambda ws, ticks: output.put(("ticks", shard_id, ticks.copy())))
+
+    started = False
+    while True:
+        cmd, tokens, mode = commands.get()
+        if cmd == "stop":
+            break
+        with lock:
+            if cmd == "subscribe":
+                for t in tokens:
+                    modes[t] = mode
+                fresh = tokens
+            else:
+                for t in tokens:
+                    modes.pop(t, None)
+                    pending.discard(t)
+                fresh = []
+            if kws.is_connected():
+                try:
+                    if cmd == "subscribe":
+                        send(kws, fresh)
+                    else:
+                        kws.unsubscribe(tokens)
+                    fresh = []
+                except Exception as e:
+                    output.put(("error", shard_id, (None, str(e))))
+            elif cmd == "unsubscribe":
+                # Offline: keep KiteTicker's reconnect resubscribe from bringing them back
+                for t in tokens:
+                    getattr(kws, "subscribed_tokens", {}).pop(t, None)
+            pending.update(fresh)
+        if not started and modes:
+            time.sleep(stagger * shard_id)  # spread the initial handshakes
+            connect_ticker(kws)
+            started = True
+    kws.close()
+    output.put(("stopped", shard_id, None))
+
+
+class ShardedTicker:
+    def __init__(self, api_key: str, access_token: str, on_ticks_array=None, on_event=None,
+                 connections: int = MAX_CONNECTIONS, max_per_connection: int = MAX_PER_CONNECTION,
+                 processes: bool = True, slack: int = 100, stagger: float = 1.0,
+                 factory=None, factory_kwargs: dict = None):
+        """
+        on_ticks_array(sharded_ticker, ticks) gets every shard's decoded ticks;
+        on_event(kind, shard_id, detail) gets connect/close/error/reconnect.
+        factory(api_key, access_token, **factory_kwargs) builds each shard's
+        ticker (KiteTicker by default; ReplayTicker for offline runs).
+        """
+        self.api_key = api_key
+        self.access_token = access_token
+        self.on_ticks_array = on_ticks_array
+        self.on_event = on_event
+        self.connections = connections
+        self.max_per_connection = max_per_connection
+        self.processes = processes
+        self.slack = slack
+        self.stagger = stagger
+        self.factory = factory
+        self.factory_kwargs = factory_kwargs
+        self.shard_of = {}  # token -> shard
+        self.modes = {}     # token -> mode
+        self.load = [0] * connections
+        self.stats = {"ticks": 0, "messages": 0, "moves": 0, "per_shard": [0] * connections}
+        self._lock = threading.Lock()
+        ctx = mp.get_context()
+        make_queue = ctx.Queue if processes else queue.Queue
+        self._output = make_queue()
+        self._commands = [make_queue() for _ in range(connections)]
+        self._workers = []
+        self._dispatcher = None
+
+    # ---- subscriptions ----
+    def subscribe(self, tokens, mode: str = "quote"):
+        """Adds tokens (or changes their mode), filling the lightest shards first."""
+        tokens = [int(t) for t in tokens]
+        with self._lock:
+            new = [t for t in tokens if t not in self.shard_of]
+            if len(self.shard_of) + len(new) > self.connections * self.max_per_connection:
+                raise ValueError(f"{len(self.shard_of) + len(new)} tokens exceed "
+                                 f"{self.connections} x {self.max_per_connection}")
+            per_shard = {}
+            for t in tokens:
+                shard = self.shard_of.get(t)
+                if shard is None:
+                    shard = min(range(self.connections), key=self.load.__getitem__)
+                    self.shard_of[t] = shard
+                    self.load[shard] += 1
+                self.modes[t] = mode
+                per_shard.setdefault(shard, []).append(t)
+            for shard, group in per_shard.items():
+                self._commands[shard].put(("subscribe", group, mode))
+
+    def set_mode(self, mode: str, tokens):
+        self.subscribe(tokens, mode)
+
+    def unsubscribe(self, tokens):
+        with self._lock:
+            per_shard = {}
+            for t in map(int, tokens):
+                shard = self.shard_of.pop(t, None)
+                if shard is None:
+                    continue
+                self.modes.pop(t, None)
+                self.load[shard] -= 1
+                per_shard.setdefault(shard, []).append(t)
+            for shard, group in per_shard.items():
+                self._commands[shard].put(("unsubscribe", group, None))
+            self._rebalance()
+
+    def _rebalance(self):
+        """If shards are more than `slack` apart, moves the fewest tokens to even them out."""
+        if max(self.load) - min(self.load) <= self.slack:
+            return
+        n, total = self.connections, len(self.shard_of)
+        order = sorted(range(n), key=self.load.__getitem__, reverse=True)
+        target = [0] * n
+        for rank, shard in enumerate(order):  # the remainder stays on the heaviest shards
+            target[shard] = total // n + (1 if rank < total % n else 0)
+        surplus = {s: self.load[s] - target[s] for s in range(n) if self.load[s] > target[s]}
+        movable = {s: [t for t, sh in self.shard_of.items() if sh == s][:k] for s, k in surplus.items()}
+        for light in (s for s in range(n) if self.load[s] < target[s]):
+            need = target[light] - self.load[light]
+            for heavy, tokens in movable.items():
+                if not need:
+                    break
+                moving, movable[heavy] = tokens[:need], tokens[need:]
+                if not moving:
+                    continue
+                by_mode = {}
+                for t in moving:
+                    self.shard_of[t] = light
+                    by_mode.setdefault(self.modes[t], []).append(t)
+                self.load[heavy] -= len(moving)
+                self.load[light] += len(moving)
+                self.stats["moves"] += len(moving)
+                need -= len(moving)
+                self._commands[heavy].put(("unsubscribe", moving, None))
+                for mode, group in by_mode.items():
+                    self._commands[light].put(("subscribe", group, mode))
+
+    def shards(self) -> list:
+        """Tokens per shard."""
+        with self._lock:
+            out = [[] for _ in range(self.connections)]
+            for t, s in self.shard_of.items():
+                out[s].append(t)
+            return out
+
+    # ---- lifecycle ----
+    def start(self):
+        ctx = mp.get_context()
+        for shard in range(self.connections):
+            args = (shard, self.api_key, self.access_token, self.factory, self.factory_kwargs,
+                    self._commands[shard], self._output, self.stagger)
+            if self.processes:
+                worker = ctx.Process(target=_run_shard, args=args, name=f"ticker-shard-{shard}", daemon=True)
+            else:
+                worker = threading.Thread(target=_run_shard, args=args, name=f"ticker-shard-{shard}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        self._dispatcher = threading.Thread(target=self._dispatch, name="ticker-merge", daemon=True)
+        self._dispatcher.start()
+
+    def _dispatch(self):
+        stopped = 0
+        while stopped < len(self._workers):
+            kind, shard, detail = self._output.get()
+            if kind == "ticks":
+                self.stats["ticks"] += len(detail)
+                self.stats["messages"] += 1
+                self.stats["per_shard"][shard] += len(detail)
+                if self.on_ticks_array:
+                    self.on_ticks_array(self, detail)
+                continue
+            if kind == "stopped":
+                stopped += 1
+            if self.on_event:
+                self.on_event(kind, shard, detail)
+
+    def close(self, timeout: float = 10.0):
+        for q in self._commands:
+            q.put(("stop", None, None))
+        for worker in self._workers:
+            worker.join(timeout)
+        if self._dispatcher:
+            self._dispatcher.join(timeout)
@@ -0,0 +1,99 @@
+# bench_decoder.py
+"""
+Benchmarks the NumPy tick decoder against the stock KiteTicker parser.
+
+Frames come from a recorded tick-journal day (packets sharing a receive
+time are re-framed into their original websocket message), or are
+synthesized as full-mode frames when no day is given. The stock parser is
+KiteTicker._parse_binary when kiteconnect is installed, otherwise its
+port in kite_packets.parse_message.
+
+Reported per tick: decode time, and Python memory blocks still allocated
+after decoding a frame while its result is held (what the on_ticks
+consumer keeps alive and the GC later has to walk).
+
+Usage:
+    python bench/bench_decoder.py                     # synthetic 3000-token full-mode frames
+    python bench/bench_decoder.py --day 2025-04-02    # recorded frames from data/ticks
+"""
+import os
+import sys
+import time
+import struct
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+from kite_packets import build_message, parse_message
+from tick_decoder import TickDecoder
+import tick_journal
+
+
+def synthetic_frames(tokens: int, frames: int, per_frame: int) -> list:
+    ts = int(time.time())
+    rng = np.random.default_rng(7)
+    out = []
+    for f in range(frames):
+        packets = []
+        for i in range(per_frame):
+            token = ((f * per_frame + i) % tokens + 1) * 256 + 1  # NSE segment
+            ltp = int(rng.integers(10_000, 500_000))
+            quote = struct.pack(">IIIIIIIIIII", token, ltp, 10, ltp, 100_000, 500, 600,
+                                ltp, ltp + 100, ltp - 100, ltp - 50)
+            depth = b"".join(struct.pack(">IIH2x", 10 + k, ltp - 5 * k, 1 + k) for k in range(10))
+            packets.append(quote + struct.pack(">IIIII", ts, 0, 0, 0, ts) + depth)
+        out.append(build_message(packets))
+    return out
+
+
+def recorded_frames(day: str) -> list:
+    records = tick_journal.read_day(day)
+    recv_ns = records["recv_ns"]
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(recv_ns)) + 1, [len(records)]))
+    frames = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        frames.append(build_message([bytes(r["packet"])[:int(r["length"])] for r in records[lo:hi]]))
+    return frames
+
+
+def stock_parser():
+    try:
+        from kiteconnect import KiteTicker
+        kws = KiteTicker("bench", "bench")
+        return "KiteTicker._parse_binary", kws._parse_binary
+    except ImportError:
+        return "kite_packets.parse_message (KiteTicker port)", parse_message
+
+
+def measure(label: str, parse, frames: list, ticks_of) -> None:
+    # Time
+    t0 = time.perf_counter()
+    ticks = 0
+    for frame in frames:
+        ticks += ticks_of(parse(frame))
+    elapsed = time.perf_counter() - t0
+    # Blocks alive per frame while the result is held
+    blocks = []
+    for frame in frames[:50]:
+        before = sys.getallocatedblocks()
+        result = parse(frame)
+        blocks.append((sys.getallocatedblocks() - before) / max(ticks_of(result), 1))
+        del result
+    print(f"{label:48s} {elapsed / ticks * 1e6:7.2f} us/tick  {ticks / elapsed:12,.0f} ticks/s  "
+          f"{np.mean(blocks):6.1f} blocks/tick")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kite tick decoder benchmark")
+    parser.add_argument("--day", help="tick-journal day (YYYY-MM-DD) to use as input")
+    parser.add_argument("--tokens", type=int, default=3000)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--per-frame", type=int, default=250)
+    args = parser.parse_args()
+
+    frames = recorded_frames(args.day) if args.day else synthetic_frames(args.tokens, args.frames, args.per_frame)
+    print(f"{len(frames)} frames, {sum(len(f) for f in frames) / 1e6:.1f} MB")
+    label, stock = stock_parser()
+    measure(label, stock, frames, len)
+    decoder = TickDecoder()
+    measure("TickDecoder.decode (NumPy)", decoder.decode, frames, len)
@@ -1,6 +1,9 @@
-import os, datetime as dt
+import os, sys, datetime as dt
 from kiteconnect import KiteConnect
 from dotenv import load_dotenv
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from candle_store import CandleStore, from_kite
+from instruments import load_master
 
 load_dotenv()
 
@@ -11,9 +14,8 @@ with open(".kite_access_token") as f:
 kite = KiteConnect(api_key=API_KEY)
 kite.set_access_token(ACCESS_TOKEN)
 
-instruments = kite.instruments("NSE")
-infy = next(i for i in instruments if i["tradingsymbol"] == "INFY" and i["segment"] == "NSE")
-token = infy["instrument_token"]
+# Daily-cached instrument master instead of downloading kite.instruments() every run
+token = load_master("kite", kite).token("NSE", "INFY")
 
 to_dt = dt.datetime.now()
 from_dt = to_dt - dt.timedelta(days=5)
@@ -29,3 +31,7 @@ candles = kite.historical_data(
 
 for c in candles[:5]:
     print(c)
+
+# Keep them in the shared candle store instead of throwing them away
+rows = CandleStore().append("NSE:INFY", "5minute", from_kite(candles))
+print(f"Stored; NSE:INFY 5minute now has {rows} bars")
@@ -1,6 +1,10 @@
 import os
+import sys
 from kiteconnect import KiteConnect
 from dotenv import load_dotenv
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from quote_cache import kite_quotes
+from metrics import REGISTRY, instrument_kite
 
 load_dotenv()
 
@@ -8,11 +12,13 @@ API_KEY = os.getenv("KITE_API_KEY")
 with open(".kite_access_token") as f:
     ACCESS_TOKEN = f.read().strip()
 
-kite = KiteConnect(api_key=API_KEY)
+kite = instrument_kite(KiteConnect(api_key=API_KEY))
 kite.set_access_token(ACCESS_TOKEN)
 
 symbols = ["NSE:INFY", "NSE:TCS", "NSE:RELIANCE", "NSE:HDFCBANK"]
-ltp_all = kite.ltp(symbols)
+quotes = kite_quotes(kite)  # up to 1000 symbols per request, cached for 250 ms
+ltp_all = quotes.get(symbols)
 
 for s, v in ltp_all.items():
     print(s, v["last_price"])
+print(REGISTRY.report())
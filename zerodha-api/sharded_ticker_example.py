@@ -0,0 +1,56 @@
+# sharded_ticker_example.py (for kiteconnect==4.2.0)
+# Streams every NSE equity over up to 3 websocket connections (one process each)
+# and handles the merged, already-decoded tick stream in this process.
+import os
+import sys
+import time
+from kiteconnect import KiteConnect
+from dotenv import load_dotenv
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from instruments import load_master
+from tick_ring import TickRing
+from ticker_shards import ShardedTicker
+
+load_dotenv()
+
+API_KEY = os.getenv("KITE_API_KEY")
+ACCESS_TOKEN = os.getenv("KITE_ACCESS_TOKEN")  # optional; fallback to file
+if not ACCESS_TOKEN and os.path.exists(".kite_access_token"):
+    with open(".kite_access_token") as f:
+        ACCESS_TOKEN = f.read().strip()
+
+if not API_KEY or not ACCESS_TOKEN:
+    raise RuntimeError("Missing KITE_API_KEY or access token. Run the auth helper first.")
+
+last_report = [time.time()]
+
+def on_ticks_array(shards, ticks):
+    # One merged stream from all shards, always on the same thread
+    ring.write_array(ticks)
+    now = time.time()
+    if now - last_report[0] >= 5:
+        last_report[0] = now
+        print(f"ticks {shards.stats['ticks']}  per shard {shards.stats['per_shard']}")
+
+def on_event(kind, shard, detail):
+    print(f"Shard {shard}: {kind} {detail if detail is not None else ''}")
+
+if __name__ == "__main__":  # shard processes re-import this file on Windows
+    kite = KiteConnect(api_key=API_KEY)
+    kite.set_access_token(ACCESS_TOKEN)
+
+    master = load_master("kite", kite)
+    tokens = master.tokens(exchange="NSE", instrument_type="EQ").tolist()
+    print(f"Subscribing {len(tokens)} NSE equities")
+
+    ring = TickRing(tokens, capacity=256, max_tokens=len(tokens) + 100)
+    shards = ShardedTicker(API_KEY, ACCESS_TOKEN, on_ticks_array=on_ticks_array, on_event=on_event)
+    shards.subscribe(tokens, mode="full")
+    print("Tokens per shard:", [len(s) for s in shards.shards()])
+    shards.start()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        shards.close()
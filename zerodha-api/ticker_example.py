@@ -1,8 +1,19 @@
 # ticker_example.py (for kiteconnect==4.2.0)
 import os
+import sys
 import time
 from kiteconnect import KiteTicker, KiteConnect
 from dotenv import load_dotenv
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from instruments import load_master
+from tick_ring import TickRing
+from bar_aggregator import BarAggregator
+from tick_journal import TickJournal
+from replay_ticker import ReplayTicker
+from tick_decoder import attach
+from market_snapshot import SnapshotWriter, DEFAULT_NAME
+from order_book import kite_sync
+from metrics import REGISTRY, instrument_kite
 
 load_dotenv()
 
@@ -15,25 +26,60 @@ if not ACCESS_TOKEN and os.path.exists(".kite_access_token"):
 if not API_KEY or not ACCESS_TOKEN:
     raise RuntimeError("Missing KITE_API_KEY or access token. Run the auth helper first.")
 
-kite = KiteConnect(api_key=API_KEY)
+kite = instrument_kite(KiteConnect(api_key=API_KEY))  # per-call latency / errors
 kite.set_access_token(ACCESS_TOKEN)
 
-# Map symbols -> instrument tokens (cache instruments in real apps)
-nse_instruments = kite.instruments("NSE")
-sym_to_token = {i["tradingsymbol"]: i["instrument_token"] for i in nse_instruments}
+# Map symbols -> instrument tokens via the daily-cached instrument master
+master = load_master("kite", kite)
 
 watchlist = ["INFY", "TCS"]  # edit your symbols here
-missing = [s for s in watchlist if s not in sym_to_token]
+missing = [s for s in watchlist if master.lookup("NSE", s) is None]
 if missing:
     raise KeyError(f"Symbols not found on NSE: {missing}")
 
-tokens = [sym_to_token[s] for s in watchlist]
-
-kws = KiteTicker(API_KEY, ACCESS_TOKEN)
-
-def on_ticks(ws, ticks):
-    for t in ticks:
-        print("Tick:", t.get("instrument_token"), t.get("last_price"))
+tokens = [master.token("NSE", s) for s in watchlist]
+
+# KITE_REPLAY_DAY=YYYY-MM-DD replays that day from data/ticks instead of going live
+# (KITE_REPLAY_SPEED: 1 = real time, N = N times faster, 0 = as fast as possible)
+REPLAY_DAY = os.getenv("KITE_REPLAY_DAY")
+if REPLAY_DAY:
+    kws = ReplayTicker(day=REPLAY_DAY, speed=float(os.getenv("KITE_REPLAY_SPEED", "1")) or None)
+else:
+    kws = KiteTicker(API_KEY, ACCESS_TOKEN)
+    REGISTRY.serve(int(os.getenv("METRICS_PORT", "9108")))  # Prometheus: http://127.0.0.1:9108/metrics
+ring = TickRing(tokens)  # latest ticks per instrument, queryable from any thread
+# Latest quote per instrument in shared memory; other processes read it with SnapshotReader().
+# A replay publishes into its own segment so it never overwrites the live feed's quotes.
+snapshot = SnapshotWriter(f"kite_replay_{REPLAY_DAY}" if REPLAY_DAY else DEFAULT_NAME)
+
+def on_bar(interval, closed):
+    if interval != "second":
+        print(f"{interval} bars closed:", dict(zip(closed["token"].tolist(), closed["close"].tolist())))
+
+# Live 1s/1m/5m/15m bars; minute bars and up are appended to data/candles
+bars = BarAggregator(symbols={master.token("NSE", s): f"NSE:{s}" for s in watchlist}, on_bar=on_bar)
+bars.start()
+
+# Raw packets to data/ticks/<day>.ktj; on_message only queues, a thread writes
+journal = None if REPLAY_DAY else TickJournal(compress=True)
+
+def on_ticks_array(ws, ticks):
+    # Packets arrive decoded into one NumPy array (no per-tick dicts);
+    # keep the websocket thread cheap: store the batch, print one line
+    ring.write_array(ticks)
+    bars.update_array(ticks)
+    snapshot.write_array(ticks)
+    print("Ticks:", len(ticks), dict(zip(watchlist, ring.latest("ltp"))))
+
+# Order changes arrive as websocket postbacks; the slow poll only catches anything missed.
+# A replay has no live orders, so it does not poll the account's order book.
+def on_order_events(events):
+    for e in events:
+        print("Order", e.kind, e.orderid, e.order.get("tradingsymbol"))
+
+orders = None if REPLAY_DAY else kite_sync(kite, interval=30, on_events=on_order_events)
+if orders:
+    orders.start()
 
 def on_connect(ws, response):
     print("Connected. Subscribing…")
@@ -52,8 +98,12 @@ def on_reconnect(ws, attempts_count):
 def on_noreconnect(ws):
     print("Reconnection failed; stopping.")
 
-kws.on_ticks = on_ticks
+if journal:
+    kws.on_message = journal.on_message
+attach(kws, on_ticks_array)  # chains the journal; KiteTicker's own dict parsing is skipped
 kws.on_connect = on_connect
+if orders:
+    kws.on_order_update = orders.on_order_update
 kws.on_close = on_close
 kws.on_error = on_error
 kws.on_reconnect = on_reconnect
@@ -89,3 +139,10 @@ try:
         time.sleep(1)
 except KeyboardInterrupt:
     kws.close()
+    bars.close()
+    if orders:
+        orders.close()
+    snapshot.close()
+    if journal:
+        journal.close()
+    print(REGISTRY.report())